@@ -0,0 +1,231 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Iterator, Mapping, MutableMapping, MutableSequence, Optional, Sequence
+from . import compiler, parser, processor, stream
+
+_Rule = Callable[..., Any]
+First = Optional[frozenset[str]]
+
+
+@dataclass(frozen=True)
+class Hazard:
+    class Kind(Enum):
+        LEFT_RECURSION = 'left recursion'
+        NULLABLE_LOOP = 'nullable loop'
+        POSSIBLY_NULLABLE_LOOP = 'possibly nullable loop'
+        SHARED_PREFIX = 'shared prefix'
+        FIRST_CONFLICT = 'first conflict'
+        EXPONENTIAL_BACKTRACKING = 'exponential backtracking'
+
+    kind: Kind
+    rule_name: str
+    msg: str
+
+    def __str__(self) -> str:
+        return f'{self.rule_name}: {self.kind.value}: {self.msg}'
+
+
+@dataclass(frozen=True)
+class Analysis:
+    nullable: frozenset[str]
+    unknown: frozenset[str]
+    first: Mapping[str, First]
+    hazards: Sequence[Hazard] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return '\n'.join(str(hazard) for hazard in self.hazards)
+
+    def kinds(self, rule_name: str) -> frozenset[Hazard.Kind]:
+        return frozenset(hazard.kind for hazard in self.hazards if hazard.rule_name == rule_name)
+
+
+def _transparent(rule: _Rule) -> bool:
+    return isinstance(rule, (processor.Cut, processor.MultipleResultCombiner, processor.OptionalResultCombiner, compiler.CompiledRule))
+
+
+def _name(rule: _Rule) -> str:
+    name: Optional[str] = getattr(rule, '__qualname__', None)
+    return repr(rule) if name is None else name
+
+
+def _nodes(rule: _Rule) -> Iterator[_Rule]:
+    rules: MutableSequence[_Rule] = [rule]
+    while rules:
+        rule = rules.pop()
+        yield rule
+        rules.extend(reversed(processor.children(rule)))
+
+
+@dataclass
+class _Analyzer:
+    rules: Mapping[str, _Rule]
+    nullable: set[str] = field(default_factory=set)
+    unknown: set[str] = field(default_factory=set)
+    first: MutableMapping[str, First] = field(default_factory=dict)
+
+    def is_nullable(self, rule: _Rule) -> Optional[bool]:
+        if isinstance(rule, processor.Ref):
+            if rule.rule_name in self.nullable:
+                return True
+            if rule.rule_name in self.unknown or rule.rule_name not in self.rules:
+                return None
+            return False
+        if isinstance(rule, processor.Or):
+            alts = [self.is_nullable(alt) for alt in rule]
+            if any(alts):
+                return True
+            return None if None in alts else False
+        if isinstance(rule, processor.And):
+            elements = [self.is_nullable(element) for element in rule]
+            if False in elements:
+                return False
+            return None if None in elements else True
+        if isinstance(rule, (processor.ZeroOrMore, processor.ZeroOrOne, stream.UntilEmpty)):
+            return True
+        if isinstance(rule, (processor.OneOrMore, parser.Pratt)) or _transparent(rule):
+            return self.is_nullable(rule.rule)
+        if isinstance(rule, parser.Terminal) or parser.first_set(rule) is not None:
+            return False
+        return None
+
+    def first_set(self, rule: _Rule) -> First:
+        if isinstance(rule, processor.Ref):
+            return self.first.get(rule.rule_name)
+        if isinstance(rule, processor.Or):
+            return self.union(self.first_set(alt) for alt in rule)
+        if isinstance(rule, processor.And):
+            return self.union(self.first_set(element) for element in self.leading(rule))
+        if isinstance(rule, parser.Pratt):
+            return self.union(iter([self.first_set(rule.rule), frozenset(rule.prefix)]))
+        if isinstance(rule, (processor.UnaryMultipleResultRule, processor.UnaryOptionalResultRule)) or _transparent(rule):
+            return self.first_set(rule.rule)
+        return parser.first_set(rule)
+
+    @staticmethod
+    def union(firsts: Iterator[First]) -> First:
+        result = frozenset[str]()
+        for first in firsts:
+            if first is None:
+                return None
+            result |= first
+        return result
+
+    def leading(self, rule: processor.And) -> Sequence[_Rule]:
+        elements: MutableSequence[_Rule] = []
+        for element in rule:
+            elements.append(element)
+            if not self.is_nullable(element):
+                break
+        return elements
+
+    def left_refs(self, rule: _Rule) -> Iterator[str]:
+        if isinstance(rule, processor.Ref):
+            yield rule.rule_name
+        elif isinstance(rule, processor.Or):
+            for alt in rule:
+                yield from self.left_refs(alt)
+        elif isinstance(rule, processor.And):
+            for element in self.leading(rule):
+                yield from self.left_refs(element)
+        elif isinstance(rule, (processor.UnaryMultipleResultRule, processor.UnaryOptionalResultRule, parser.Pratt)) or _transparent(rule):
+            yield from self.left_refs(rule.rule)
+
+    def solve(self) -> None:
+        changed = True
+        while changed:
+            changed = False
+            for rule_name, rule in self.rules.items():
+                if rule_name in self.nullable:
+                    continue
+                nullable = self.is_nullable(rule)
+                if nullable:
+                    self.nullable.add(rule_name)
+                    self.unknown.discard(rule_name)
+                    changed = True
+                elif nullable is None and rule_name not in self.unknown:
+                    self.unknown.add(rule_name)
+                    changed = True
+        for rule_name in self.rules:
+            self.first[rule_name] = frozenset()
+        changed = True
+        while changed:
+            changed = False
+            for rule_name, rule in self.rules.items():
+                first = self.first_set(rule)
+                if first != self.first[rule_name]:
+                    self.first[rule_name] = first
+                    changed = True
+
+    def reachable(self, rule_name: str, edges: Callable[[str], Iterator[str]]) -> Optional[Sequence[str]]:
+        paths: MutableSequence[Sequence[str]] = [[rule_name]]
+        visited: set[str] = set()
+        while paths:
+            path = paths.pop()
+            for next_rule_name in edges(path[-1]):
+                if next_rule_name == rule_name:
+                    return list(path) + [rule_name]
+                if next_rule_name in self.rules and next_rule_name not in visited:
+                    visited.add(next_rule_name)
+                    paths.append(list(path) + [next_rule_name])
+        return None
+
+    def refs(self, rule_name: str) -> Iterator[str]:
+        for node in _nodes(self.rules[rule_name]):
+            if isinstance(node, processor.Ref):
+                yield node.rule_name
+
+    def hazards(self, packrat: bool) -> Iterator[Hazard]:
+        for rule_name, rule in self.rules.items():
+            cycle = self.reachable(
+                rule_name, lambda name: self.left_refs(self.rules[name]))
+            if cycle is not None:
+                yield Hazard(Hazard.Kind.LEFT_RECURSION, rule_name,
+                             f'{" -> ".join(cycle)} recurses without consuming input')
+            recursive = self.reachable(rule_name, self.refs) is not None
+            for node in _nodes(rule):
+                if isinstance(node, (processor.ZeroOrMore, processor.OneOrMore, stream.UntilEmpty)):
+                    nullable = self.is_nullable(node.rule)
+                    if nullable:
+                        yield Hazard(Hazard.Kind.NULLABLE_LOOP, rule_name,
+                                     f'{_name(node)} repeats a rule that can match empty input')
+                    elif nullable is None:
+                        yield Hazard(Hazard.Kind.POSSIBLY_NULLABLE_LOOP, rule_name,
+                                     f'{_name(node)} repeats an opaque rule that may match empty input')
+                if isinstance(node, processor.Or):
+                    yield from self.alternative_hazards(rule_name, node, recursive and not packrat)
+
+    def alternative_hazards(self, rule_name: str, rule: processor.Or, exponential: bool) -> Iterator[Hazard]:
+        alts = list(rule)
+        for i, lhs in enumerate(alts):
+            for j in range(i+1, len(alts)):
+                rhs = alts[j]
+                prefix = self.prefix(lhs)
+                if prefix is not None and prefix == self.prefix(rhs):
+                    yield Hazard(Hazard.Kind.EXPONENTIAL_BACKTRACKING if exponential else Hazard.Kind.SHARED_PREFIX, rule_name,
+                                 f'alternatives {_name(lhs)} and {_name(rhs)} both start with {_name(prefix)}')
+                    continue
+                lhs_first = self.first_set(lhs)
+                rhs_first = self.first_set(rhs)
+                if lhs_first is not None and rhs_first is not None and lhs_first & rhs_first:
+                    yield Hazard(Hazard.Kind.EXPONENTIAL_BACKTRACKING if exponential else Hazard.Kind.FIRST_CONFLICT, rule_name,
+                                 f'alternatives {_name(lhs)} and {_name(rhs)} can both start with {sorted(lhs_first & rhs_first)}')
+
+    @staticmethod
+    def prefix(rule: _Rule) -> Optional[_Rule]:
+        while _transparent(rule):
+            rule = rule.rule
+        if isinstance(rule, processor.And):
+            return rule.rules[0] if rule.rules else None
+        return None
+
+
+def analyze(scope: processor.Scope[Any, Any]) -> Analysis:
+    analyzer = _Analyzer(dict(scope))
+    analyzer.solve()
+    packrat = isinstance(scope, processor.Processor) and scope.packrat
+    return Analysis(
+        frozenset(analyzer.nullable),
+        frozenset(analyzer.unknown),
+        dict(analyzer.first),
+        list(analyzer.hazards(packrat)),
+    )
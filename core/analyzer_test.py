@@ -0,0 +1,134 @@
+from typing import Sequence
+import unittest
+from . import analyzer, lexer, parser, processor
+
+_Kind = analyzer.Hazard.Kind
+_Rule = parser.Rule[int]
+_Ref = parser.Ref[int]
+_Or = parser.Or[int]
+_And = parser.And[int]
+
+
+@parser.first('a')
+def _a(scope: parser.Scope[int], state: lexer.TokenStream) -> parser.StateAndResult[int]:
+    return parser.consume_token(state, 'a'), 1
+
+
+@parser.first('b')
+def _b(scope: parser.Scope[int], state: lexer.TokenStream) -> parser.StateAndResult[int]:
+    return parser.consume_token(state, 'b'), 2
+
+
+class _Sum(parser.ResultReducer[int]):
+    def reduce(self, results: Sequence[int]) -> int:
+        return sum(results)
+
+
+def _analyze(**rules: _Rule) -> analyzer.Analysis:
+    return analyzer.analyze(parser.Scope[int](rules))
+
+
+class AnalyzeTest(unittest.TestCase):
+    def test_nullable(self):
+        analysis = _analyze(
+            a=_a,
+            b=_Sum(parser.ZeroOrMore[int](_Ref('a'))),
+            c=_Sum(_And([_Ref('b'), _Ref('b')])),
+            d=_Sum(_And([_Ref('b'), _Ref('a')])),
+        )
+        self.assertEqual(analysis.nullable, frozenset({'b', 'c'}))
+
+    def test_unknown(self):
+        analysis = _analyze(
+            a=_a,
+            b=lambda scope, state: (state, 0),
+            c=_Sum(_And([_Ref('a'), _Ref('b')])),
+            d=_Sum(_And([_Sum(parser.ZeroOrMore[int](_Ref('a'))), _Ref('b')])),
+            e=_Or([_Ref('b'), parser.ZeroOrOne[int](_Ref('a'))]),
+            f=_Ref('g'),
+        )
+        self.assertEqual(analysis.nullable, frozenset({'e'}))
+        self.assertEqual(analysis.unknown, frozenset({'b', 'd', 'f'}))
+
+    def test_first(self):
+        analysis = _analyze(
+            a=_a,
+            b=_Sum(parser.ZeroOrMore[int](_Ref('a'))),
+            c=_Sum(_And([_Ref('b'), _b])),
+            d=_Or([_Ref('c'), lambda scope, state: (state, 0)]),
+        )
+        self.assertEqual(analysis.first, {
+            'a': frozenset({'a'}),
+            'b': frozenset({'a'}),
+            'c': frozenset({'a', 'b'}),
+            'd': None,
+        })
+
+    def test_hazards(self):
+        for rules, rule_name, kinds in list[tuple[dict[str, _Rule], str, frozenset[analyzer.Hazard.Kind]]]([
+            (
+                {'a': _Or([_a, _b])},
+                'a',
+                frozenset(),
+            ),
+            (
+                {'a': _Or([_a, _Sum(_And([_a, _b]))])},
+                'a',
+                frozenset({_Kind.FIRST_CONFLICT}),
+            ),
+            (
+                {'a': _Or([_Sum(_And([_a, _a])), _Sum(_And([_a, _b]))])},
+                'a',
+                frozenset({_Kind.SHARED_PREFIX}),
+            ),
+            (
+                {
+                    'a': _Or([_Sum(_And([_b, _Ref('a'), _a])), _Sum(_And([_b, _Ref('a'), _b])), _a]),
+                },
+                'a',
+                frozenset({_Kind.EXPONENTIAL_BACKTRACKING}),
+            ),
+            (
+                {'a': _Sum(parser.ZeroOrMore[int](
+                    _Sum(parser.ZeroOrMore[int](_a))))},
+                'a',
+                frozenset({_Kind.NULLABLE_LOOP}),
+            ),
+            (
+                {'a': _Sum(parser.ZeroOrMore[int](
+                    lambda scope, state: (state, 0)))},
+                'a',
+                frozenset({_Kind.POSSIBLY_NULLABLE_LOOP}),
+            ),
+            (
+                {'a': _Sum(parser.ZeroOrMore[int](_Sum(_And([_a, lambda scope, state: (state, 0)]))))},
+                'a',
+                frozenset(),
+            ),
+            (
+                {
+                    'a': _Or([_Sum(_And([_Ref('b'), _a])), _b]),
+                    'b': _Sum(_And([_Sum(parser.ZeroOrMore[int](_b)), _Ref('a')])),
+                },
+                'b',
+                frozenset({_Kind.LEFT_RECURSION}),
+            ),
+        ]):
+            with self.subTest(rules=rules, rule_name=rule_name, kinds=kinds):
+                self.assertEqual(_analyze(**rules).kinds(rule_name), kinds)
+
+    def test_packrat(self):
+        rule = _Or([
+            _Sum(_And([_b, _Ref('a'), _a])),
+            _Sum(_And([_b, _Ref('a'), _b])),
+            _a,
+        ])
+        analysis = analyzer.analyze(processor.Processor[lexer.TokenStream, int](
+            {'a': rule}, 'a', packrat=True))
+        self.assertEqual(analysis.kinds('a'), frozenset({_Kind.SHARED_PREFIX}))
+
+    def test_str(self):
+        analysis = _analyze(a=_Sum(parser.ZeroOrMore[int](
+            parser.ZeroOrOne[int](_a))))
+        self.assertEqual(len(analysis.hazards), 1)
+        self.assertTrue(str(analysis).startswith('a: nullable loop: '))
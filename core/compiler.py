@@ -0,0 +1,503 @@
+from array import array
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Mapping, MutableMapping, MutableSequence, Optional, Sequence, TypeVar, overload
+from . import errors, lexer, parser, processor, regex, stream
+
+_State = TypeVar('_State')
+_Result = TypeVar('_Result')
+_Processor = TypeVar('_Processor', bound=processor.Processor)
+
+_MAX_DEPTH = 8
+_LEXER_RULE_NAME = '_lexer_compiled'
+
+
+@dataclass
+class _Code:
+    namespace: MutableMapping[str, Any] = field(default_factory=dict)
+    functions: MutableSequence[Sequence[str]] = field(default_factory=list)
+    lines: MutableSequence[str] = field(default_factory=list)
+    count: int = 0
+
+    def name(self, prefix: str) -> str:
+        self.count += 1
+        return f'{prefix}{self.count}'
+
+    def constant(self, value: Any) -> str:
+        name = self.name('k')
+        self.namespace[name] = value
+        return name
+
+    def line(self, depth: int, line: str) -> None:
+        self.lines.append(f'{"    "*depth}{line}')
+
+    def function(self, name: str, params: str, emit: Callable[[], None], result: str) -> None:
+        lines = self.lines
+        self.lines = [f'def {name}({params}):']
+        emit()
+        self.line(1, f'return {result}')
+        self.functions.append(self.lines)
+        self.lines = lines
+
+    @property
+    def source(self) -> str:
+        return '\n\n'.join('\n'.join(lines) for lines in self.functions)+'\n'
+
+    def load(self, name: str) -> Callable[..., Any]:
+        exec(self.source, self.namespace)
+        return self.namespace[name]
+
+
+@dataclass(frozen=True, repr=False)
+class _Values(Sequence[str]):
+    items: Sequence[regex.Char]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> str:
+        ...
+
+    def __getitem__(self, index: int | slice) -> str:
+        if isinstance(index, slice):
+            return ''.join(item.value for item in self.items[index])
+        return self.items[index].value
+
+
+def source_text(items: Sequence[regex.Char]) -> Sequence[str]:
+    if isinstance(items, (lexer.Source, lexer.MappedSource)):
+        return items.text
+    return _Values(items)
+
+
+@dataclass
+class _RegexCode(_Code):
+    def char_test(self, rule: regex.Rule, c: str) -> Optional[str]:
+        if isinstance(rule, regex.Literal):
+            return f'{c} == {repr(rule.value)}'
+        if isinstance(rule, regex.Any):
+            return 'True'
+        if isinstance(rule, regex.Class):
+            return f'{c} in {self.constant(frozenset(rule.values))}'
+        if isinstance(rule, regex.Range):
+            return f'{repr(rule.min)} <= {c} <= {repr(rule.max)}'
+        if isinstance(rule, regex.Not):
+            test = self.char_test(rule.rule, c)
+            if test is not None:
+                return f'not ({test})'
+        if isinstance(rule, processor.Or) and len(rule) > 0:
+            tests = [self.char_test(alt, c) for alt in rule]
+            if all(test is not None for test in tests):
+                return f'({" or ".join(test for test in tests if test is not None)})'
+        return None
+
+    def emit(self, rule: regex.Rule, p: str, depth: int) -> None:
+        test = self.char_test(rule, 'c')
+        if test is not None:
+            self.line(depth, f'c = t[{p}] if 0 <= {p} < n else ""')
+            self.line(depth, f'{p} = {p} + 1 if c and {test} else -1')
+        elif depth >= _MAX_DEPTH:
+            name = self.name('f')
+            self.function(name, 't, n, p', lambda: self.emit(rule, 'p', 1), 'p')
+            self.line(depth, f'{p} = {name}(t, n, {p}) if {p} >= 0 else -1')
+        elif isinstance(rule, regex.And):
+            self.emit_and(rule, p, depth)
+        elif isinstance(rule, processor.Or):
+            self.emit_or(rule, p, depth)
+        elif isinstance(rule, regex.ZeroOrMore):
+            self.emit_repeat(rule.rule.rule, p, depth, False)
+        elif isinstance(rule, regex.OneOrMore):
+            self.emit_repeat(rule.rule.rule, p, depth, True)
+        elif isinstance(rule, regex.ZeroOrOne):
+            self.emit_optional(rule.rule.rule, p, depth)
+        elif isinstance(rule, regex.UntilEmpty):
+            self.emit_until_empty(rule.rule.rule, p, depth)
+        elif isinstance(rule, regex.Not):
+            self.emit_not(rule.rule, p, depth)
+        elif isinstance(rule, lexer.Keywords):
+            self.emit(rule.rule, p, depth)
+        elif isinstance(rule, regex.Literals):
+            self.line(
+                depth, f'{p} = {self.constant(rule.match)}(t, n, {p})[0] if {p} >= 0 else -1')
+        else:
+            raise errors.Error(msg=f'unsupported regex rule {rule}')
+
+    def emit_and(self, rule: regex.And, p: str, depth: int) -> None:
+        rules = list(rule.rule)
+        while rules:
+            run = ''
+            while rules and isinstance(rules[0], regex.Literal):
+                run += rules.pop(0).value
+            if len(run) > 1:
+                self.line(
+                    depth, f'{p} = {p} + {len(run)} if 0 <= {p} and t[{p}:{p}+{len(run)}] == {repr(run)} else -1')
+            elif run:
+                self.emit(regex.Literal(run), p, depth)
+            else:
+                self.emit(rules.pop(0), p, depth)
+
+    def emit_or(self, rule: processor.Or, p: str, depth: int) -> None:
+        q = self.name('p')
+        self.line(depth, f'if {p} >= 0:')
+        self.line(depth+1, 'while True:')
+        for alt in rule:
+            self.line(depth+2, f'{q} = {p}')
+            self.emit(alt, q, depth+2)
+            self.line(depth+2, f'if {q} >= 0: break')
+        self.line(depth+2, f'{q} = -1')
+        self.line(depth+2, 'break')
+        self.line(depth+1, f'{p} = {q}')
+
+    def emit_repeat(self, rule: regex.Rule, p: str, depth: int, required: bool) -> None:
+        q = self.name('p')
+        self.line(depth, f'if {p} >= 0:')
+        if required:
+            self.line(depth+1, f'{q} = {p}')
+        test = self.char_test(rule, 'c')
+        if test is not None:
+            self.line(depth+1, f'while {p} < n:')
+            self.line(depth+2, f'c = t[{p}]')
+            self.line(depth+2, f'if not {test}: break')
+            self.line(depth+2, f'{p} += 1')
+        else:
+            r = self.name('p')
+            self.line(depth+1, 'while True:')
+            self.line(depth+2, f'{r} = {p}')
+            self.emit(rule, r, depth+2)
+            self.line(depth+2, f'if {r} <= {p}: break')
+            self.line(depth+2, f'{p} = {r}')
+        if required:
+            self.line(depth+1, f'if {p} == {q}: {p} = -1')
+
+    def emit_optional(self, rule: regex.Rule, p: str, depth: int) -> None:
+        q = self.name('p')
+        self.line(depth, f'if {p} >= 0:')
+        self.line(depth+1, f'{q} = {p}')
+        self.emit(rule, q, depth+1)
+        self.line(depth+1, f'if {q} >= 0: {p} = {q}')
+
+    def emit_until_empty(self, rule: regex.Rule, p: str, depth: int) -> None:
+        q = self.name('p')
+        self.line(depth, f'if {p} >= 0:')
+        self.line(depth+1, f'while {p} < n:')
+        self.line(depth+2, f'{q} = {p}')
+        self.emit(rule, q, depth+2)
+        self.line(depth+2, f'if {q} <= {p}: {p} = -1; break')
+        self.line(depth+2, f'{p} = {q}')
+
+    def emit_not(self, rule: regex.Rule, p: str, depth: int) -> None:
+        q = self.name('p')
+        self.line(depth, f'if 0 <= {p} < n:')
+        self.line(depth+1, f'{q} = {p}')
+        self.emit(rule, q, depth+1)
+        self.line(depth+1, f'{p} = -1 if {q} >= 0 else {p} + 1')
+        self.line(depth, 'else:')
+        self.line(depth+1, f'{p} = -1')
+
+
+@dataclass(frozen=True, repr=False)
+class CompiledRegex(regex.AbstractRule[regex.Char]):
+    rule: regex.Rule[regex.Char]
+    source: str = field(compare=False)
+    _match: Callable[[Sequence[str], int, int], int] = field(compare=False)
+
+    def __repr__(self) -> str:
+        return repr(self.rule)
+
+    def __call__(self, scope: regex.Scope[regex.Char], state: regex.CharStream[regex.Char]) -> regex.StateAndResult[regex.Char]:
+        result = self.apply(scope, state)
+        if result is None:
+            return self.rule(scope, state)
+        return result
+
+    def apply(self, scope: regex.Scope[regex.Char], state: regex.CharStream[regex.Char]) -> Optional[regex.StateAndResult[regex.Char]]:
+        items = state.buffer
+        text = source_text(items)
+        start = state.offset
+        end = self._match(text, len(items), start)
+        if end < 0:
+            return None
+        return state.seek(end), regex.Token(text[start:end])
+
+
+def compile_regex(rule: regex.Rule[regex.Char]) -> CompiledRegex:
+    if isinstance(rule, CompiledRegex):
+        return rule
+    code = _RegexCode()
+    code.function('match', 't, n, p', lambda: code.emit(rule, 'p', 1), 'p')
+    return CompiledRegex(rule, code.source, code.load('match'))
+
+
+@dataclass(frozen=True, repr=False)
+class _LexerLoop(processor.AbstractRule[lexer.CharStream, lexer.TokenStream]):
+    rule: lexer.Rule
+    source: str = field(compare=False)
+    _lex: Callable[..., tuple[int, bool]] = field(compare=False)
+
+    def __repr__(self) -> str:
+        return repr(self.rule)
+
+    def __call__(self, scope: lexer.Scope, state: lexer.CharStream) -> lexer.StateAndResult:
+        result = self.apply(scope, state)
+        if result is None:
+            return self.rule(scope, state)
+        return result
+
+    def apply(self, scope: lexer.Scope, state: lexer.CharStream) -> Optional[lexer.StateAndResult]:
+        items = state.buffer
+        text = source_text(items)
+        kinds = array('l')
+        starts = array('q')
+        ends = array('q')
+        offset, ok = self._lex(text, len(items), state.offset,
+                               kinds, starts, ends)
+        if not ok:
+            if scope.failures is not None:
+                scope.failures.record(_LEXER_RULE_NAME, state.seek(offset))
+            return None
+        if isinstance(items, (lexer.Source, lexer.MappedSource)):
+            return state.seek(offset), lexer.TokenStream(lexer.ColumnarTokens(items, kinds, starts, ends))
+        return state.seek(offset), lexer.TokenStream([
+            lexer.Token(text[start:end], lexer.kind_name(kind),
+                        items[start].position)
+            for kind, start, end in zip(kinds, starts, ends)
+        ])
+
+
+def _compile_lexer_loop(rule: lexer.Rule, literals: Sequence[str], rules: Mapping[str, regex.Rule[lexer.Char]]) -> _LexerLoop:
+    code = _RegexCode()
+
+    def emit() -> None:
+        code.line(1, 'while p < n:')
+        code.line(2, 'while True:')
+        if literals:
+            match = code.constant(lexer.ReLiterals(literals).match)
+            kinds = code.constant([lexer.kind(literal)
+                                  for literal in literals])
+            code.line(3, f'q, i = {match}(t, n, p)')
+            code.line(3, 'if q > p:')
+            code.line(4, f'kinds.append({kinds}[i])')
+            code.line(4, 'starts.append(p)')
+            code.line(4, 'ends.append(q)')
+            code.line(4, 'break')
+        for name, regex_rule in rules.items():
+            code.line(3, 'q = p')
+            code.emit(regex_rule, 'q', 3)
+            code.line(3, 'if q > p:')
+            if not name.startswith('_'):
+                if isinstance(regex_rule, lexer.Keywords):
+                    keywords = code.constant(
+                        {keyword: lexer.kind(keyword) for keyword in regex_rule.keywords})
+                    code.line(
+                        4, f'kinds.append({keywords}.get(t[p:q], {lexer.kind(name)}))')
+                else:
+                    code.line(4, f'kinds.append({lexer.kind(name)})')
+                code.line(4, 'starts.append(p)')
+                code.line(4, 'ends.append(q)')
+            code.line(4, 'break')
+        code.line(3, 'return p, False')
+        code.line(2, 'p = q')
+
+    code.function('lex', 't, n, p, kinds, starts, ends', emit, 'p, True')
+    return _LexerLoop(rule, code.source, code.load('lex'))
+
+
+def _uncompiled(rule: regex.Rule[lexer.Char]) -> regex.Rule[lexer.Char]:
+    if isinstance(rule, lexer.Keywords):
+        return lexer.Keywords(_uncompiled(rule.rule), rule.keywords)
+    if isinstance(rule, CompiledRegex):
+        return rule.rule
+    return rule
+
+
+def _compile_lexer_rule(rule: regex.Rule[lexer.Char]) -> regex.Rule[lexer.Char]:
+    if isinstance(rule, lexer.Keywords):
+        return lexer.Keywords(compile_regex(rule.rule), rule.keywords)
+    return compile_regex(rule)
+
+
+@dataclass(frozen=True, init=False, repr=False)
+class CompiledLexer(lexer.Lexer):
+    def __init__(self, lexer_: lexer.Lexer):
+        rules = {
+            name: _uncompiled(rule)
+            for name, rule in lexer_.rules.items()
+        }
+        super().__init__(lexer_.literals, **{
+            name: _compile_lexer_rule(rule)
+            for name, rule in rules.items()
+        })
+        root = self[self.root_rule_name]
+        object.__setattr__(self, '_rules', dict(self._rules) | {
+            self.root_rule_name: _compile_lexer_loop(root, lexer_.literals, rules),
+        })
+
+
+def _compilable(rule: Callable[..., Any]) -> bool:
+    return isinstance(rule, (processor.Or, processor.And, processor.ZeroOrMore, processor.OneOrMore, processor.ZeroOrOne, stream.UntilEmpty, processor.MultipleResultReducer, processor.OptionalResultReducer)) and not isinstance(rule, parser.PredictiveOr)
+
+
+@dataclass
+class _RuleCode(_Code):
+    refs: MutableSequence[processor.Ref[Any, Any]] = field(
+        default_factory=list)
+
+    def emit(self, rule: Callable[..., Any], s: str, r: str, depth: int) -> None:
+        if isinstance(rule, processor.Ref):
+            ref = replace(rule)
+            object.__setattr__(ref, '_rule', rule._rule)
+            self.refs.append(ref)
+            self.emit_call(f'{self.constant(ref.apply)}(scope, {s})', s, r, depth)
+        elif isinstance(rule, CompiledRule):
+            self.emit(rule.rule, s, r, depth)
+        elif not _compilable(rule):
+            self.emit_call(
+                f'apply({self.constant(rule)}, scope, {s})', s, r, depth)
+        elif depth >= _MAX_DEPTH:
+            name = self.name('f')
+            self.function(name, 'scope, s', lambda: self.emit(
+                rule, 's', 'r', 1), 'None if s is None else (s, r)')
+            self.emit_call(f'{name}(scope, {s})', s, r, depth)
+        elif isinstance(rule, processor.Or):
+            self.emit_or(rule, s, r, depth)
+        elif isinstance(rule, processor.And):
+            self.emit_and(rule, s, r, depth)
+        elif isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore)):
+            self.emit_repeat(rule.rule, s, r, depth)
+            if isinstance(rule, processor.OneOrMore):
+                self.line(depth, f'if not {r}: {s} = None')
+        elif isinstance(rule, processor.ZeroOrOne):
+            self.emit_optional(rule.rule, s, r, depth)
+        elif isinstance(rule, stream.UntilEmpty):
+            self.emit_until_empty(rule.rule, s, r, depth)
+        else:
+            self.emit(rule.rule, s, r, depth)
+            self.line(
+                depth, f'if {s} is not None: {r} = {self.constant(rule.reduce)}({r})')
+
+    def emit_call(self, call: str, s: str, r: str, depth: int) -> None:
+        x = self.name('x')
+        self.line(depth, f'{x} = {call}')
+        self.line(depth, f'if {x} is None: {s} = None')
+        self.line(depth, f'else: {s}, {r} = {x}')
+
+    def emit_or(self, rule: processor.Or, s: str, r: str, depth: int) -> None:
+        t = self.name('s')
+        u = self.name('r')
+        self.line(depth, f'{t} = {u} = None')
+        self.line(depth, 'while True:')
+        for alt in rule:
+            self.line(depth+1, f'{t} = {s}')
+            self.line(depth+1, 'if scope.cuts is not None: scope.cuts.enter()')
+            self.emit(alt, t, u, depth+1)
+            self.line(
+                depth+1, 'cut = scope.cuts is not None and scope.cuts.exit()')
+            self.line(depth+1, f'if {t} is not None or cut: break')
+            self.line(
+                depth+1, 'if scope.profiler is not None: scope.profiler.backtrack()')
+        self.line(depth+1, 'break')
+        self.line(depth, f'{s}, {r} = {t}, {u}')
+
+    def emit_and(self, rule: processor.And, s: str, r: str, depth: int) -> None:
+        t = self.name('s')
+        u = self.name('r')
+        results = self.name('rs')
+        self.line(depth, f'{results} = []')
+        self.line(depth, f'{t} = {s}')
+        self.line(depth, 'while True:')
+        for element in rule:
+            self.emit(element, t, u, depth+1)
+            self.line(depth+1, f'if {t} is None: break')
+            self.line(depth+1, f'{results}.append({u})')
+        self.line(depth+1, 'break')
+        self.line(depth, f'{s}, {r} = {t}, {results}')
+
+    def emit_repeat(self, rule: Callable[..., Any], s: str, r: str, depth: int) -> None:
+        t = self.name('s')
+        u = self.name('r')
+        self.line(depth, f'{r} = []')
+        self.line(depth, 'while True:')
+        self.line(depth+1, f'{t} = {s}')
+        self.line(depth+1, 'if scope.cuts is not None: scope.cuts.enter()')
+        self.emit(rule, t, u, depth+1)
+        self.line(
+            depth+1, 'cut = scope.cuts is not None and scope.cuts.exit()')
+        self.line(depth+1, f'if {t} is None and cut: {s} = None')
+        self.line(depth+1, f'if {t} is None: break')
+        self.line(depth+1, f'{s} = {t}')
+        self.line(depth+1, f'{r}.append({u})')
+
+    def emit_optional(self, rule: Callable[..., Any], s: str, r: str, depth: int) -> None:
+        t = self.name('s')
+        u = self.name('r')
+        self.line(depth, f'{t} = {s}')
+        self.line(depth, 'if scope.cuts is not None: scope.cuts.enter()')
+        self.emit(rule, t, u, depth)
+        self.line(depth, 'cut = scope.cuts is not None and scope.cuts.exit()')
+        self.line(depth, f'if {t} is None and cut: {s} = None')
+        self.line(depth, f'if {t} is None: {r} = None')
+        self.line(depth, f'else: {s}, {r} = {t}, {u}')
+
+    def emit_until_empty(self, rule: Callable[..., Any], s: str, r: str, depth: int) -> None:
+        t = self.name('s')
+        u = self.name('r')
+        self.line(depth, f'{r} = []')
+        self.line(depth, f'while not {s}.empty:')
+        self.line(depth+1, f'{t} = {s}')
+        self.emit(rule, t, u, depth+1)
+        self.line(depth+1, f'if {t} is None: {s} = None; break')
+        self.line(depth+1, f'{s} = {t}')
+        self.line(depth+1, f'{r}.append({u})')
+
+
+@dataclass(frozen=True, repr=False)
+class CompiledRule(processor.UnaryRule[_State, _Result]):
+    source: str = field(compare=False)
+    _apply: Callable[[processor.Scope[_State, _Result], _State], Optional[processor.StateAndResult[_State, _Result]]] = field(compare=False)
+    refs: Sequence[processor.Ref[_State, _Result]] = field(
+        default=(), compare=False)
+
+    def __repr__(self) -> str:
+        return repr(self.rule)
+
+    def __call__(self, scope: processor.Scope[_State, _Result], state: _State) -> processor.StateAndResult[_State, _Result]:
+        result = self._apply(scope, state)
+        if result is None:
+            return self.rule(scope, state)
+        return result
+
+    def apply(self, scope: processor.Scope[_State, _Result], state: _State) -> Optional[processor.StateAndResult[_State, _Result]]:
+        return self._apply(scope, state)
+
+
+def compile_rule(rule: processor.Rule[_State, _Result]) -> processor.Rule[_State, _Result]:
+    if not _compilable(rule):
+        return rule
+    code = _RuleCode({'apply': processor.apply})
+    code.function('rule', 'scope, s', lambda: code.emit(
+        rule, 's', 'r', 1), 'None if s is None else (s, r)')
+    return CompiledRule[_State, _Result](rule, code.source, code.load('rule'), code.refs)
+
+
+def compile_processor(processor_: _Processor) -> _Processor:
+    if isinstance(processor_, lexer.Lexer):
+        return CompiledLexer(processor_)
+    changes: MutableMapping[str, Any] = {
+        '_rules': {
+            name: compile_rule(rule)
+            for name, rule in processor_.items()
+        },
+    }
+    if isinstance(processor_, parser.Parser):
+        changes['lexer_'] = compile_processor(processor_.lexer_)
+    compiled = replace(processor_, **changes)
+    for rule in compiled.values():
+        if isinstance(rule, CompiledRule):
+            for ref in rule.refs:
+                if ref.rule_name in compiled:
+                    object.__setattr__(ref, '_rule', compiled[ref.rule_name])
+    return compiled
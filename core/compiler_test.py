@@ -0,0 +1,379 @@
+from dataclasses import replace
+import pathlib
+import string
+import tempfile
+from typing import Optional, Sequence
+import unittest
+from . import compiler, errors, lexer, parser, processor, regex, stream
+
+_Char = regex.Char
+_CharStream = regex.CharStream[_Char]
+_Rule = regex.Rule[_Char]
+_Scope = regex.Scope[_Char]
+_Literal = regex.Literal[_Char]
+_Class = regex.Class[_Char]
+_Range = regex.Range[_Char]
+_Any = regex.Any[_Char]
+_Or = regex.Or[_Char]
+_Not = regex.Not[_Char]
+_And = regex.And[_Char]
+_ZeroOrMore = regex.ZeroOrMore[_Char]
+_OneOrMore = regex.OneOrMore[_Char]
+_ZeroOrOne = regex.ZeroOrOne[_Char]
+_UntilEmpty = regex.UntilEmpty[_Char]
+
+
+def _nested(depth: int) -> _Rule:
+    rule: _Rule = _Literal('a')
+    for _ in range(depth):
+        rule = _Or([_And([_Literal('b'), rule]), _OneOrMore(rule)])
+    return rule
+
+
+class CompileRegexTest(unittest.TestCase):
+    def test_apply(self):
+        rules = list[_Rule]([
+            _Literal('a'),
+            _Class('ab'),
+            _Range('a', 'b'),
+            _Any(),
+            _Not(_Literal('a')),
+            _Not(_And([_Literal('a'), _Literal('b')])),
+            _And([_Literal('a'), _Literal('b')]),
+            _And([_Literal('a'), _Literal('b'), _Range('a', 'c'), _Literal('c')]),
+            _Or([_Literal('a'), _Literal('b')]),
+            _Or([_And([_Literal('a'), _Literal('b')]), _Literal('a')]),
+            _ZeroOrMore(_Literal('a')),
+            _ZeroOrMore(_And([_Literal('a'), _Literal('b')])),
+            _OneOrMore(_Literal('a')),
+            _OneOrMore(_Or([_Literal('c'), _And([_Literal('a'), _Literal('b')])])),
+            _ZeroOrOne(_Literal('a')),
+            _ZeroOrOne(_And([_Literal('a'), _Literal('b')])),
+            _UntilEmpty(_Literal('a')),
+            _UntilEmpty(_Or([_Literal('a'), _Literal('b')])),
+            regex.load('(_|[a-z])(_|[a-z]|[0-9])*'),
+            regex.Literals[_Char](['a', 'ab', 'b']),
+            _And([regex.Literals[_Char](['a', 'ab']), _Literal('c')]),
+            _nested(6),
+        ])
+        inputs = list[str](['', 'a', 'b', 'c', 'aa', 'ab', 'abc', 'abab', 'bbba', 'ba1'])
+        for rule in rules:
+            compiled = compiler.compile_regex(rule)
+            for input in inputs:
+                for state in list[_CharStream]([
+                    _CharStream([_Char(c) for c in input]),
+                    lexer.load_char_stream(input),
+                    lexer.load_char_stream(f'_{input}').tail,
+                ]):
+                    with self.subTest(rule=rule, state=state):
+                        self.assertEqual(
+                            compiled.apply(_Scope({}), state),
+                            processor.apply(rule, _Scope({}), state),
+                        )
+
+    def test_apply_fail(self):
+        compiled = compiler.compile_regex(_Literal('a'))
+        with self.assertRaises(errors.Error):
+            compiled(_Scope({}), lexer.load_char_stream('b'))
+
+    def test_compile_fail(self):
+        with self.assertRaises(errors.Error):
+            compiler.compile_regex(_Or([_Literal('a'), lambda scope, state: (state, regex.Token(''))]))
+
+
+def _lexer() -> lexer.Lexer:
+    return lexer.Lexer(
+        ['(', ')', '<', '<='],
+        _ws=lexer.ReClass(string.whitespace),
+        int=regex.load('[0-9]+'),
+        id=lexer.Keywords(regex.load(
+            '(_|[a-z])(_|[a-z]|[0-9])*'), ['if', 'while']),
+        def_=regex.literal('def'),
+        eq=regex.literal('=='),
+        assign=lexer.ReLiteral('='),
+    )
+
+
+class CompileLexerTest(unittest.TestCase):
+    def test_apply(self):
+        lexer_ = _lexer()
+        compiled = compiler.compile_processor(lexer_)
+        self.assertIsInstance(compiled, compiler.CompiledLexer)
+        for input in list[str]([
+            '',
+            'a',
+            'a = 1',
+            'def f == 12\n  x1 = _y',
+            'f(a <= 1) < (2)',
+            'if x while1 while',
+        ]):
+            with self.subTest(input=input):
+                self.assertEqual(
+                    compiled(lexer.Scope({}), input),
+                    lexer_(lexer.Scope({}), input),
+                )
+                state = lexer.CharStream(list(lexer.Source(input)))
+                self.assertEqual(
+                    compiled(lexer.Scope({}), state),
+                    lexer_(lexer.Scope({}), state),
+                )
+
+    def test_apply_fail(self):
+        lexer_ = _lexer()
+        compiled = compiler.compile_processor(lexer_)
+        for input in list[str]([
+            '$',
+            'a = $',
+            'a\n  A',
+        ]):
+            with self.subTest(input=input):
+                with self.assertRaises(processor.FarthestFailureError) as expected:
+                    lexer_(lexer.Scope({}), input)
+                with self.assertRaises(processor.FarthestFailureError) as actual:
+                    compiled(lexer.Scope({}), input)
+                self.assertEqual(actual.exception.state,
+                                 expected.exception.state)
+
+    def test_load_file(self):
+        lexer_ = _lexer()
+        compiled = compiler.compile_processor(lexer_)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = pathlib.Path(directory.name) / 'input'
+        input = 'def f == 12\n  x1 = _y'
+        path.write_text(input)
+        with lexer.load_file(path) as state:
+            self.assertIsInstance(state.buffer, lexer.MappedSource)
+            _, tokens = compiled(lexer.Scope({}), state)
+            assert isinstance(tokens.buffer, lexer.ColumnarTokens)
+            self.assertIs(tokens.buffer.source, state.buffer)
+            self.assertEqual(tokens, lexer_(lexer.Scope({}), input)[1])
+
+    def test_recompile(self):
+        compiled = compiler.compile_processor(_lexer())
+        self.assertEqual(
+            compiler.compile_processor(compiled)(lexer.Scope({}), 'a = 1'),
+            compiled(lexer.Scope({}), 'a = 1'),
+        )
+
+
+_State = stream.Stream[int]
+_IntScope = processor.Scope[_State, int]
+
+
+def _eq(value: int) -> processor.Rule[_State, int]:
+    def inner(scope: _IntScope, state: _State) -> processor.StateAndResult[_State, int]:
+        if state.empty or state.head != value:
+            raise errors.Error(msg=f'expected {value}')
+        return state.tail, state.head
+    return inner
+
+
+class _Sum(processor.MultipleResultReducer[_State, int]):
+    def reduce(self, results: Sequence[int]) -> int:
+        return sum(results)
+
+
+class _Default(processor.OptionalResultReducer[_State, int]):
+    def reduce(self, result: Optional[int]) -> int:
+        return -1 if result is None else result
+
+
+def _processor(packrat: bool) -> processor.Processor[_State, int]:
+    return processor.Processor[_State, int](
+        {
+            'root': _Sum(stream.UntilEmpty[_State, int](processor.Ref[_State, int]('item'))),
+            'item': processor.Or[_State, int]([
+                _Sum(processor.And[_State, int]([_eq(1), _eq(2)])),
+                _Sum(processor.OneOrMore[_State, int](_eq(3))),
+                _Sum(processor.And[_State, int]([
+                    _eq(4),
+                    _Default(processor.ZeroOrOne[_State, int](_eq(5))),
+                    _Sum(processor.ZeroOrMore[_State, int](processor.Ref[_State, int]('item'))),
+                    _eq(6),
+                ])),
+                _eq(7),
+            ]),
+        },
+        'root',
+        packrat=packrat,
+    )
+
+
+class CompileProcessorTest(unittest.TestCase):
+    def test_apply(self):
+        for packrat in (False, True):
+            processor_ = _processor(packrat)
+            compiled = compiler.compile_processor(processor_)
+            self.assertIsInstance(compiled['item'], compiler.CompiledRule)
+            for input in list[Sequence[int]]([
+                [],
+                [7],
+                [1, 2, 3, 3],
+                [4, 6],
+                [4, 5, 6],
+                [4, 7, 4, 1, 2, 6, 6, 7],
+            ]):
+                with self.subTest(packrat=packrat, input=input):
+                    self.assertEqual(
+                        compiled(_IntScope({}), _State(input)),
+                        processor_(_IntScope({}), _State(input)),
+                    )
+
+    def test_apply_fail(self):
+        for packrat in (False, True):
+            processor_ = _processor(packrat)
+            compiled = compiler.compile_processor(processor_)
+            for input in list[Sequence[int]]([
+                [1],
+                [4, 5],
+                [4, 5, 5, 6],
+                [7, 8],
+            ]):
+                with self.subTest(packrat=packrat, input=input):
+                    with self.assertRaises(processor.FarthestFailureError) as expected:
+                        processor_(_IntScope({}), _State(input))
+                    with self.assertRaises(processor.FarthestFailureError) as actual:
+                        compiled(_IntScope({}), _State(input))
+                    self.assertEqual(actual.exception.state,
+                                     expected.exception.state)
+                    self.assertEqual(actual.exception.expected,
+                                     expected.exception.expected)
+
+    def test_link(self):
+        processor_ = _processor(False)
+        compiled = compiler.compile_processor(processor_)
+        root = compiled['root']
+        assert isinstance(root, compiler.CompiledRule)
+        self.assertEqual([ref._rule for ref in root.refs], [compiled['item']])
+        shadowed = _IntScope({'item': _eq(1)})
+        for input in list[Sequence[int]]([[7], [1, 2, 7]]):
+            with self.subTest(input=input):
+                self.assertEqual(
+                    compiler.compile_rule(processor_['root'])(
+                        shadowed, _State(input)),
+                    processor_['root'](shadowed, _State(input)),
+                )
+
+    def test_cut(self):
+        _Ref = processor.Ref[_State, int]
+        processor_ = processor.Processor[_State, int](
+            {
+                'root': processor.Or[_State, int]([
+                    _Sum(processor.And[_State, int]([
+                        processor.Or[_State, int]([_Ref('a'), _eq(1)]),
+                        _eq(3),
+                    ])),
+                    _Sum(processor.And[_State, int]([
+                        processor.Cut[_State, int](_eq(4)),
+                        _eq(5),
+                    ])),
+                    _Ref('a'),
+                    _eq(1),
+                    _eq(4),
+                ]),
+                'a': _Sum(processor.And[_State, int]([
+                    processor.Cut[_State, int](_eq(1)),
+                    _eq(2),
+                ])),
+            },
+            'root',
+        )
+        for packrat in (False, True):
+            plain = replace(processor_, packrat=packrat)
+            compiled = compiler.compile_processor(plain)
+            self.assertIsInstance(compiled['root'], compiler.CompiledRule)
+            for input in list[Sequence[int]]([
+                [1, 2],
+                [1, 3],
+                [1, 2, 3],
+                [4, 5],
+                [4, 6],
+                [4],
+            ]):
+                with self.subTest(packrat=packrat, input=input):
+                    self.assertEqual(
+                        compiled.apply(_IntScope({}), _State(input)),
+                        plain.apply(_IntScope({}), _State(input)),
+                    )
+
+    def test_cut_repeat(self):
+        body = _Sum(processor.And[_State, int]([
+            processor.Cut[_State, int](_eq(1)),
+            _eq(2),
+        ]))
+        processor_ = processor.Processor[_State, int](
+            {
+                'root': processor.Or[_State, int]([
+                    _Sum(processor.And[_State, int]([
+                        _Sum(processor.ZeroOrMore[_State, int](body)),
+                        _eq(3),
+                    ])),
+                    _Sum(processor.And[_State, int]([
+                        _Sum(processor.OneOrMore[_State, int](body)),
+                        _eq(4),
+                    ])),
+                    _eq(1),
+                ]),
+            },
+            'root',
+        )
+        for packrat in (False, True):
+            plain = replace(processor_, packrat=packrat)
+            compiled = compiler.compile_processor(plain)
+            self.assertIsInstance(compiled['root'], compiler.CompiledRule)
+            for input in list[Sequence[int]]([
+                [3],
+                [1, 2, 3],
+                [1, 2, 4],
+                [1],
+                [1, 2, 1],
+            ]):
+                with self.subTest(packrat=packrat, input=input):
+                    self.assertEqual(
+                        compiled.apply(_IntScope({}), _State(input)),
+                        plain.apply(_IntScope({}), _State(input)),
+                    )
+
+    def test_profile(self):
+        processor_ = replace(_processor(False), profile=True)
+        compiled = compiler.compile_processor(
+            replace(_processor(False), profile=True))
+        for rule in (processor_, compiled):
+            rule(_IntScope({}), _State([4, 7, 4, 1, 2, 6, 6, 7]))
+        assert processor_.profiler is not None and compiled.profiler is not None
+        self.assertEqual(
+            {rule_name: (profile.calls, profile.backtracks)
+             for rule_name, profile in compiled.profiler.rules.items()},
+            {rule_name: (profile.calls, profile.backtracks)
+             for rule_name, profile in processor_.profiler.rules.items()},
+        )
+
+    def test_parser(self):
+        def load_int(scope: parser.Scope[int], state: lexer.TokenStream) -> parser.StateAndResult[int]:
+            state, value = parser.get_token_value(state, 'int')
+            return state, int(value)
+
+        parser_ = parser.Parser[int](
+            {
+                'root': parser.Or[int]([
+                    parser.Ref[int]('sum'),
+                    parser.Ref[int]('int'),
+                ]),
+                'sum': _Sum(parser.And[int]([
+                    parser.Ref[int]('int'),
+                    _Sum(parser.OneOrMore[int](parser.Ref[int]('int'))),
+                ])),
+                'int': load_int,
+            },
+            'root',
+            _lexer(),
+        )
+        compiled = compiler.compile_processor(parser_)
+        self.assertIsInstance(compiled.lexer_, compiler.CompiledLexer)
+        for input in list[str](['1', '1 2', '1 2 3']):
+            with self.subTest(input=input):
+                self.assertEqual(
+                    compiled(parser.Scope[int]({}), input),
+                    parser_(parser.Scope[int]({}), input),
+                )
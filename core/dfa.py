@@ -0,0 +1,520 @@
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping, MutableMapping, MutableSequence, Optional, Sequence
+from . import compiler, errors, lexer, processor, regex
+
+MAX_CHAR = 0x10ffff
+_END = -1
+_ASCII = 128
+_UNKNOWN = -2
+LAZY_CACHE_SIZE = 256
+LAZY_MAX_FLUSHES = 4
+
+Interval = tuple[int, int]
+
+
+@dataclass(frozen=True)
+class CharSet:
+    intervals: Sequence[Interval]
+
+    def __post_init__(self):
+        intervals: MutableSequence[Interval] = []
+        for min, max in sorted(self.intervals):
+            if min > max:
+                raise errors.Error(msg=f'invalid interval {min} {max}')
+            if intervals and min <= intervals[-1][1]+1:
+                intervals[-1] = (intervals[-1][0],
+                                 max if max > intervals[-1][1] else intervals[-1][1])
+            else:
+                intervals.append((min, max))
+        object.__setattr__(self, 'intervals', tuple(intervals))
+
+    def __contains__(self, code: int) -> bool:
+        i = bisect_right(self.intervals, (code, MAX_CHAR)) - 1
+        return i >= 0 and self.intervals[i][0] <= code <= self.intervals[i][1]
+
+    def complement(self) -> 'CharSet':
+        intervals: MutableSequence[Interval] = []
+        min = 0
+        for lo, hi in self.intervals:
+            if hi < 0:
+                continue
+            if lo > min:
+                intervals.append((min, lo-1))
+            min = hi+1
+        if min <= MAX_CHAR:
+            intervals.append((min, MAX_CHAR))
+        return CharSet(intervals)
+
+    @staticmethod
+    def of(values: Iterable[str]) -> 'CharSet':
+        return CharSet([(ord(value), ord(value)) for value in values])
+
+    @staticmethod
+    def any() -> 'CharSet':
+        return CharSet([(0, MAX_CHAR)])
+
+    @staticmethod
+    def end() -> 'CharSet':
+        return CharSet([(_END, _END)])
+
+
+def char_set(rule: regex.Rule[regex.Char]) -> Optional[CharSet]:
+    if isinstance(rule, regex.Literal):
+        return CharSet.of(rule.value)
+    if isinstance(rule, regex.Any):
+        return CharSet.any()
+    if isinstance(rule, regex.Class):
+        return CharSet.of(rule.values)
+    if isinstance(rule, regex.Range):
+        return CharSet([(ord(rule.min), ord(rule.max))])
+    if isinstance(rule, regex.Not):
+        rule_char_set = char_set(rule.rule)
+        if rule_char_set is not None:
+            return rule_char_set.complement()
+    if isinstance(rule, processor.Or) and len(rule) > 0:
+        char_sets = [char_set(alt) for alt in rule]
+        if all(alt_char_set is not None for alt_char_set in char_sets):
+            return CharSet([interval for alt_char_set in char_sets if alt_char_set is not None for interval in alt_char_set.intervals])
+    return None
+
+
+@dataclass
+class Nfa:
+    epsilons: MutableSequence[MutableSequence[int]] = field(
+        default_factory=list)
+    edges: MutableSequence[MutableSequence[tuple[CharSet, int]]] = field(
+        default_factory=list)
+    start: int = 0
+    tags: MutableMapping[int, int] = field(default_factory=dict)
+
+    def state(self) -> int:
+        self.epsilons.append([])
+        self.edges.append([])
+        return len(self.edges)-1
+
+    def fragment(self, rule: regex.Rule[regex.Char]) -> tuple[int, int]:
+        if isinstance(rule, (DfaRegex, compiler.CompiledRegex, lexer.Keywords)):
+            return self.fragment(rule.rule)
+        start = self.state()
+        rule_char_set = char_set(rule)
+        if rule_char_set is not None:
+            end = self.state()
+            self.edges[start].append((rule_char_set, end))
+        elif isinstance(rule, regex.And):
+            end = start
+            for element in rule.rule:
+                element_start, element_end = self.fragment(element)
+                self.epsilons[end].append(element_start)
+                end = element_end
+        elif isinstance(rule, processor.Or):
+            end = self.state()
+            for alt in rule:
+                alt_start, alt_end = self.fragment(alt)
+                self.epsilons[start].append(alt_start)
+                self.epsilons[alt_end].append(end)
+        elif isinstance(rule, (regex.ZeroOrMore, regex.OneOrMore)):
+            end = self.state()
+            child_start, child_end = self.fragment(rule.rule.rule)
+            self.epsilons[start].append(child_start)
+            self.epsilons[child_end].extend([child_start, end])
+            if isinstance(rule, regex.ZeroOrMore):
+                self.epsilons[start].append(end)
+        elif isinstance(rule, regex.ZeroOrOne):
+            child_start, end = self.fragment(rule.rule.rule)
+            self.epsilons[start].extend([child_start, end])
+        elif isinstance(rule, regex.Literals):
+            end = self.state()
+            for value in rule.values:
+                value_start, value_end = self.fragment(regex.literal(value))
+                self.epsilons[start].append(value_start)
+                self.epsilons[value_end].append(end)
+        elif isinstance(rule, regex.UntilEmpty):
+            loop = self.state()
+            end = self.state()
+            child_start, child_end = self.fragment(rule.rule.rule)
+            self.epsilons[start].append(loop)
+            self.epsilons[loop].append(child_start)
+            self.epsilons[child_end].append(loop)
+            self.edges[loop].append((CharSet.end(), end))
+        else:
+            raise errors.Error(msg=f'unsupported dfa rule {rule}')
+        return start, end
+
+    def closure(self, states: Iterable[int]) -> frozenset[int]:
+        closure = set(states)
+        pending = list(closure)
+        while pending:
+            for target in self.epsilons[pending.pop()]:
+                if target not in closure:
+                    closure.add(target)
+                    pending.append(target)
+        return frozenset(closure)
+
+    def step(self, states: Iterable[int], code: int) -> frozenset[int]:
+        return self.closure(
+            target
+            for state in states
+            for char_set, target in self.edges[state]
+            if code in char_set
+        )
+
+    def tag(self, states: Iterable[int]) -> int:
+        return min((self.tags[state] for state in states if state in self.tags), default=-1)
+
+    def scan(self, states: frozenset[int], text: Sequence[str], n: int, p: int, end: int, tag: int) -> tuple[int, int]:
+        while p < n and states:
+            states = self.step(states, ord(text[p]))
+            p += 1
+            state_tag = self.tag(states)
+            if state_tag >= 0:
+                end, tag = p, state_tag
+        if states:
+            state_tag = self.tag(self.step(states, _END))
+            if state_tag >= 0:
+                return n, state_tag
+        return end, tag
+
+    @staticmethod
+    def build(*rules: regex.Rule[regex.Char]) -> 'Nfa':
+        nfa = Nfa()
+        nfa.start = nfa.state()
+        for tag, rule in enumerate(rules):
+            start, end = nfa.fragment(rule)
+            nfa.epsilons[nfa.start].append(start)
+            nfa.tags[end] = tag
+        return nfa
+
+
+@dataclass(frozen=True)
+class Alphabet:
+    bounds: Sequence[int]
+    ascii: Sequence[int] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'ascii', [
+            self.index(code) for code in range(_ASCII)])
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def index(self, code: int) -> int:
+        return bisect_right(self.bounds, code)-1
+
+    @staticmethod
+    def build(nfa: Nfa) -> 'Alphabet':
+        bounds = {_END, 0}
+        for edges in nfa.edges:
+            for char_set, _ in edges:
+                for min, max in char_set.intervals:
+                    bounds.add(min)
+                    if max < MAX_CHAR:
+                        bounds.add(max+1)
+        return Alphabet(sorted(bounds))
+
+
+@dataclass(frozen=True)
+class Dfa:
+    alphabet: Alphabet
+    table: Sequence[int]
+    tags: Sequence[int]
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def match(self, text: Sequence[str], n: int, p: int) -> int:
+        return self.scan(text, n, p)[0]
+
+    def scan(self, text: Sequence[str], n: int, p: int) -> tuple[int, int]:
+        table, tags = self.table, self.tags
+        ascii, bounds = self.alphabet.ascii, self.alphabet.bounds
+        width = len(bounds)
+        state = 0
+        tag = tags[0]
+        end = p if tag >= 0 else -1
+        while p < n:
+            code = ord(text[p])
+            state = table[state*width +
+                          (ascii[code] if code < _ASCII else bisect_right(bounds, code)-1)]
+            if state < 0:
+                return end, tag
+            p += 1
+            if tags[state] >= 0:
+                end, tag = p, tags[state]
+        state = table[state*width]
+        if state >= 0 and tags[state] >= 0:
+            return n, tags[state]
+        return end, tag
+
+    @staticmethod
+    def build(nfa: Nfa) -> 'Dfa':
+        alphabet = Alphabet.build(nfa)
+        states: MutableSequence[frozenset[int]] = [
+            nfa.closure([nfa.start])]
+        indices: MutableMapping[frozenset[int], int] = {states[0]: 0}
+        table: MutableSequence[int] = []
+        for nfa_states in states:
+            for code in alphabet.bounds:
+                target = nfa.step(nfa_states, code)
+                if not target:
+                    table.append(-1)
+                    continue
+                if target not in indices:
+                    indices[target] = len(states)
+                    states.append(target)
+                table.append(indices[target])
+        return Dfa(alphabet, table, [nfa.tag(nfa_states) for nfa_states in states]).minimize()
+
+    def minimize(self) -> 'Dfa':
+        width = len(self.alphabet)
+        blocks: Sequence[int] = [tag+1 for tag in self.tags]
+        while True:
+            signatures: MutableMapping[tuple[int, tuple[int, ...]], int] = {}
+            refined = [
+                signatures.setdefault((blocks[state], tuple(
+                    -1 if target < 0 else blocks[target]
+                    for target in self.table[state*width:(state+1)*width]
+                )), len(signatures))
+                for state in range(len(self))
+            ]
+            if len(signatures) == len(set(blocks)):
+                break
+            blocks = refined
+        representatives = {block: state for state,
+                           block in reversed(list(enumerate(refined)))}
+        return Dfa(
+            self.alphabet,
+            [
+                -1 if target < 0 else refined[target]
+                for block in range(len(signatures))
+                for target in self.table[representatives[block]*width:(representatives[block]+1)*width]
+            ],
+            [self.tags[representatives[block]]
+             for block in range(len(signatures))],
+        )
+
+
+@dataclass
+class LazyDfa:
+    nfa: Nfa
+    cache_size: int = LAZY_CACHE_SIZE
+    max_flushes: int = LAZY_MAX_FLUSHES
+    alphabet: Alphabet = field(init=False)
+    flushes: int = field(default=0, init=False)
+    _states: MutableSequence[frozenset[int]] = field(
+        default_factory=list, init=False)
+    _indices: MutableMapping[frozenset[int], int] = field(
+        default_factory=dict, init=False)
+    _table: MutableSequence[int] = field(default_factory=list, init=False)
+    _tags: MutableSequence[int] = field(default_factory=list, init=False)
+
+    def __post_init__(self):
+        if self.cache_size < 2:
+            raise errors.Error(msg=f'invalid cache size {self.cache_size}')
+        self.alphabet = Alphabet.build(self.nfa)
+        self.flush()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def flush(self) -> None:
+        self._states.clear()
+        self._indices.clear()
+        self._table.clear()
+        self._tags.clear()
+        self._add(self.nfa.closure([self.nfa.start]))
+
+    def _add(self, states: frozenset[int]) -> int:
+        self._indices[states] = len(self._states)
+        self._states.append(states)
+        self._table.extend([_UNKNOWN]*len(self.alphabet))
+        self._tags.append(self.nfa.tag(states))
+        return len(self._states)-1
+
+    def _transition(self, state: int, index: int) -> tuple[int, int]:
+        target = self.nfa.step(self._states[state], self.alphabet.bounds[index])
+        if not target:
+            self._table[state*len(self.alphabet)+index] = -1
+            return state, -1
+        if target in self._indices:
+            next_state = self._indices[target]
+        else:
+            if len(self._states) >= self.cache_size:
+                states = self._states[state]
+                self.flushes += 1
+                self.flush()
+                state = self._indices.get(states)
+                if state is None:
+                    state = self._add(states)
+            next_state = self._indices.get(target)
+            if next_state is None:
+                next_state = self._add(target)
+        self._table[state*len(self.alphabet)+index] = next_state
+        return state, next_state
+
+    def match(self, text: Sequence[str], n: int, p: int) -> int:
+        return self.scan(text, n, p)[0]
+
+    def scan(self, text: Sequence[str], n: int, p: int) -> tuple[int, int]:
+        table, tags = self._table, self._tags
+        ascii, bounds = self.alphabet.ascii, self.alphabet.bounds
+        width = len(bounds)
+        flushes = self.flushes
+        state = 0
+        tag = tags[0]
+        end = p if tag >= 0 else -1
+        while p < n:
+            code = ord(text[p])
+            index = ascii[code] if code < _ASCII else bisect_right(
+                bounds, code)-1
+            next_state = table[state*width+index]
+            if next_state == _UNKNOWN:
+                if self.flushes-flushes >= self.max_flushes:
+                    return self.nfa.scan(self._states[state], text, n, p, end, tag)
+                state, next_state = self._transition(state, index)
+            if next_state < 0:
+                return end, tag
+            state = next_state
+            p += 1
+            if tags[state] >= 0:
+                end, tag = p, tags[state]
+        next_state = table[state*width]
+        if next_state == _UNKNOWN:
+            state, next_state = self._transition(state, 0)
+        if next_state >= 0 and tags[next_state] >= 0:
+            return n, tags[next_state]
+        return end, tag
+
+
+@dataclass(frozen=True, repr=False)
+class DfaRegex(regex.AbstractRule[regex.Char]):
+    rule: regex.Rule[regex.Char]
+    dfa: Dfa | LazyDfa = field(compare=False)
+
+    def __repr__(self) -> str:
+        return repr(self.rule)
+
+    def __call__(self, scope: regex.Scope[regex.Char], state: regex.CharStream[regex.Char]) -> regex.StateAndResult[regex.Char]:
+        result = self.apply(scope, state)
+        if result is None:
+            raise regex.RuleError[regex.Char](
+                rule=self, state=state, msg='no match')
+        return result
+
+    def apply(self, scope: regex.Scope[regex.Char], state: regex.CharStream[regex.Char]) -> Optional[regex.StateAndResult[regex.Char]]:
+        items = state.buffer
+        text = compiler.source_text(items)
+        start = state.offset
+        end = self.dfa.match(text, len(items), start)
+        if end < 0:
+            return None
+        return state.seek(end), regex.Token(text[start:end])
+
+
+def compile_regex(rule: regex.Rule[regex.Char], *, lazy: bool = False, cache_size: int = LAZY_CACHE_SIZE) -> DfaRegex:
+    if isinstance(rule, DfaRegex):
+        rule = rule.rule
+    nfa = Nfa.build(rule)
+    if lazy:
+        return DfaRegex(rule, LazyDfa(nfa, cache_size))
+    return DfaRegex(rule, Dfa.build(nfa))
+
+
+_LEXER_RULE_NAME = '_lexer_dfa'
+
+
+@dataclass(frozen=True, repr=False)
+class _Munch(processor.AbstractRule[lexer.CharStream, lexer.TokenStream]):
+    literals: Sequence[str]
+    rules: Mapping[str, regex.Rule[lexer.Char]]
+    automaton: Dfa | LazyDfa = field(compare=False)
+    kinds: Sequence[int] = field(compare=False)
+    keywords: Sequence[Optional[Mapping[str, int]]] = field(compare=False)
+    once: bool = False
+
+    def __repr__(self) -> str:
+        return f'({"|".join(list(self.literals)+list(self.rules))}){"" if self.once else "!"}'
+
+    def __call__(self, scope: lexer.Scope, state: lexer.CharStream) -> lexer.StateAndResult:
+        result = self.apply(scope, state)
+        if result is None:
+            raise processor.StateError[lexer.CharStream](
+                msg='no token matched', state=state)
+        return result
+
+    def apply(self, scope: lexer.Scope, state: lexer.CharStream) -> Optional[lexer.StateAndResult]:
+        items = state.buffer
+        text = compiler.source_text(items)
+        n = len(items)
+        p = state.offset
+        if self.once and p >= n:
+            return None
+        scan, kinds, keywords = self.automaton.scan, self.kinds, self.keywords
+        token_kinds = array('l')
+        starts = array('q')
+        ends = array('q')
+        while p < n:
+            end, tag = scan(text, n, p)
+            if end <= p:
+                if scope.failures is not None:
+                    scope.failures.record(_LEXER_RULE_NAME, state.seek(p))
+                return None
+            kind = kinds[tag]
+            if kind >= 0:
+                tag_keywords = keywords[tag]
+                if tag_keywords is not None:
+                    kind = tag_keywords.get(text[p:end], kind)
+                token_kinds.append(kind)
+                starts.append(p)
+                ends.append(end)
+            p = end
+            if self.once:
+                break
+        if isinstance(items, (lexer.Source, lexer.MappedSource)):
+            return state.seek(p), lexer.TokenStream(lexer.ColumnarTokens(items, token_kinds, starts, ends))
+        return state.seek(p), lexer.TokenStream([
+            lexer.Token(text[start:end], lexer.kind_name(kind),
+                        items[start].position)
+            for kind, start, end in zip(token_kinds, starts, ends)
+        ])
+
+
+@dataclass(frozen=True, init=False, repr=False)
+class DfaLexer(lexer.Lexer):
+    def __init__(self, lexer_: lexer.Lexer, *, lazy: bool = False, cache_size: int = LAZY_CACHE_SIZE):
+        rules = {
+            name: rule.rule if isinstance(rule, (DfaRegex, compiler.CompiledRegex)) else rule
+            for name, rule in lexer_.rules.items()
+        }
+        literals = lexer_.literals
+        super().__init__(literals, **rules)
+        nfa = Nfa.build(*[regex.literal(literal)
+                        for literal in literals], *rules.values())
+        automaton = LazyDfa(nfa, cache_size) if lazy else Dfa.build(nfa)
+        kinds = [lexer.kind(literal) for literal in literals] + [
+            -1 if name.startswith('_') else lexer.kind(name)
+            for name in rules
+        ]
+        keywords: Sequence[Optional[Mapping[str, int]]] = [None]*len(literals) + [
+            {keyword: lexer.kind(keyword) for keyword in rule.keywords}
+            if isinstance(rule, lexer.Keywords) else None
+            for rule in rules.values()
+        ]
+        object.__setattr__(self, '_rules', {
+            name: _Munch(literals, rules, automaton, kinds, keywords,
+                         name != self.root_rule_name)
+            for name in self._rules
+        })
+
+    @property
+    def rules(self) -> Mapping[str, regex.Rule[lexer.Char]]:
+        munch = self[self.root_rule_name]
+        assert isinstance(munch, _Munch)
+        return munch.rules
+
+    @property
+    def literals(self) -> Sequence[str]:
+        munch = self[self.root_rule_name]
+        assert isinstance(munch, _Munch)
+        return munch.literals
@@ -0,0 +1,293 @@
+import pathlib
+import random
+import string
+import tempfile
+from typing import Tuple
+import unittest
+from . import dfa, errors, lexer, processor, regex
+
+_Char = regex.Char
+_CharStream = regex.CharStream[_Char]
+_Rule = regex.Rule[_Char]
+_Scope = regex.Scope[_Char]
+_Literal = regex.Literal[_Char]
+_Class = regex.Class[_Char]
+_Range = regex.Range[_Char]
+_Any = regex.Any[_Char]
+_Or = regex.Or[_Char]
+_Not = regex.Not[_Char]
+_And = regex.And[_Char]
+_ZeroOrMore = regex.ZeroOrMore[_Char]
+_OneOrMore = regex.OneOrMore[_Char]
+_ZeroOrOne = regex.ZeroOrOne[_Char]
+_UntilEmpty = regex.UntilEmpty[_Char]
+
+
+class CharSetTest(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(dfa.CharSet([(5, 6), (0, 2), (3, 3), (1, 1)]),
+                         dfa.CharSet([(0, 3), (5, 6)]))
+
+    def test_contains(self):
+        char_set = dfa.CharSet.of('ac')
+        for code, expected in list[Tuple[int, bool]]([
+            (ord('a'), True),
+            (ord('b'), False),
+            (ord('c'), True),
+            (ord('d'), False),
+        ]):
+            with self.subTest(code=code, expected=expected):
+                self.assertEqual(code in char_set, expected)
+
+    def test_complement(self):
+        self.assertEqual(dfa.CharSet.of('b').complement(), dfa.CharSet(
+            [(0, ord('a')), (ord('c'), dfa.MAX_CHAR)]))
+        self.assertEqual(dfa.CharSet.any().complement(), dfa.CharSet([]))
+        self.assertEqual(
+            dfa.CharSet.any().complement().complement(), dfa.CharSet.any())
+
+
+def _rules() -> list[_Rule]:
+    return list[_Rule]([
+            _Literal('a'),
+            _Class('ab'),
+            _Range('a', 'b'),
+            _Any(),
+            _Not(_Literal('a')),
+            _Not(_Or([_Literal('a'), _Range('0', '9')])),
+            _And([_Literal('a'), _Literal('b')]),
+            _Or([_Literal('a'), _Literal('b')]),
+            _Or([_And([_Literal('a'), _Literal('b')]), _Literal('a')]),
+            _ZeroOrMore(_Literal('a')),
+            _ZeroOrMore(_And([_Literal('a'), _Literal('b')])),
+            _OneOrMore(_Literal('a')),
+            _OneOrMore(_Or([_Literal('c'), _And([_Literal('a'), _Literal('b')])])),
+            _ZeroOrOne(_Literal('a')),
+            _ZeroOrOne(_And([_Literal('a'), _Literal('b')])),
+            _UntilEmpty(_Literal('a')),
+            _UntilEmpty(_Or([_Literal('a'), _Literal('b')])),
+            regex.load('(_|[a-z])(_|[a-z]|[0-9])*'),
+            regex.load('[0-9]+'),
+            regex.literal('abc'),
+            regex.Literals[_Char](['b', 'ab', 'abc']),
+        ])
+
+
+_INPUTS = list[str](['', 'a', 'b', 'c', 'aa', 'ab', 'abc', 'abab', 'bbba', 'ba1', 'é'])
+
+
+def _blowup(k: int) -> _Rule:
+    ab = _Or([_Literal('a'), _Literal('b')])
+    return _And([_ZeroOrMore(ab), _Literal('a')] + [ab]*k)
+
+
+def _random(length: int) -> str:
+    generator = random.Random(0)
+    return ''.join(generator.choice('ab') for _ in range(length))
+
+
+class CompileRegexTest(unittest.TestCase):
+    def test_equivalent(self):
+        for rule in _rules():
+            compiled = dfa.compile_regex(rule)
+            for input in _INPUTS:
+                for state in list[_CharStream]([
+                    _CharStream([_Char(c) for c in input]),
+                    lexer.load_char_stream(input),
+                    lexer.load_char_stream(f'_{input}').tail,
+                ]):
+                    with self.subTest(rule=rule, state=state):
+                        self.assertEqual(
+                            compiled.apply(_Scope({}), state),
+                            processor.apply(rule, _Scope({}), state),
+                        )
+
+    def test_longest_match(self):
+        for rule, input, expected in list[Tuple[_Rule, str, str]]([
+            (_Or([_Literal('a'), _And([_Literal('a'), _Literal('b')])]), 'abc', 'ab'),
+            (_And([_ZeroOrMore(_Literal('a')), _Literal('a')]), 'aab', 'aa'),
+            (_And([_ZeroOrOne(_Literal('a')), _Literal('a')]), 'a', 'a'),
+        ]):
+            with self.subTest(rule=rule, input=input, expected=expected):
+                state, token = dfa.compile_regex(rule)(
+                    _Scope({}), lexer.load_char_stream(input))
+                self.assertEqual(token, regex.Token(expected))
+                self.assertEqual(state.offset, len(expected))
+
+    def test_apply_fail(self):
+        compiled = dfa.compile_regex(regex.literal('ab'))
+        for input in ['', 'b', 'a', 'ac']:
+            with self.subTest(input=input):
+                with self.assertRaises(errors.Error):
+                    compiled(_Scope({}), lexer.load_char_stream(input))
+
+    def test_compile_fail(self):
+        for rule in list[_Rule]([
+            _Not(_And([_Literal('a'), _Literal('b')])),
+            _Or([_Literal('a'), lambda scope, state: (state, regex.Token(''))]),
+        ]):
+            with self.subTest(rule=rule):
+                with self.assertRaises(errors.Error):
+                    dfa.compile_regex(rule)
+
+    def test_states(self):
+        compiled = dfa.compile_regex(
+            regex.load('(_|[a-z]|[A-Z])(_|[a-z]|[A-Z]|[0-9])*'))
+        self.assertEqual(len(compiled.dfa), 2)
+        self.assertEqual(len(compiled.dfa.alphabet), 10)
+
+
+class LazyDfaTest(unittest.TestCase):
+    def test_equivalent(self):
+        for rule in _rules():
+            eager = dfa.compile_regex(rule)
+            for cache_size in [2, 3, 256]:
+                lazy = dfa.compile_regex(rule, lazy=True, cache_size=cache_size)
+                for input in _INPUTS:
+                    state = lexer.load_char_stream(input)
+                    with self.subTest(rule=rule, cache_size=cache_size, input=input):
+                        self.assertEqual(
+                            lazy.apply(_Scope({}), state),
+                            eager.apply(_Scope({}), state),
+                        )
+
+    def test_bounded(self):
+        rule = _blowup(12)
+        eager = dfa.compile_regex(rule)
+        lazy = dfa.compile_regex(rule, lazy=True, cache_size=64)
+        assert isinstance(lazy.dfa, dfa.LazyDfa)
+        for input in ['ab'*200, _random(2000), 'a'*20, 'b'*20]:
+            with self.subTest(input=input):
+                state = lexer.load_char_stream(input)
+                self.assertEqual(lazy.apply(_Scope({}), state),
+                                 eager.apply(_Scope({}), state))
+                self.assertLessEqual(len(lazy.dfa), 64)
+        self.assertGreater(lazy.dfa.flushes, 0)
+        self.assertGreater(len(eager.dfa), 64)
+
+    def test_nfa_fallback(self):
+        rule = _blowup(8)
+        lazy = dfa.LazyDfa(dfa.Nfa.build(rule), cache_size=2, max_flushes=1)
+        input = _random(200)
+        self.assertEqual(lazy.match(input, len(input), 0),
+                         dfa.compile_regex(rule).dfa.match(input, len(input), 0))
+        self.assertEqual(lazy.flushes, 1)
+
+    def test_ctor_fail(self):
+        with self.assertRaises(errors.Error):
+            dfa.compile_regex(_Literal('a'), lazy=True, cache_size=1)
+
+
+def _lexer() -> lexer.Lexer:
+    return lexer.Lexer(
+        ['(', ')', '<', '<='],
+        _ws=lexer.ReClass(string.whitespace),
+        def_=regex.literal('def'),
+        eq=regex.literal('=='),
+        assign=lexer.ReLiteral('='),
+        int=regex.load('[0-9]+'),
+        id=lexer.Keywords(regex.load(
+            '(_|[a-z])(_|[a-z]|[0-9])*'), ['if', 'while']),
+    )
+
+
+def _token_values(tokens: lexer.TokenStream) -> list[tuple[str, str]]:
+    return [(token.rule_name, token.value) for token in tokens]
+
+
+class DfaLexerTest(unittest.TestCase):
+    def test_equivalent(self):
+        lexer_ = _lexer()
+        for lazy in [False, True]:
+            dfa_lexer = dfa.DfaLexer(lexer_, lazy=lazy, cache_size=4)
+            for input in list[str]([
+                '',
+                'a',
+                'a = 1',
+                'def f == 12\n  x1 = _y',
+                'f(a <= 1) < (2)',
+                'if x while1 while',
+            ]):
+                with self.subTest(lazy=lazy, input=input):
+                    self.assertEqual(
+                        dfa_lexer(lexer.Scope({}), input),
+                        lexer_(lexer.Scope({}), input),
+                    )
+                    state = lexer.CharStream(list(lexer.Source(input)))
+                    self.assertEqual(
+                        dfa_lexer(lexer.Scope({}), state),
+                        lexer_(lexer.Scope({}), state),
+                    )
+
+    def test_load_file(self):
+        lexer_ = _lexer()
+        dfa_lexer = dfa.DfaLexer(lexer_)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = pathlib.Path(directory.name) / 'input'
+        for input in list[str]([
+            'a = 1',
+            'def f == 12\n  x1 = _y',
+        ]):
+            with self.subTest(input=input):
+                path.write_text(input)
+                with lexer.load_file(path) as state:
+                    self.assertIsInstance(state.buffer, lexer.MappedSource)
+                    _, tokens = dfa_lexer(lexer.Scope({}), state)
+                    assert isinstance(tokens.buffer, lexer.ColumnarTokens)
+                    self.assertIs(tokens.buffer.source, state.buffer)
+                    self.assertEqual(tokens, lexer_(lexer.Scope({}), input)[1])
+                for rule in [dfa_lexer, lexer_]:
+                    _, tokens = rule(lexer.Scope({}), path)
+                    assert isinstance(tokens.buffer, lexer.ColumnarTokens)
+                    self.assertIsInstance(tokens.buffer.source, lexer.Source)
+                    self.assertEqual(tokens, lexer_(lexer.Scope({}), input)[1])
+
+    def test_longest_match(self):
+        dfa_lexer = dfa.DfaLexer(lexer.Lexer(
+            _ws=lexer.ReClass(string.whitespace),
+            assign=lexer.ReLiteral('='),
+            eq=regex.literal('=='),
+            def_=regex.literal('def'),
+            id=regex.load('(_|[a-z])(_|[a-z]|[0-9])*'),
+        ))
+        for input, expected in list[Tuple[str, list[tuple[str, str]]]]([
+            ('def', [('def_', 'def')]),
+            ('define', [('id', 'define')]),
+            ('de', [('id', 'de')]),
+            ('a == b', [('id', 'a'), ('eq', '=='), ('id', 'b')]),
+            ('a === b', [('id', 'a'), ('eq', '=='), ('assign', '='), ('id', 'b')]),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                _, tokens = dfa_lexer(lexer.Scope({}), input)
+                self.assertEqual(_token_values(tokens), expected)
+
+    def test_apply_fail(self):
+        lexer_ = _lexer()
+        dfa_lexer = dfa.DfaLexer(lexer_)
+        for input in list[str]([
+            '$',
+            'a = $',
+            'a\n  A',
+        ]):
+            with self.subTest(input=input):
+                with self.assertRaises(processor.FarthestFailureError) as expected:
+                    lexer_(lexer.Scope({}), input)
+                with self.assertRaises(processor.FarthestFailureError) as actual:
+                    dfa_lexer(lexer.Scope({}), input)
+                self.assertEqual(actual.exception.state,
+                                 expected.exception.state)
+
+    def test_rules(self):
+        lexer_ = _lexer()
+        self.assertEqual(dfa.DfaLexer(lexer_).rules, lexer_.rules)
+        self.assertEqual(dfa.DfaLexer(dfa.DfaLexer(lexer_)).rules, lexer_.rules)
+        self.assertEqual(dfa.DfaLexer(lexer_).literals, lexer_.literals)
+
+    def test_relex(self):
+        dfa_lexer = dfa.DfaLexer(_lexer())
+        _, tokens = dfa_lexer(lexer.Scope({}), 'a = de')
+        assert isinstance(tokens.buffer, lexer.ColumnarTokens)
+        relexed, _, _ = dfa_lexer.relex(tokens.buffer, 6, 0, 'fine')
+        self.assertEqual(_token_values(lexer.TokenStream(relexed)),
+                         [('id', 'a'), ('assign', '='), ('id', 'define')])
@@ -0,0 +1,331 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Generic, Mapping, MutableMapping, MutableSequence, Optional, Sequence, TypeVar
+from . import errors, lexer, parser, processor
+
+_Result = TypeVar('_Result')
+
+Item = tuple[int, int, int]
+Cause = tuple[int, Optional[Item]]
+
+_LEO = -1
+
+
+@dataclass(frozen=True)
+class _Production:
+    lhs: int
+    rhs: Sequence[int]
+    build: Callable[[MutableSequence[Any]], Any]
+
+
+def _first(values: MutableSequence[Any]) -> Any:
+    return values[0]
+
+
+def _none(values: MutableSequence[Any]) -> Any:
+    return None
+
+
+def _empty(values: MutableSequence[Any]) -> Any:
+    return []
+
+
+def _append(values: MutableSequence[Any]) -> Any:
+    values[0].append(values[1])
+    return values[0]
+
+
+@dataclass
+class _Grammar:
+    rules: Mapping[str, Callable[..., Any]]
+    productions: MutableSequence[_Production] = field(default_factory=list)
+    by_lhs: MutableSequence[MutableSequence[int]] = field(default_factory=list)
+    names: MutableSequence[str] = field(default_factory=list)
+    nullable: MutableMapping[int, int] = field(default_factory=dict)
+    _symbols: MutableMapping[int | str, int] = field(default_factory=dict)
+    _rules: MutableSequence[Any] = field(default_factory=list)
+
+    @staticmethod
+    def terminal(rule_name: str) -> int:
+        return -lexer.kind(rule_name)-1
+
+    def nonterminal(self, name: str) -> int:
+        self.by_lhs.append([])
+        self.names.append(name)
+        return len(self.names)-1
+
+    def production(self, lhs: int, rhs: Sequence[int], build: Callable[[MutableSequence[Any]], Any]) -> None:
+        self.by_lhs[lhs].append(len(self.productions))
+        self.productions.append(_Production(lhs, rhs, build))
+
+    def symbol(self, rule: Callable[..., Any]) -> int:
+        if isinstance(rule, parser.Terminal):
+            return self.terminal(rule.rule_name)
+        if isinstance(rule, processor.Ref):
+            return self.named(rule.rule_name)
+        if id(rule) in self._symbols:
+            return self._symbols[id(rule)]
+        self._rules.append(rule)
+        lhs = self._symbols[id(rule)] = self.nonterminal(repr(rule))
+        if isinstance(rule, processor.Or):
+            for alt in rule:
+                self.production(lhs, [self.symbol(alt)], _first)
+        elif isinstance(rule, processor.And):
+            self.production(lhs, [self.symbol(element)
+                            for element in rule], list)
+        elif isinstance(rule, processor.ZeroOrMore):
+            self.production(lhs, [], _empty)
+            self.production(lhs, [lhs, self.symbol(rule.rule)], _append)
+        elif isinstance(rule, processor.OneOrMore):
+            child = self.symbol(rule.rule)
+            self.production(lhs, [child], list)
+            self.production(lhs, [lhs, child], _append)
+        elif isinstance(rule, processor.ZeroOrOne):
+            self.production(lhs, [], _none)
+            self.production(lhs, [self.symbol(rule.rule)], _first)
+        elif isinstance(rule, (processor.MultipleResultReducer, processor.OptionalResultReducer)):
+            reduce = rule.reduce
+            self.production(lhs, [self.symbol(rule.rule)],
+                            lambda values: reduce(values[0]))
+        elif isinstance(rule, processor.Cut):
+            self.production(lhs, [self.symbol(rule.rule)], _first)
+        else:
+            raise errors.Error(msg=f'unsupported earley rule {rule}')
+        return lhs
+
+    def named(self, rule_name: str) -> int:
+        if rule_name in self._symbols:
+            return self._symbols[rule_name]
+        if rule_name not in self.rules:
+            raise errors.Error(msg=f'unknown rule {rule_name}')
+        lhs = self._symbols[rule_name] = self.nonterminal(rule_name)
+        self.production(lhs, [self.symbol(self.rules[rule_name])], _first)
+        return lhs
+
+    def solve(self) -> None:
+        changed = True
+        while changed:
+            changed = False
+            for production_index, production in enumerate(self.productions):
+                if production.lhs not in self.nullable and all(symbol in self.nullable for symbol in production.rhs):
+                    self.nullable[production.lhs] = production_index
+                    changed = True
+
+
+@dataclass
+class _Chart:
+    grammar: _Grammar
+    items: MutableSequence[MutableMapping[Item, Cause]] = field(
+        default_factory=list)
+    waiting: MutableSequence[MutableMapping[int, MutableSequence[Item]]] = field(
+        default_factory=list)
+    completed: MutableSequence[MutableMapping[int, set[int]]] = field(
+        default_factory=list)
+    transitive: MutableSequence[MutableMapping[int, Optional[Item]]] = field(
+        default_factory=list)
+    values: MutableSequence[str] = field(default_factory=list)
+
+    def open(self) -> MutableSequence[Item]:
+        self.items.append({})
+        self.waiting.append({})
+        self.completed.append({})
+        self.transitive.append({})
+        return []
+
+    def add(self, items: MutableSequence[Item], item: Item, cause: Cause) -> None:
+        if item not in self.items[-1]:
+            self.items[-1][item] = cause
+            items.append(item)
+
+    def process(self, items: MutableSequence[Item]) -> MutableMapping[int, MutableSequence[Item]]:
+        grammar = self.grammar
+        position = len(self.items)-1
+        waiting = self.waiting[-1]
+        completed = self.completed[-1]
+        scans: MutableMapping[int, MutableSequence[Item]] = {}
+        i = 0
+        while i < len(items):
+            item = items[i]
+            production_index, dot, origin = item
+            i += 1
+            production = grammar.productions[production_index]
+            if dot == len(production.rhs):
+                origins = completed.setdefault(production.lhs, set())
+                if origin in origins:
+                    continue
+                origins.add(origin)
+                if origin < position:
+                    top = self.transition(origin, production.lhs)
+                    if top is not None:
+                        self.add(items, top, (_LEO, item))
+                        continue
+                for parent_index, parent_dot, parent_origin in list(self.waiting[origin].get(production.lhs, [])):
+                    self.add(items, (parent_index, parent_dot+1, parent_origin),
+                             (origin, item))
+                continue
+            symbol = production.rhs[dot]
+            if symbol < 0:
+                scans.setdefault(symbol, []).append(item)
+                continue
+            waiting.setdefault(symbol, []).append(item)
+            for child in grammar.by_lhs[symbol]:
+                self.add(items, (child, 0, position), (position, None))
+            if symbol in grammar.nullable:
+                self.add(items, (production_index, dot+1, origin),
+                         (position, None))
+        return scans
+
+    def parent(self, origin: int, symbol: int) -> Optional[Item]:
+        parents = self.waiting[origin].get(symbol, [])
+        if len(parents) != 1:
+            return None
+        production_index, dot, parent_origin = parents[0]
+        if dot+1 != len(self.grammar.productions[production_index].rhs):
+            return None
+        return parents[0]
+
+    def transition(self, origin: int, symbol: int) -> Optional[Item]:
+        path: set[tuple[int, int]] = set()
+        top: Optional[Item] = None
+        while symbol not in self.transitive[origin]:
+            if (origin, symbol) in path:
+                top = None
+                break
+            parent = self.parent(origin, symbol)
+            if parent is None:
+                break
+            path.add((origin, symbol))
+            production_index, dot, parent_origin = parent
+            top = (production_index, dot+1, parent_origin)
+            origin, symbol = parent_origin, self.grammar.productions[production_index].lhs
+        else:
+            top = self.transitive[origin][symbol] or top
+        self.transitive[origin].setdefault(symbol, None)
+        for origin, symbol in path:
+            self.transitive[origin][symbol] = top
+        return top
+
+    def chain(self, top: Item, item: Item, end: int) -> tuple[Item, int, Any]:
+        child: Any = (item, end, None)
+        origin = item[2]
+        symbol = self.grammar.productions[item[0]].lhs
+        while True:
+            parent = self.parent(origin, symbol)
+            assert parent is not None
+            production_index, dot, parent_origin = parent
+            if (production_index, dot+1, parent_origin) == top:
+                return parent, origin, child
+            child = (parent, origin, child)
+            origin, symbol = parent_origin, self.grammar.productions[production_index].lhs
+
+    def children(self, item: Item, end: int) -> Sequence[Any]:
+        grammar = self.grammar
+        production_index, dot, origin = item
+        rhs = grammar.productions[production_index].rhs
+        children: MutableSequence[Any] = []
+        while dot > 0:
+            left, child = self.items[end][item]
+            if left == _LEO:
+                assert child is not None
+                item, end, chained = self.chain(item, child, end)
+                children.append(chained)
+            elif child is not None:
+                children.append((child, end, None))
+                item, end = (production_index, dot-1, origin), left
+            elif left == end:
+                children.append(rhs[dot-1])
+                item = (production_index, dot-1, origin)
+            else:
+                children.append(self.values[left])
+                item, end = (production_index, dot-1, origin), left
+            dot -= 1
+        return children[::-1]
+
+    def extract(self, symbol: int, end: int) -> Any:
+        grammar = self.grammar
+        frames: MutableSequence[tuple[_Production, Sequence[Any], MutableSequence[Any]]] = []
+
+        def push(node: Any) -> None:
+            if isinstance(node, int):
+                production_index = grammar.nullable[node]
+                frames.append((grammar.productions[production_index],
+                               grammar.productions[production_index].rhs, []))
+            else:
+                item, end, child = node
+                children = self.children(item, end)
+                frames.append((grammar.productions[item[0]],
+                               children if child is None else [*children, child], []))
+
+        for production_index in grammar.by_lhs[symbol]:
+            item = (production_index, len(grammar.productions[production_index].rhs), 0)
+            if item in self.items[end]:
+                push((item, end, None))
+                break
+        else:
+            raise errors.Error(
+                msg=f'no derivation for {grammar.names[symbol]} over [0, {end})')
+        while True:
+            production, children, values = frames[-1]
+            if len(values) < len(children):
+                child = children[len(values)]
+                if isinstance(child, str):
+                    values.append(child)
+                else:
+                    push(child)
+                continue
+            frames.pop()
+            value = production.build(values)
+            if not frames:
+                return value
+            frames[-1][2].append(value)
+
+
+@dataclass(frozen=True, repr=False)
+class Earley(Generic[_Result], processor.AbstractRule[lexer.TokenStream, _Result]):
+    rules: Mapping[str, Callable[..., Any]]
+    root_rule_name: str
+    _grammar: _Grammar = field(init=False, compare=False)
+    _root: int = field(init=False, compare=False)
+
+    def __post_init__(self):
+        grammar = _Grammar(self.rules)
+        root = grammar.nonterminal(f'{self.root_rule_name}!')
+        grammar.production(root, [grammar.named(self.root_rule_name)], _first)
+        grammar.solve()
+        object.__setattr__(self, '_grammar', grammar)
+        object.__setattr__(self, '_root', root)
+
+    def __repr__(self) -> str:
+        return f'Earley({self.root_rule_name})'
+
+    def _recognize(self, state: lexer.TokenStream) -> tuple[_Chart, Sequence[lexer.TokenStream], Optional[int]]:
+        grammar = self._grammar
+        chart = _Chart(grammar)
+        states: MutableSequence[lexer.TokenStream] = [state]
+        items = chart.open()
+        for production_index in grammar.by_lhs[self._root]:
+            chart.add(items, (production_index, 0, 0), (0, None))
+        accepted: Optional[int] = None
+        while True:
+            scans = chart.process(items)
+            if 0 in chart.completed[-1].get(self._root, []):
+                accepted = len(chart.items)-1
+            if state.empty:
+                break
+            scanned = scans.get(-state.head_kind-1)
+            if not scanned:
+                break
+            chart.values.append(state.head_value)
+            state = state.tail
+            states.append(state)
+            items = chart.open()
+            for production_index, dot, origin in scanned:
+                chart.add(items, (production_index, dot+1, origin),
+                          (len(chart.values)-1, None))
+        return chart, states, accepted
+
+    def __call__(self, scope: parser.Scope[_Result], state: lexer.TokenStream) -> parser.StateAndResult[_Result]:
+        chart, states, accepted = self._recognize(state)
+        if accepted is None:
+            raise parser.StateError(
+                msg=f'failed to parse {self.root_rule_name}', state=states[-1])
+        return states[accepted], chart.extract(self._root, accepted)
@@ -0,0 +1,148 @@
+from typing import Any, Callable, Mapping, Sequence, Tuple
+import unittest
+from . import earley, errors, lexer, parser, processor, testing
+
+_T = parser.Terminal
+
+
+class _Binary(parser.ResultReducer[Any]):
+    def reduce(self, results: Sequence[Any]) -> Any:
+        return f'({results[0]}{results[1]}{results[2]})'
+
+
+class _Concat(parser.ResultReducer[Any]):
+    def reduce(self, results: Sequence[Any]) -> Any:
+        return ''.join(result or '' for result in results)
+
+
+class EarleyTest(unittest.TestCase):
+    def test_equivalent(self):
+        for rules, inputs in list[Tuple[Mapping[str, Callable[..., Any]], Sequence[str]]]([
+            (
+                {'a': _Concat(parser.And[Any]([_T('int'), _T('+'), _T('int')]))},
+                ['1 + 2', '1 + 2 ;'],
+            ),
+            (
+                {'a': parser.Or[Any]([_T('int'), _T('+')])},
+                ['1', '+', '1 +'],
+            ),
+            (
+                {'a': _Concat(parser.ZeroOrMore[Any](_T('int')))},
+                ['', '1', '1 2 3', '1 2 +'],
+            ),
+            (
+                {'a': _Concat(parser.OneOrMore[Any](_T('int')))},
+                ['1', '1 2 3', '1 2 +'],
+            ),
+            (
+                {
+                    'a': _Concat(parser.And[Any]([
+                        parser.ZeroOrOne[Any](_T('+')),
+                        parser.Ref[Any]('b'),
+                    ])),
+                    'b': parser.Or[Any]([
+                        _Concat(parser.And[Any]([_T('('), parser.Ref[Any]('a'), _T(')')])),
+                        _T('int'),
+                    ]),
+                },
+                ['1', '+ 1', '( + ( 1 ) )', '( 1 ) )'],
+            ),
+        ]):
+            for input in inputs:
+                with self.subTest(rules=rules, input=input):
+                    self.assertEqual(
+                        earley.Earley[Any](rules, 'a')(
+                            parser.Scope[Any]({}), testing.tokens(input)),
+                        processor.Processor[lexer.TokenStream, Any](rules, 'a')(
+                            parser.Scope[Any]({}), testing.tokens(input)),
+                    )
+
+    def test_left_recursion(self):
+        rule = earley.Earley[Any]({
+            'expr': parser.Or[Any]([
+                _Binary(parser.And[Any]([parser.Ref[Any]('expr'), _T('+'), parser.Ref[Any]('term')])),
+                parser.Ref[Any]('term'),
+            ]),
+            'term': parser.Or[Any]([
+                _Binary(parser.And[Any]([parser.Ref[Any]('term'), _T('*'), _T('int')])),
+                _T('int'),
+            ]),
+        }, 'expr')
+        for input, expected, leftover in list[Tuple[str, str, int]]([
+            ('1', '1', 0),
+            ('1 + 2 + 3', '((1+2)+3)', 0),
+            ('1 + 2 * 3 * 4 + 5', '((1+((2*3)*4))+5)', 0),
+            ('1 + 2 +', '(1+2)', 1),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                state, actual = rule(parser.Scope[Any]({}), testing.tokens(input))
+                self.assertEqual(actual, expected)
+                self.assertEqual(len(state), leftover)
+
+    def test_right_recursion(self):
+        rule = earley.Earley[Any]({
+            'a': parser.Or[Any]([
+                _Binary(parser.And[Any]([_T('int'), _T('+'), parser.Ref[Any]('a')])),
+                _T('int'),
+            ]),
+        }, 'a')
+        for input, expected in list[Tuple[str, str]]([
+            ('1', '1'),
+            ('1 + 2', '(1+2)'),
+            ('1 + 2 + 3 + 4', '(1+(2+(3+4)))'),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                self.assertEqual(rule(parser.Scope[Any]({}), testing.tokens(input)),
+                                 (lexer.TokenStream(), expected))
+        sizes = list[int]()
+        for count in [500, 1000]:
+            chart, _, accepted = rule._recognize(
+                testing.tokens(' + '.join(['1'] * count)))
+            self.assertEqual(accepted, count*2-1)
+            sizes.append(sum(len(items) for items in chart.items))
+        self.assertLess(sizes[1], sizes[0]*2.1)
+        input = ' + '.join(['1'] * 10000)
+        self.assertEqual(rule(parser.Scope[Any]({}), testing.tokens(input))[1].count('('),
+                         9999)
+
+    def test_cyclic(self):
+        rule = earley.Earley[Any]({
+            'a': _Concat(parser.And[Any]([
+                parser.ZeroOrOne[Any](parser.Ref[Any]('a')),
+                parser.Or[Any]([parser.Ref[Any]('a'), _T('int')]),
+            ])),
+        }, 'a')
+        for input in ['1', '1 2', '1 2 3']:
+            with self.subTest(input=input):
+                self.assertEqual(rule(parser.Scope[Any]({}), testing.tokens(input)),
+                                 (lexer.TokenStream(), ''.join(input.split())))
+
+    def test_ambiguous(self):
+        rule = earley.Earley[Any]({
+            'a': parser.Or[Any]([
+                _Concat(parser.And[Any]([parser.Ref[Any]('a'), parser.Ref[Any]('a')])),
+                parser.Ref[Any]('a'),
+                _T('int'),
+            ]),
+        }, 'a')
+        input = ' '.join(['1'] * 40)
+        self.assertEqual(rule(parser.Scope[Any]({}), testing.tokens(input)),
+                         (lexer.TokenStream(), '1' * 40))
+
+    def test_fail(self):
+        rule = earley.Earley[Any](
+            {'a': parser.And[Any]([_T('int'), _T('+')])}, 'a')
+        for input in ['', '1', '+', '1 1']:
+            with self.subTest(input=input):
+                self.assertIsNone(rule.apply(
+                    parser.Scope[Any]({}), testing.tokens(input)))
+
+    def test_unsupported(self):
+        for rules in list[Mapping[str, Callable[..., Any]]]([
+            {'a': parser.Ref[Any]('b')},
+            {'a': lambda scope, state: (state, None)},
+            {'a': parser.UntilEmpty[Any](_T('int'))},
+        ]):
+            with self.subTest(rules=rules):
+                with self.assertRaises(errors.Error):
+                    earley.Earley[Any](rules, 'a')
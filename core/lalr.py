@@ -0,0 +1,341 @@
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+from typing import Any, Callable, Generic, Iterable, Mapping, MutableMapping, MutableSequence, Optional, Sequence, TypeVar
+from . import errors, lexer, parser, processor
+
+_Result = TypeVar('_Result')
+
+EOF = '$'
+_START = '$start'
+_PROPAGATE = '#'
+
+Item = tuple[int, int]
+Action = tuple[str, int]
+SHIFT = 'shift'
+REDUCE = 'reduce'
+ACCEPT = 'accept'
+_ACTION_ORDER = {SHIFT: 0, ACCEPT: 1, REDUCE: 2}
+
+
+@dataclass(frozen=True)
+class Production:
+    lhs: str
+    rhs: Sequence[str]
+    reduce: Optional[Callable[..., Any]] = field(default=None, compare=False)
+
+    def __post_init__(self):
+        if self.reduce is None and len(self.rhs) != 1:
+            raise errors.Error(
+                msg=f'production {self} needs a reduce callback')
+
+    def __str__(self) -> str:
+        return f'{self.lhs} -> {" ".join(self.rhs)}'
+
+
+@dataclass(frozen=True)
+class Grammar:
+    start: str
+    productions: Sequence[Production]
+    nonterminals: frozenset[str] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        nonterminals = frozenset(
+            production.lhs for production in self.productions)
+        if self.start not in nonterminals:
+            raise errors.Error(msg=f'unknown start symbol {self.start}')
+        object.__setattr__(self, 'nonterminals', nonterminals)
+
+    def __str__(self) -> str:
+        return '\n'.join(str(production) for production in self.productions)
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(json.dumps(
+            [self.start, [[production.lhs, list(production.rhs)]
+                          for production in self.productions]]
+        ).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class Tables:
+    key: str
+    action: Sequence[Mapping[str, Action]]
+    goto: Sequence[Mapping[str, int]]
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        with open(path, 'w') as file:
+            json.dump({
+                'key': self.key,
+                'action': [
+                    {terminal: list(action)
+                     for terminal, action in actions.items()}
+                    for actions in self.action
+                ],
+                'goto': [dict(gotos) for gotos in self.goto],
+            }, file)
+
+    @staticmethod
+    def load(path: str | os.PathLike[str]) -> 'Tables':
+        with open(path) as file:
+            data = json.load(file)
+        return Tables(
+            data['key'],
+            [
+                {terminal: (action[0], action[1])
+                 for terminal, action in actions.items()}
+                for actions in data['action']
+            ],
+            data['goto'],
+        )
+
+
+@dataclass
+class _Generator:
+    grammar: Grammar
+    productions: Sequence[Production] = field(init=False)
+    nullable: set[str] = field(default_factory=set)
+    first: MutableMapping[str, set[str]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.productions = [
+            Production(_START, [self.grammar.start])] + list(self.grammar.productions)
+        changed = True
+        while changed:
+            changed = False
+            for production in self.productions:
+                first = self.first.setdefault(production.lhs, set())
+                size = len(first)
+                first |= self.first_of(production.rhs, frozenset())
+                if len(first) != size:
+                    changed = True
+                if production.lhs not in self.nullable and all(symbol in self.nullable for symbol in production.rhs):
+                    self.nullable.add(production.lhs)
+                    changed = True
+
+    def is_terminal(self, symbol: str) -> bool:
+        return symbol not in self.grammar.nonterminals and symbol != _START
+
+    def first_of(self, symbols: Sequence[str], lookaheads: frozenset[str]) -> set[str]:
+        first: set[str] = set()
+        for symbol in symbols:
+            if self.is_terminal(symbol):
+                first.add(symbol)
+                return first
+            first |= self.first.get(symbol, set())
+            if symbol not in self.nullable:
+                return first
+        return first | lookaheads
+
+    def next_symbol(self, item: Item) -> Optional[str]:
+        production_index, dot = item
+        rhs = self.productions[production_index].rhs
+        return rhs[dot] if dot < len(rhs) else None
+
+    def closure(self, items: Mapping[Item, frozenset[str]]) -> Mapping[Item, frozenset[str]]:
+        closure: MutableMapping[Item, frozenset[str]] = dict(items)
+        pending: MutableSequence[Item] = list(items)
+        while pending:
+            item = pending.pop()
+            symbol = self.next_symbol(item)
+            if symbol is None or self.is_terminal(symbol):
+                continue
+            production_index, dot = item
+            lookaheads = frozenset(self.first_of(
+                self.productions[production_index].rhs[dot+1:], closure[item]))
+            for i, production in enumerate(self.productions):
+                if production.lhs != symbol:
+                    continue
+                child = (i, 0)
+                merged = closure.get(child, frozenset()) | lookaheads
+                if merged != closure.get(child):
+                    closure[child] = merged
+                    pending.append(child)
+        return closure
+
+    def kernels(self) -> tuple[Sequence[frozenset[Item]], Sequence[Mapping[str, int]]]:
+        states: MutableSequence[frozenset[Item]] = [frozenset({(0, 0)})]
+        indices: MutableMapping[frozenset[Item], int] = {states[0]: 0}
+        transitions: MutableSequence[Mapping[str, int]] = []
+        for kernel in states:
+            successors: MutableMapping[str, set[Item]] = {}
+            for item in self.closure({item: frozenset() for item in kernel}):
+                symbol = self.next_symbol(item)
+                if symbol is not None:
+                    successors.setdefault(symbol, set()).add(
+                        (item[0], item[1]+1))
+            targets: MutableMapping[str, int] = {}
+            for symbol, items in successors.items():
+                successor = frozenset(items)
+                if successor not in indices:
+                    indices[successor] = len(states)
+                    states.append(successor)
+                targets[symbol] = indices[successor]
+            transitions.append(targets)
+        return states, transitions
+
+    def lookaheads(self, states: Sequence[frozenset[Item]], transitions: Sequence[Mapping[str, int]]) -> Sequence[Mapping[Item, set[str]]]:
+        lookaheads: Sequence[MutableMapping[Item, set[str]]] = [
+            {item: set() for item in kernel} for kernel in states]
+        lookaheads[0][(0, 0)].add(EOF)
+        propagations: MutableMapping[tuple[int, Item], set[tuple[int, Item]]] = {}
+        for state, kernel in enumerate(states):
+            for item in kernel:
+                for child, child_lookaheads in self.closure({item: frozenset({_PROPAGATE})}).items():
+                    symbol = self.next_symbol(child)
+                    if symbol is None:
+                        continue
+                    target = (transitions[state][symbol],
+                              (child[0], child[1]+1))
+                    for lookahead in child_lookaheads:
+                        if lookahead == _PROPAGATE:
+                            propagations.setdefault(
+                                (state, item), set()).add(target)
+                        else:
+                            lookaheads[target[0]][target[1]].add(lookahead)
+        changed = True
+        while changed:
+            changed = False
+            for (state, item), targets in propagations.items():
+                for target_state, target_item in targets:
+                    target = lookaheads[target_state][target_item]
+                    size = len(target)
+                    target |= lookaheads[state][item]
+                    if len(target) != size:
+                        changed = True
+        return lookaheads
+
+    def tables(self) -> Tables:
+        states, transitions = self.kernels()
+        kernel_lookaheads = self.lookaheads(states, transitions)
+        action: MutableSequence[Mapping[str, Action]] = []
+        goto: MutableSequence[Mapping[str, int]] = []
+        for state, kernel in enumerate(states):
+            actions: MutableMapping[str, Action] = {}
+            closure = self.closure(
+                {item: frozenset(kernel_lookaheads[state][item]) for item in kernel})
+
+            def add(terminal: str, action: Action) -> None:
+                existing = actions.get(terminal)
+                if existing is not None and existing != action:
+                    raise errors.Error(
+                        msg=f'{self.conflict(closure, terminal, existing, action)} conflict in state {state} on {terminal}')
+                actions[terminal] = action
+
+            for item, lookaheads in closure.items():
+                symbol = self.next_symbol(item)
+                if symbol is None:
+                    for lookahead in sorted(lookaheads):
+                        add(lookahead, (ACCEPT, 0) if item[0] == 0 else (
+                            REDUCE, item[0]-1))
+                elif self.is_terminal(symbol):
+                    add(symbol, (SHIFT, transitions[state][symbol]))
+            action.append(actions)
+            goto.append({
+                symbol: target
+                for symbol, target in transitions[state].items()
+                if not self.is_terminal(symbol)
+            })
+        return Tables(self.grammar.key, action, goto)
+
+    def describe(self, items: Iterable[Item], terminal: str, action: Action) -> str:
+        kind, arg = action
+        if kind == REDUCE:
+            return str(self.productions[arg+1])
+        if kind == ACCEPT:
+            return str(self.productions[0])
+        shifts: set[str] = set()
+        for production_index, dot in items:
+            production = self.productions[production_index]
+            if self.next_symbol((production_index, dot)) == terminal:
+                shifts.add(
+                    f'{production.lhs} -> {" ".join([*production.rhs[:dot], ".", *production.rhs[dot:]])}')
+        return ' | '.join(sorted(shifts))
+
+    def conflict(self, items: Iterable[Item], terminal: str, lhs: Action, rhs: Action) -> str:
+        if _ACTION_ORDER[lhs[0]] > _ACTION_ORDER[rhs[0]]:
+            lhs, rhs = rhs, lhs
+        return f'{lhs[0]}/{rhs[0]} ({self.describe(items, terminal, lhs)} | {self.describe(items, terminal, rhs)})'
+
+
+def tables(grammar: Grammar, cache_dir: Optional[str | os.PathLike[str]] = None) -> Tables:
+    if cache_dir is None:
+        return _Generator(grammar).tables()
+    path = os.path.join(cache_dir, f'{grammar.key}.json')
+    try:
+        tables_ = Tables.load(path)
+    except (OSError, ValueError, KeyError, IndexError):
+        pass
+    else:
+        if tables_.key == grammar.key:
+            return tables_
+    tables_ = _Generator(grammar).tables()
+    os.makedirs(cache_dir, exist_ok=True)
+    tables_.save(path)
+    return tables_
+
+
+@dataclass(frozen=True, repr=False)
+class ShiftReduce(Generic[_Result], processor.AbstractRule[lexer.TokenStream, _Result]):
+    grammar: Grammar
+    cache_dir: Optional[str | os.PathLike[str]] = field(
+        default=None, compare=False)
+    prefix: bool = field(default=False, kw_only=True)
+    tables: Tables = field(init=False, compare=False)
+    _action: Sequence[Mapping[int, Action]] = field(init=False, compare=False)
+    _eof: Sequence[Optional[Action]] = field(init=False, compare=False)
+    _goto: Sequence[Mapping[str, int]] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        tables_ = tables(self.grammar, self.cache_dir)
+        object.__setattr__(self, 'tables', tables_)
+        object.__setattr__(self, '_action', [
+            {lexer.kind(terminal): action for terminal,
+             action in actions.items() if terminal != EOF}
+            for actions in tables_.action
+        ])
+        object.__setattr__(self, '_eof', [
+            actions.get(EOF) for actions in tables_.action])
+        object.__setattr__(self, '_goto', tables_.goto)
+
+    def __repr__(self) -> str:
+        return f'ShiftReduce({self.grammar.start})'
+
+    def __call__(self, scope: parser.Scope[_Result], state: lexer.TokenStream) -> parser.StateAndResult[_Result]:
+        productions, action_table, eof, goto = self.grammar.productions, self._action, self._eof, self._goto
+        states: MutableSequence[int] = [0]
+        values: MutableSequence[Any] = []
+        at_eof = False
+        while True:
+            action: Optional[Action] = None
+            if not at_eof and not state.empty:
+                action = action_table[states[-1]].get(state.head_kind)
+                if action is None and not self.prefix:
+                    raise parser.StateError(
+                        msg=f'unexpected token in {self.grammar.start}', state=state)
+            if action is None:
+                at_eof = True
+                action = eof[states[-1]]
+            if action is None:
+                raise parser.StateError(
+                    msg=f'unexpected token in {self.grammar.start}', state=state)
+            kind, arg = action
+            if kind == SHIFT:
+                values.append(state.head_value)
+                state = state.tail
+                states.append(arg)
+            elif kind == REDUCE:
+                production = productions[arg]
+                size = len(production.rhs)
+                if size:
+                    args = values[-size:]
+                    del values[-size:]
+                    del states[-size:]
+                else:
+                    args = []
+                values.append(args[0] if production.reduce is None
+                              else production.reduce(*args))
+                states.append(goto[states[-1]][production.lhs])
+            else:
+                return state, values[-1]
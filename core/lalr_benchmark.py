@@ -0,0 +1,91 @@
+'''compare lalr.ShiftReduce with pype's combinator expression parser on pype's operator grammar
+
+run with python -m core.lalr_benchmark from the repo root
+'''
+
+import random
+import time
+from typing import Any, MutableSequence, Sequence
+from . import lalr, lexer, parser
+from pype import builtins_, exprs, pype
+
+_SIZES = [1000, 5000, 25000]
+_OPERANDS = 32
+_SEED = 0
+
+
+def _grammar() -> lalr.Grammar:
+    levels: MutableSequence[MutableSequence[exprs.BinaryOperation.Operator]] = []
+    for operator, precedence in sorted(exprs._PRECEDENCES.items(), key=lambda item: item[1]):
+        if not levels or exprs._PRECEDENCES[levels[-1][0]] != precedence:
+            levels.append([])
+        levels[-1].append(operator)
+    productions: MutableSequence[lalr.Production] = []
+    for level, operators in enumerate(levels):
+        lhs, rhs = f'e{level}', f'e{level+1}'
+        for operator in operators:
+            productions.append(lalr.Production(
+                lhs, [lhs, operator.value, rhs],
+                lambda lhs, operator, rhs: exprs.BinaryOperation.combine(operator, lhs, rhs)))
+        productions.append(lalr.Production(lhs, [rhs]))
+    unary = f'e{len(levels)}'
+    for operator in exprs.UnaryOperation.Operator:
+        productions.append(lalr.Production(
+            unary, [operator.value, unary], exprs.UnaryOperation.combine))
+    productions += [
+        lalr.Production(unary, ['atom']),
+        lalr.Production('atom', ['id'], exprs.ref),
+        lalr.Production('atom', ['int'], lambda value: exprs.literal(
+            builtins_.int_(int(value)))),
+        lalr.Production('atom', ['(', 'e0', ')'],
+                        lambda _, value, __: exprs.ParenExpr(value)),
+    ]
+    return lalr.Grammar('e0', productions)
+
+
+def _operand(rng: random.Random, depth: int) -> str:
+    roll = rng.random()
+    if depth > 0 and roll < 0.1:
+        return f'({_expr(rng, rng.randint(1, 4), depth-1)})'
+    if roll < 0.2:
+        return f'!{_operand(rng, depth)}'
+    if roll < 0.6:
+        return rng.choice('abcdefgh')
+    return str(rng.randint(0, 99))
+
+
+def _expr(rng: random.Random, operands: int, depth: int) -> str:
+    operators: Sequence[str] = [
+        operator.value for operator in exprs.BinaryOperation.Operator]
+    parts = [_operand(rng, depth)]
+    for _ in range(operands-1):
+        parts += [rng.choice(operators), _operand(rng, depth)]
+    return ' '.join(parts)
+
+
+def _time(rule: parser.Rule[Any], tokens: lexer.TokenStream) -> tuple[float, Sequence[Any]]:
+    scope = exprs.Expr.default_scope()
+    results: MutableSequence[Any] = []
+    start = time.perf_counter()
+    while not tokens.empty:
+        tokens, result = rule(scope, tokens)
+        tokens = parser.consume_token(tokens, ';')
+        results.append(result)
+    return time.perf_counter()-start, results
+
+
+def main() -> None:
+    shift_reduce = lalr.ShiftReduce[Any](_grammar(), prefix=True)
+    rng = random.Random(_SEED)
+    for size in _SIZES:
+        input = ''.join(f'{_expr(rng, _OPERANDS, 3)};\n'
+                        for _ in range(size//(2*_OPERANDS)))
+        _, tokens = pype._lexer()(lexer.Scope({}), input)
+        lalr_time, lalr_result = _time(shift_reduce, tokens)
+        combinator_time, combinator_result = _time(exprs.Expr.load, tokens)
+        assert lalr_result == combinator_result
+        print(f'{len(tokens)} tokens: ShiftReduce {lalr_time:.2f}s, Expr.load {combinator_time:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import os
+import tempfile
+from typing import Optional, Tuple
+import unittest
+from . import errors, lalr, lexer, parser, processor, testing
+
+
+def _grammar() -> lalr.Grammar:
+    return lalr.Grammar('expr', [
+        lalr.Production('expr', ['expr', '+', 'term'],
+                        lambda lhs, _, rhs: lhs+rhs),
+        lalr.Production('expr', ['expr', '-', 'term'],
+                        lambda lhs, _, rhs: lhs-rhs),
+        lalr.Production('expr', ['term']),
+        lalr.Production('term', ['term', '*', 'factor'],
+                        lambda lhs, _, rhs: lhs*rhs),
+        lalr.Production('term', ['factor']),
+        lalr.Production('factor', ['int'], int),
+        lalr.Production('factor', ['-', 'factor'], lambda _, value: -value),
+        lalr.Production('factor', ['(', 'expr', ')'],
+                        lambda _, value, __: value),
+    ])
+
+
+class GrammarTest(unittest.TestCase):
+    def test_fail(self):
+        with self.assertRaises(errors.Error):
+            lalr.Grammar('a', [lalr.Production('b', ['c'])])
+        with self.assertRaises(errors.Error):
+            lalr.Production('a', ['b', 'c'])
+
+    def test_key(self):
+        self.assertEqual(_grammar().key, _grammar().key)
+        self.assertNotEqual(_grammar().key, lalr.Grammar(
+            'term', _grammar().productions).key)
+
+
+class TablesTest(unittest.TestCase):
+    def test_conflict(self):
+        for productions, msg in list[Tuple[list[lalr.Production], str]]([
+            (
+                [
+                    lalr.Production('e', ['e', '+', 'e'],
+                                    lambda lhs, _, rhs: lhs+rhs),
+                    lalr.Production('e', ['int'], int),
+                ],
+                'shift/reduce (e -> e . + e | e -> e + e)',
+            ),
+            (
+                [
+                    lalr.Production('e', ['a']),
+                    lalr.Production('e', ['b']),
+                    lalr.Production('a', ['int']),
+                    lalr.Production('b', ['int']),
+                ],
+                'reduce/reduce (a -> int | b -> int)',
+            ),
+            (
+                [
+                    lalr.Production('e', ['e']),
+                    lalr.Production('e', ['int']),
+                ],
+                'accept/reduce ($start -> e | e -> e)',
+            ),
+        ]):
+            with self.subTest(productions=productions, msg=msg):
+                with self.assertRaises(errors.Error) as context:
+                    lalr.tables(lalr.Grammar('e', productions))
+                self.assertIsNotNone(context.exception.msg)
+                assert context.exception.msg is not None
+                self.assertTrue(context.exception.msg.startswith(msg))
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            expected = lalr.tables(_grammar())
+            self.assertEqual(lalr.tables(_grammar(), cache_dir), expected)
+            path = os.path.join(cache_dir, f'{_grammar().key}.json')
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(lalr.Tables.load(path), expected)
+            self.assertEqual(lalr.tables(_grammar(), cache_dir), expected)
+            with open(path, 'w') as file:
+                file.write('garbage')
+            self.assertEqual(lalr.tables(_grammar(), cache_dir), expected)
+            self.assertEqual(lalr.Tables.load(path), expected)
+
+
+class ShiftReduceTest(unittest.TestCase):
+    def test_apply(self):
+        rule = lalr.ShiftReduce[int](_grammar())
+        prefix_rule = lalr.ShiftReduce[int](_grammar(), prefix=True)
+        for input, expected, leftover in list[Tuple[str, int, int]]([
+            ('1', 1, 0),
+            ('1 + 2', 3, 0),
+            ('1 + 2 * 3', 7, 0),
+            ('1 - 2 - 3', -4, 0),
+            ('( 1 + 2 ) * 3', 9, 0),
+            ('- 1 - - 2', 1, 0),
+            ('1 + 2 ;', 3, 1),
+            ('1 2', 1, 1),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                state, actual = prefix_rule(
+                    parser.Scope[int]({}), testing.tokens(input))
+                self.assertEqual(actual, expected)
+                self.assertEqual(len(state), leftover)
+                if not leftover:
+                    self.assertEqual(
+                        rule(parser.Scope[int]({}), testing.tokens(input)), (state, actual))
+
+    def test_apply_fail(self):
+        rule = lalr.ShiftReduce[int](_grammar())
+        for input in ['', '+', '1 +', '( 1', '1 * )']:
+            with self.subTest(input=input):
+                self.assertIsNone(rule.apply(
+                    parser.Scope[int]({}), testing.tokens(input)))
+
+    def test_apply_fail_position(self):
+        rule = lalr.ShiftReduce[int](_grammar())
+        for input, offset in list[Tuple[str, int]]([
+            ('1 2', 1),
+            ('1 + 2 ; 3', 3),
+            ('( 1 + 2 ) ) * 3', 5),
+        ]):
+            with self.subTest(input=input, offset=offset):
+                with self.assertRaises(processor.StateError) as context:
+                    rule(parser.Scope[int]({}), testing.tokens(input))
+                self.assertEqual(context.exception.state.offset, offset)
+
+    def test_nullable(self):
+        rule = lalr.ShiftReduce[Optional[str]](lalr.Grammar('list', [
+            lalr.Production('list', ['item', 'list'],
+                            lambda item, rest: item+(rest or '')),
+            lalr.Production('list', [], lambda: None),
+            lalr.Production('item', ['int']),
+        ]))
+        for input, expected in list[Tuple[str, Optional[str]]]([
+            ('', None),
+            ('1', '1'),
+            ('1 2 3', '123'),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                self.assertEqual(rule(parser.Scope[Optional[str]]({}), testing.tokens(input)),
+                                 (lexer.TokenStream(), expected))
+
+    def test_processor(self):
+        rule = lalr.ShiftReduce[int](_grammar())
+        state, result = parser.Parser[int](
+            {'expr': rule},
+            'expr',
+            lexer.Lexer(
+                _ws=lexer.ReClass.whitespace(),
+                int=lexer.ReOneOrMore(lexer.ReRange('0', '9')),
+                **{
+                    operator: lexer.ReLiteral(operator)
+                    for operator in '+-*()'
+                },
+            ),
+        )(parser.Scope[int]({}), '2 * (3 + 4)')
+        self.assertTrue(state.empty)
+        self.assertEqual(result, 14)
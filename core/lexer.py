@@ -1,5 +1,14 @@
-from dataclasses import dataclass
-from typing import MutableSequence, overload
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+import codecs
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from functools import cached_property, lru_cache
+import mmap
+import os
+import re
+from typing import Callable, Iterable, Iterator, Mapping, MutableMapping, MutableSequence, Optional, Sequence, overload
 from . import errors, processor, stream, regex
 
 
@@ -17,18 +26,158 @@ class Char(regex.Char):
 CharStream = regex.CharStream[Char]
 
 
+_SOURCE_CHAR_CACHE_SIZE = 64
+_MAPPED_DECODE_CHUNK_SIZE = 1 << 20
+_NON_ASCII = re.compile(rb'[\x80-\xff]')
+_NEWLINE = re.compile('\n')
+
+
+@dataclass(frozen=True, repr=False)
+class AbstractSource(Sequence[Char], ABC):
+    _line_starts: Sequence[int] = field(
+        default=(), kw_only=True, compare=False)
+    _char: Callable[[int], Char] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        if not self._line_starts:
+            line_starts = array('q', [0])
+            offset = self._find_newline(0)
+            while offset != -1:
+                line_starts.append(offset+1)
+                offset = self._find_newline(offset+1)
+            object.__setattr__(self, '_line_starts', line_starts)
+        object.__setattr__(self, '_char', lru_cache(
+            maxsize=_SOURCE_CHAR_CACHE_SIZE)(self._load_char))
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def _value(self, index: int) -> str:
+        ...
+
+    @abstractmethod
+    def _find_newline(self, start: int) -> int:
+        ...
+
+    @overload
+    def __getitem__(self, index: int) -> Char:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Char]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> Char | Sequence[Char]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'source index {index} out of range')
+        return self._char(index)
+
+    def _load_char(self, index: int) -> Char:
+        return Char(self._value(index), self.position(index))
+
+    def position(self, offset: int) -> Position:
+        line = bisect_right(self._line_starts, offset)-1
+        return Position(line, offset-self._line_starts[line])
+
+    def offset(self, position: Position) -> int:
+        return self._line_starts[position.line]+position.column
+
+
+@dataclass(frozen=True, repr=False)
+class Source(AbstractSource):
+    text: str
+
+    def __repr__(self) -> str:
+        return repr(self.text)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def _value(self, index: int) -> str:
+        return self.text[index]
+
+    def _find_newline(self, start: int) -> int:
+        return self.text.find('\n', start)
+
+
+@dataclass(frozen=True, repr=False)
+class MappedSource(AbstractSource):
+    mapping: mmap.mmap
+
+    def __post_init__(self):
+        if _NON_ASCII.search(self.mapping) is not None:
+            raise errors.Error(msg='mapped source must be ascii')
+        super().__post_init__()
+
+    def __repr__(self) -> str:
+        return f'MappedSource({len(self)} bytes)'
+
+    def __len__(self) -> int:
+        return len(self.mapping)
+
+    def _value(self, index: int) -> str:
+        return chr(self.mapping[index])
+
+    def _find_newline(self, start: int) -> int:
+        return self.mapping.find(b'\n', start)
+
+    @cached_property
+    def text(self) -> str:
+        with memoryview(self.mapping) as view:
+            return str(view, 'ascii')
+
+
 def load_char_stream(input: str) -> CharStream:
-    line: int = 0
-    column: int = 0
-    chars: MutableSequence[Char] = []
-    for char in input:
-        chars.append(Char(char, Position(line, column)))
-        if char == '\n':
-            line += 1
-            column = 0
-        else:
-            column += 1
-    return CharStream(chars)
+    return CharStream(Source(input))
+
+
+def _decode(mapping: mmap.mmap) -> str:
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks: MutableSequence[str] = []
+    for offset in range(0, len(mapping), _MAPPED_DECODE_CHUNK_SIZE):
+        chunks.append(decoder.decode(
+            mapping[offset:offset+_MAPPED_DECODE_CHUNK_SIZE]))
+    chunks.append(decoder.decode(b'', final=True))
+    return ''.join(chunks)
+
+
+@contextmanager
+def load_file(path: str | os.PathLike[str]) -> Iterator[CharStream]:
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield CharStream(Source(''))
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            source: AbstractSource
+            try:
+                source = MappedSource(mapping)
+            except errors.Error:
+                source = Source(_decode(mapping))
+            yield CharStream(source)
+
+
+def _detach(error: errors.Error, buffer: Sequence[Char]) -> errors.Error:
+    if not isinstance(buffer, MappedSource):
+        return error
+    source = Source(buffer.text)
+
+    def detach(error: errors.Error) -> errors.Error:
+        changes: dict[str, object] = {}
+        if isinstance(error, processor.StateError) and isinstance(error.state, stream.Stream) and error.state.buffer is buffer:
+            changes['state'] = CharStream(source, error.state.offset)
+        if isinstance(error, errors.NaryError):
+            changes['children'] = [detach(child) for child in error.children]
+        if isinstance(error, errors.UnaryError):
+            changes['child'] = detach(error.child)
+        return replace(error, **changes)
+
+    return detach(error)
 
 
 @dataclass(frozen=True)
@@ -37,18 +186,177 @@ class Token(regex.Token):
     position: Position
 
 
+_kinds: MutableMapping[str, int] = {}
+_kind_names: MutableSequence[str] = []
+
+
+def kind(rule_name: str) -> int:
+    if rule_name not in _kinds:
+        _kinds[rule_name] = len(_kind_names)
+        _kind_names.append(rule_name)
+    return _kinds[rule_name]
+
+
+UNKNOWN_KIND = -1
+
+
+def find_kind(rule_name: str) -> int:
+    return _kinds.get(rule_name, UNKNOWN_KIND)
+
+
+def kind_name(kind: int) -> str:
+    return _kind_names[kind]
+
+
+_TOKEN_CACHE_SIZE = 64
+
+
+@dataclass(frozen=True, eq=False)
+class _ShiftedColumn(Sequence[int]):
+    raw: 'array[int]'
+    gap: int
+    shift: int
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    @overload
+    def __getitem__(self, index: int) -> int:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[int]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> int | Sequence[int]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.raw)
+        if not 0 <= index < len(self.raw):
+            raise IndexError(f'column index {index} out of range')
+        value = self.raw[index]
+        return value if index < self.gap else value+self.shift
+
+
+def _raw(column: Sequence[int], typecode: str) -> 'array[int]':
+    return column if isinstance(column, array) else array(typecode, column)
+
+
+def _shifted(values: 'array[int]', shift: int) -> Iterable[int]:
+    return (value+shift for value in values) if shift else values
+
+
+def _splice(column: Sequence[int], start: int, end: int, new: 'array[int]', delta: int) -> _ShiftedColumn:
+    if isinstance(column, _ShiftedColumn):
+        raw, gap, shift = column.raw, column.gap, column.shift
+    else:
+        raw, gap, shift = _raw(column, new.typecode), 0, 0
+    spliced = raw[:min(start, gap)]
+    spliced.extend(_shifted(raw[gap:start], shift))
+    spliced.extend(new)
+    spliced.extend(_shifted(raw[end:gap], -shift))
+    spliced.extend(raw[max(end, gap):])
+    return _ShiftedColumn(spliced, start+len(new), shift+delta)
+
+
+@dataclass(frozen=True, repr=False)
+class ColumnarTokens(Sequence[Token]):
+    source: Source | MappedSource
+    kinds: Sequence[int]
+    starts: Sequence[int]
+    ends: Sequence[int]
+    _token: Callable[[int], Token] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        if not len(self.kinds) == len(self.starts) == len(self.ends):
+            raise errors.Error(msg='mismatched token columns')
+        object.__setattr__(self, '_token', lru_cache(
+            maxsize=_TOKEN_CACHE_SIZE)(self._load_token))
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @overload
+    def __getitem__(self, index: int) -> Token:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Token]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> Token | Sequence[Token]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'token index {index} out of range')
+        return self._token(index)
+
+    def _load_token(self, index: int) -> Token:
+        return Token(
+            self.value(index),
+            kind_name(self.kinds[index]),
+            self.source.position(self.starts[index]),
+        )
+
+    def value(self, index: int) -> str:
+        return self.source.text[self.starts[index]:self.ends[index]]
+
+    @staticmethod
+    def pack(source: Source | MappedSource, tokens: Iterable[Token]) -> 'ColumnarTokens':
+        kinds = array('l')
+        starts = array('q')
+        ends = array('q')
+        for token in tokens:
+            start = source.offset(token.position)
+            kinds.append(kind(token.rule_name))
+            starts.append(start)
+            ends.append(start+len(token.value))
+        return ColumnarTokens(source, kinds, starts, ends)
+
+
+_TOKEN_STREAM_REPR_TOKENS = 8
+
+
 class TokenStream(stream.Stream[Token]):
     def __repr__(self) -> str:
         if len(self) == 0:
             return 'EOF'
-        s = repr([f'{token.rule_name}({token.value})' for token in self])
+        s = repr([f'{token.rule_name}({token.value})' for token in self.prefix(
+            _TOKEN_STREAM_REPR_TOKENS)]+(['...'] if len(self) > _TOKEN_STREAM_REPR_TOKENS else []))
         return f'{repr(s)}@{self.head.position}'
 
     @property
     def tail(self) -> 'TokenStream':
         if self.empty:
             raise errors.Error(msg=f'empty stream')
-        return TokenStream(self._items[1:])
+        return TokenStream(self._items, self._offset+1)
+
+    @property
+    def head_kind(self) -> int:
+        if self.empty:
+            raise errors.Error(msg='empty stream')
+        if isinstance(self._items, ColumnarTokens):
+            return self._items.kinds[self._offset]
+        return find_kind(self._items[self._offset].rule_name)
+
+    @property
+    def head_value(self) -> str:
+        if self.empty:
+            raise errors.Error(msg='empty stream')
+        if isinstance(self._items, ColumnarTokens):
+            return self._items.value(self._offset)
+        return self._items[self._offset].value
 
 
 Rule = processor.Rule[CharStream, TokenStream]
@@ -67,13 +375,13 @@ ReLiteral = regex.Literal[Char]
 ReNot = regex.Not[Char]
 ReClass = regex.Class[Char]
 ReRange = regex.Range[Char]
+ReLiterals = regex.Literals[Char]
 ReScope = regex.Scope[Char]
 
 
-class _ResultCombiner(processor.MultipleResultCombiner[CharStream, TokenStream]):
-    def __call__(self, scope: Scope, state: CharStream) -> StateAndResult:
-        state, results = self.rule(scope, state)
-        return state, sum(results, TokenStream())
+class _ResultCombiner(processor.MultipleResultReducer[CharStream, TokenStream]):
+    def reduce(self, results: Sequence[TokenStream]) -> TokenStream:
+        return TokenStream.concat(results)
 
 
 class _UntilEmpty(_ResultCombiner):
@@ -87,34 +395,125 @@ _REGEX_RULE_NAME = f'{_RULE_PREFIX}_regexes'
 
 
 @dataclass(frozen=True, repr=False)
-class _Regex:
+class Keywords(regex.AbstractRule[Char]):
+    rule: regex.Rule[Char]
+    keywords: Sequence[str]
+    _keywords: frozenset[str] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, '_keywords', frozenset(self.keywords))
+
+    def __repr__(self) -> str:
+        return f'{self.rule}{{{"|".join(self.keywords)}}}'
+
+    def __call__(self, scope: ReScope, state: CharStream) -> regex.StateAndResult[Char]:
+        return self.rule(scope, state)
+
+    def apply(self, scope: ReScope, state: CharStream) -> Optional[regex.StateAndResult[Char]]:
+        return processor.apply(self.rule, scope, state)
+
+    def classify(self, value: str, rule_name: str) -> str:
+        return value if value in self._keywords else rule_name
+
+
+@dataclass(frozen=True, repr=False)
+class _Regex(processor.AbstractRule[CharStream, TokenStream]):
     name: str
     rule: regex.Rule[Char]
 
     def __repr__(self) -> str:
         return f'{self.name}({self.rule})'
 
+    def _token(self, value: str, position: Position) -> Token:
+        if isinstance(self.rule, Keywords):
+            return Token(value, self.rule.classify(value, self.name), position)
+        return Token(value, self.name, position)
+
     def __call__(self, scope: Scope, state: CharStream) -> StateAndResult:
         position = state.head.position
         state, token = self.rule(regex.Scope[Char]({}), state)
         if self.name.startswith('_'):
             return state, TokenStream()
-        return state, TokenStream([Token(token.value, self.name, position)])
+        return state, TokenStream([self._token(token.value, position)])
+
+    def apply(self, scope: Scope, state: CharStream) -> Optional[StateAndResult]:
+        start = state
+        state_and_token = processor.apply(
+            self.rule, regex.Scope[Char]({}), state)
+        if state_and_token is None:
+            return None
+        state, token = state_and_token
+        if self.name.startswith('_'):
+            return state, TokenStream()
+        return state, TokenStream([self._token(token.value, start.head.position)])
+
+
+@dataclass(frozen=True, repr=False)
+class _Literals(processor.AbstractRule[CharStream, TokenStream]):
+    rule: regex.Literals[Char]
+
+    def __repr__(self) -> str:
+        return repr(self.rule)
+
+    def __call__(self, scope: Scope, state: CharStream) -> StateAndResult:
+        result = self.apply(scope, state)
+        if result is None:
+            raise processor.RuleError[CharStream, TokenStream](
+                rule=self, state=state, msg=f'expected one of {self.rule}')
+        return result
+
+    def apply(self, scope: Scope, state: CharStream) -> Optional[StateAndResult]:
+        if isinstance(state.buffer, (Source, MappedSource)):
+            start = state.offset
+            end, index = self.rule.match(
+                state.buffer.text, len(state.buffer), start)
+            if end < 0:
+                return None
+            value = self.rule.values[index]
+            return state.seek(end), TokenStream([Token(value, value, state.head.position)])
+        state_and_token = self.rule.apply(regex.Scope[Char]({}), state)
+        if state_and_token is None:
+            return None
+        next_state, token = state_and_token
+        return next_state, TokenStream([Token(token.value, token.value, state.head.position)])
 
 
 @dataclass(frozen=True, init=False, repr=False)
 class Lexer(processor.Processor[CharStream, TokenStream]):
-    def __init__(self, **rules: regex.Rule[Char]):
+    def __init__(self, literals: Sequence[str] = (), /, **rules: regex.Rule[Char]):
+        for name in list(literals)+list(rules):
+            kind(name)
+        for rule in rules.values():
+            if isinstance(rule, Keywords):
+                for keyword in rule.keywords:
+                    kind(keyword)
+        regexes: MutableSequence[Rule] = [_Regex(name, rule)
+                                          for name, rule in rules.items()]
+        if literals:
+            regexes.insert(0, _Literals(ReLiterals(list(literals))))
         super().__init__(
             {
                 _ROOT_RULE_NAME: _UntilEmpty(_Ref(_REGEX_RULE_NAME)),
-                _REGEX_RULE_NAME: _Or([
-                    _Regex(name, rule) for name, rule in rules.items()
-                ])
+                _REGEX_RULE_NAME: _Or(regexes),
             },
             _ROOT_RULE_NAME,
         )
 
+    @property
+    def literals(self) -> Sequence[str]:
+        regexes = self[_REGEX_RULE_NAME]
+        assert isinstance(regexes, processor.Or)
+        for rule in regexes:
+            if isinstance(rule, _Literals):
+                return rule.rule.values
+        return []
+
+    @property
+    def rules(self) -> Mapping[str, regex.Rule[Char]]:
+        regexes = self[_REGEX_RULE_NAME]
+        assert isinstance(regexes, processor.Or)
+        return {rule.name: rule.rule for rule in regexes if isinstance(rule, _Regex)}
+
     @overload
     def __call__(self, scope: Scope, state: CharStream) -> StateAndResult:
         ...
@@ -123,7 +522,94 @@ class Lexer(processor.Processor[CharStream, TokenStream]):
     def __call__(self, scope: Scope, state: str) -> StateAndResult:
         ...
 
-    def __call__(self, scope: Scope, state: CharStream | str) -> StateAndResult:
+    @overload
+    def __call__(self, scope: Scope, state: os.PathLike[str]) -> StateAndResult:
+        ...
+
+    def __call__(self, scope: Scope, state: CharStream | str | os.PathLike[str]) -> StateAndResult:
+        if isinstance(state, os.PathLike):
+            error: Optional[errors.Error] = None
+            with load_file(state) as char_stream:
+                try:
+                    state, result = super().__call__(scope, char_stream)
+                    if not state.empty:
+                        raise errors.Error(
+                            msg=f'leftover state at {state.offset}')
+                    source = char_stream.buffer
+                    assert isinstance(source, (Source, MappedSource))
+                    if isinstance(source, MappedSource):
+                        source = Source(source.text)
+                    if isinstance(result.buffer, ColumnarTokens):
+                        result = TokenStream(
+                            replace(result.buffer, source=source))
+                    else:
+                        result = TokenStream(
+                            ColumnarTokens.pack(source, result))
+                except errors.Error as lex_error:
+                    error = _detach(lex_error, char_stream.buffer)
+            if error is not None:
+                raise error
+            return CharStream(), result
         if isinstance(state, str):
-            state = load_char_stream(state)
+            source = Source(state)
+            state, result = super().__call__(scope, CharStream(source))
+            if isinstance(result.buffer, ColumnarTokens):
+                return state, result
+            return state, TokenStream(ColumnarTokens.pack(source, result))
         return super().__call__(scope, state)
+
+    def relex(self, tokens: ColumnarTokens, offset: int, deleted: int, inserted: str) -> tuple[ColumnarTokens, int, int]:
+        text = tokens.source.text
+        if offset < 0 or deleted < 0 or offset+deleted > len(text):
+            raise errors.Error(msg=f'invalid edit {offset} {deleted}')
+        delta = len(inserted)-deleted
+        line_starts = array('q', (offset+match.end()
+                                  for match in _NEWLINE.finditer(inserted)))
+        source = Source(
+            text[:offset]+inserted+text[offset+deleted:],
+            _line_starts=_splice(
+                tokens.source._line_starts,
+                bisect_right(tokens.source._line_starts, offset),
+                bisect_right(tokens.source._line_starts, offset+deleted),
+                line_starts,
+                delta,
+            ),
+        )
+        start = bisect_right(tokens.ends, offset-1)
+        if start > 0:
+            start -= 1
+        kinds = array('l')
+        starts = array('q')
+        ends = array('q')
+        regexes = self[_REGEX_RULE_NAME]
+        state = CharStream(source).seek(
+            tokens.starts[start] if start > 0 else 0)
+        while True:
+            position = state.offset-delta
+            if position >= offset+deleted:
+                end = bisect_left(tokens.starts, position)
+                if position == len(text) or (end < len(tokens) and tokens.starts[end] == position):
+                    break
+            if state.empty:
+                end = len(tokens)
+                break
+            state_and_result = processor.apply(regexes, Scope({}), state)
+            if state_and_result is None:
+                raise errors.Error(msg=f'failed to relex at {state.offset}')
+            next_state, result = state_and_result
+            for token in result:
+                kinds.append(kind(token.rule_name))
+                starts.append(state.offset)
+                ends.append(state.offset+len(token.value))
+            state = next_state
+
+        old_kinds = _raw(tokens.kinds, kinds.typecode)
+        spliced = old_kinds[:start]
+        spliced.extend(kinds)
+        spliced.extend(old_kinds[end:])
+        return ColumnarTokens(
+            source,
+            spliced,
+            _splice(tokens.starts, start, end, starts, delta),
+            _splice(tokens.ends, start, end, ends, delta),
+        ), start, end
@@ -1,6 +1,9 @@
+import mmap
+import pathlib
+import tempfile
 from typing import Tuple
 import unittest
-from . import lexer
+from . import errors, lexer, processor
 
 
 class LexerTest(unittest.TestCase):
@@ -28,12 +31,112 @@ class LexerTest(unittest.TestCase):
                     lexer.Token('b', 's', lexer.Position(0, 9)),
                 ]),
             ),
+            (
+                lexer.Lexer(
+                    ['+', '++', '+='],
+                    _ws=lexer.ReClass(' '),
+                    r=lexer.ReOneOrMore(lexer.ReLiteral('a')),
+                ),
+                'a ++ +=a+',
+                lexer.TokenStream([
+                    lexer.Token('a', 'r', lexer.Position(0, 0)),
+                    lexer.Token('++', '++', lexer.Position(0, 2)),
+                    lexer.Token('+=', '+=', lexer.Position(0, 5)),
+                    lexer.Token('a', 'r', lexer.Position(0, 7)),
+                    lexer.Token('+', '+', lexer.Position(0, 8)),
+                ]),
+            ),
+            (
+                lexer.Lexer(
+                    _ws=lexer.ReClass(' '),
+                    r=lexer.Keywords(lexer.ReOneOrMore(
+                        lexer.ReRange('a', 'z')), ['if', 'def']),
+                ),
+                'if define def',
+                lexer.TokenStream([
+                    lexer.Token('if', 'if', lexer.Position(0, 0)),
+                    lexer.Token('define', 'r', lexer.Position(0, 3)),
+                    lexer.Token('def', 'def', lexer.Position(0, 10)),
+                ]),
+            ),
         ]):
             with self.subTest(lexer_=lexer_, input=input, expected_result=expected_result):
                 state, actual_result = lexer_(
                     lexer.Scope({}), input)
                 self.assertEqual(len(state), 0)
                 self.assertEqual(actual_result, expected_result)
+                state, actual_result = lexer_(
+                    lexer.Scope({}), lexer.CharStream(list(lexer.Source(input))))
+                self.assertEqual(len(state), 0)
+                self.assertEqual(actual_result, expected_result)
+
+    def test_relex(self):
+        lexer_ = lexer.Lexer(
+            _ws=lexer.ReOneOrMore(lexer.ReLiteral(' ')),
+            r=lexer.ReOneOrMore(lexer.ReLiteral('a')),
+            s=lexer.ReOneOrMore(lexer.ReLiteral('b')),
+        )
+        for text, offset, deleted, inserted in list[Tuple[str, int, int, str]]([
+            ('', 0, 0, 'ab'),
+            ('aa bb', 0, 0, 'b'),
+            ('aa bb', 1, 0, 'a'),
+            ('aa bb', 2, 1, ''),
+            ('aa bb', 3, 2, 'a'),
+            ('aa bb', 5, 0, ' aa'),
+            ('aa bb aa', 2, 4, ''),
+            ('  aa bb', 0, 1, 'b'),
+        ]):
+            with self.subTest(text=text, offset=offset, deleted=deleted, inserted=inserted):
+                _, state = lexer_(lexer.Scope({}), text)
+                assert isinstance(state.buffer, lexer.ColumnarTokens)
+                actual, start, end = lexer_.relex(
+                    state.buffer, offset, deleted, inserted)
+                expected_text = text[:offset]+inserted+text[offset+deleted:]
+                _, expected = lexer_(lexer.Scope({}), expected_text)
+                self.assertEqual(actual.source.text, expected_text)
+                self.assertEqual(list(actual), list(expected))
+                self.assertEqual(list(actual[:start]), list(state.buffer[:start]))
+                self.assertEqual(list(actual[len(actual)-len(state.buffer)+end:]),
+                                 [lexer.Token(token.value, token.rule_name, actual.source.position(
+                                     state.buffer.starts[end+i]+len(expected_text)-len(text)))
+                                  for i, token in enumerate(state.buffer[end:])])
+
+    def test_relex_repeated(self):
+        lexer_ = lexer.Lexer(
+            _ws=lexer.ReOneOrMore(lexer.ReClass.whitespace()),
+            r=lexer.ReOneOrMore(lexer.ReLiteral('a')),
+            s=lexer.ReOneOrMore(lexer.ReLiteral('b')),
+        )
+        text = 'aa bb\naa\n bb aa\nbb'
+        _, state = lexer_(lexer.Scope({}), text)
+        tokens = state.buffer
+        for offset, deleted, inserted in list[Tuple[int, int, str]]([
+            (15, 0, ' a\n'),
+            (3, 2, 'b\n\nb'),
+            (18, 3, ''),
+            (0, 0, 'b '),
+            (9, 1, ' '),
+            (20, 0, 'aa'),
+        ]):
+            with self.subTest(offset=offset, deleted=deleted, inserted=inserted):
+                assert isinstance(tokens, lexer.ColumnarTokens)
+                tokens, _, _ = lexer_.relex(tokens, offset, deleted, inserted)
+                text = text[:offset]+inserted+text[offset+deleted:]
+                _, expected = lexer_(lexer.Scope({}), text)
+                self.assertEqual(tokens, expected.buffer)
+                self.assertEqual(list(tokens), list(expected))
+
+    def test_relex_fail(self):
+        lexer_ = lexer.Lexer(r=lexer.ReLiteral('a'))
+        _, state = lexer_(lexer.Scope({}), 'aa')
+        assert isinstance(state.buffer, lexer.ColumnarTokens)
+        for offset, deleted, inserted in list[Tuple[int, int, str]]([
+            (0, 3, ''),
+            (1, 0, 'b'),
+        ]):
+            with self.subTest(offset=offset, deleted=deleted, inserted=inserted):
+                with self.assertRaises(errors.Error):
+                    lexer_.relex(state.buffer, offset, deleted, inserted)
 
 
 class CharStreamTest(unittest.TestCase):
@@ -66,3 +169,145 @@ class CharStreamTest(unittest.TestCase):
         ]):
             with self.subTest(input=input, output=output):
                 self.assertEqual(lexer.load_char_stream(input), output)
+
+
+class SourceTest(unittest.TestCase):
+    def test_position(self):
+        for input, offset, output in list[Tuple[str, int, lexer.Position]]([
+            ('abc', 0, lexer.Position(0, 0)),
+            ('abc', 2, lexer.Position(0, 2)),
+            ('abc\ndef', 3, lexer.Position(0, 3)),
+            ('abc\ndef', 4, lexer.Position(1, 0)),
+            ('abc\ndef', 6, lexer.Position(1, 2)),
+            ('\n\n\na', 3, lexer.Position(3, 0)),
+        ]):
+            with self.subTest(input=input, offset=offset, output=output):
+                self.assertEqual(lexer.Source(input).position(offset), output)
+
+    def test_getitem(self):
+        source = lexer.Source('a\nb')
+        self.assertEqual(len(source), 3)
+        self.assertEqual(source[2], lexer.Char('b', lexer.Position(1, 0)))
+        self.assertEqual(source[-1], lexer.Char('b', lexer.Position(1, 0)))
+        self.assertEqual(source[1:], [
+            lexer.Char('\n', lexer.Position(0, 1)),
+            lexer.Char('b', lexer.Position(1, 0)),
+        ])
+        for index in [3, -4]:
+            with self.subTest(index=index):
+                with self.assertRaises(IndexError):
+                    source[index]
+
+    def test_tail(self):
+        self.assertEqual(
+            lexer.load_char_stream('ab\nc').tail.tail.tail,
+            lexer.CharStream([lexer.Char('c', lexer.Position(1, 0))]),
+        )
+
+
+class LoadFileTest(unittest.TestCase):
+    def _write(self, content: bytes) -> pathlib.Path:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = pathlib.Path(directory.name) / 'input'
+        path.write_bytes(content)
+        return path
+
+    def test_load_file(self):
+        for input in list[str]([
+            '',
+            'abc',
+            'abc\ndef',
+            'a\u00e9\nb',
+        ]):
+            with self.subTest(input=input):
+                with lexer.load_file(self._write(input.encode())) as char_stream:
+                    self.assertEqual(
+                        char_stream, lexer.load_char_stream(input))
+
+    def test_apply(self):
+        lexer_ = lexer.Lexer(
+            _ws=lexer.ReClass.whitespace(),
+            r=lexer.ReOneOrMore(lexer.ReLiteral('a')),
+            s=lexer.ReOneOrMore(lexer.ReLiteral('b')),
+        )
+        input = 'aab\nba'
+        state, result = lexer_(lexer.Scope({}), self._write(input.encode()))
+        self.assertTrue(state.empty)
+        self.assertEqual(result, lexer_(lexer.Scope({}), input)[1])
+        assert isinstance(result.buffer, lexer.ColumnarTokens)
+        self.assertEqual(result.buffer.source, lexer.Source(input))
+
+    def test_mapped_source_text(self):
+        with lexer.load_file(self._write(b'ab\nc')) as char_stream:
+            source = char_stream.buffer
+            assert isinstance(source, lexer.MappedSource)
+            self.assertEqual(source.text, 'ab\nc')
+            self.assertIs(source.text, source.text)
+
+    def test_apply_fail(self):
+        lexer_ = lexer.Lexer(r=lexer.ReLiteral('a'))
+        for input, offset in list[Tuple[str, int]]([
+            ('aa b', 2),
+            ('a\u00e9', 1),
+        ]):
+            with self.subTest(input=input, offset=offset):
+                with self.assertRaises(processor.StateError) as context:
+                    lexer_(lexer.Scope({}), self._write(input.encode()))
+                self.assertEqual(context.exception.state.offset, offset)
+                self.assertIn('state=', repr(context.exception))
+
+    def test_mapped_source_fail(self):
+        with open(self._write('\u00e9'.encode()), 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                with self.assertRaises(errors.Error):
+                    lexer.MappedSource(mapping)
+
+
+class ColumnarTokensTest(unittest.TestCase):
+    def test_kind(self):
+        self.assertEqual(lexer.kind('a'), lexer.kind('a'))
+        self.assertNotEqual(lexer.kind('a'), lexer.kind('b'))
+        self.assertEqual(lexer.kind_name(lexer.kind('a')), 'a')
+        self.assertEqual(lexer.find_kind('a'), lexer.kind('a'))
+        self.assertEqual(lexer.TokenStream([
+            lexer.Token('x', '_lexer_test_unknown', lexer.Position(0, 0)),
+        ]).head_kind, lexer.UNKNOWN_KIND)
+        self.assertEqual(lexer.find_kind(
+            '_lexer_test_unknown'), lexer.UNKNOWN_KIND)
+
+    def test_pack(self):
+        source = lexer.Source('ab\nc')
+        tokens = [
+            lexer.Token('ab', 'r', lexer.Position(0, 0)),
+            lexer.Token('c', 's', lexer.Position(1, 0)),
+        ]
+        columns = lexer.ColumnarTokens.pack(source, tokens)
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(list(columns), tokens)
+        self.assertEqual(columns.value(1), 'c')
+        self.assertEqual(columns[-1], tokens[1])
+        for index in [2, -3]:
+            with self.subTest(index=index):
+                with self.assertRaises(IndexError):
+                    columns[index]
+        self.assertEqual(lexer.TokenStream(columns),
+                         lexer.TokenStream(tokens))
+
+    def test_head(self):
+        tokens = [
+            lexer.Token('ab', 'r', lexer.Position(0, 0)),
+            lexer.Token('c', 's', lexer.Position(0, 2)),
+        ]
+        for state in list[lexer.TokenStream]([
+            lexer.TokenStream(tokens),
+            lexer.TokenStream(lexer.ColumnarTokens.pack(
+                lexer.Source('abc'), tokens)),
+        ]):
+            with self.subTest(state=state):
+                self.assertEqual(state.head_kind, lexer.kind('r'))
+                self.assertEqual(state.head_value, 'ab')
+                self.assertEqual(state.tail.head_kind, lexer.kind('s'))
+                self.assertEqual(state.tail.head_value, 'c')
+                with self.assertRaises(errors.Error):
+                    _ = state.tail.tail.head_kind
@@ -1,8 +1,11 @@
-from dataclasses import dataclass
-from typing import Tuple, TypeVar, overload
-from . import lexer, processor, stream
+from dataclasses import dataclass, field
+from enum import Enum
+import os
+from typing import Any, Callable, Generator, Generic, Mapping, MutableMapping, MutableSequence, Optional, Sequence, Tuple, TypeVar, overload
+from . import errors, lexer, processor, stream
 
 _Result = TypeVar('_Result')
+_Callable = TypeVar('_Callable', bound=Callable[..., Any])
 
 StateError = processor.StateError[lexer.TokenStream]
 RuleError = processor.RuleError[lexer.TokenStream, _Result]
@@ -17,10 +20,56 @@ And = processor.And[lexer.TokenStream, _Result]
 ZeroOrMore = processor.ZeroOrMore[lexer.TokenStream, _Result]
 OneOrMore = processor.OneOrMore[lexer.TokenStream, _Result]
 ZeroOrOne = processor.ZeroOrOne[lexer.TokenStream, _Result]
+Cut = processor.Cut[lexer.TokenStream, _Result]
 UntilEmpty = stream.UntilEmpty[lexer.TokenStream, _Result]
 UnaryRule = processor.UnaryRule[lexer.TokenStream, _Result]
 NaryRule = processor.NaryRule[lexer.TokenStream, _Result]
 ResultCombiner = processor.MultipleResultCombiner[lexer.TokenStream, _Result]
+ResultReducer = processor.MultipleResultReducer[lexer.TokenStream, _Result]
+Steps = Generator[processor.Step[lexer.TokenStream, Any],
+                  Any, StateAndResult[_Result]]
+stepped = processor.stepped
+
+
+@dataclass(frozen=True, repr=False, eq=False)
+class _WatchedTokenStream(lexer.TokenStream):
+    watermark: processor.Watermark = field(
+        default_factory=processor.Watermark)
+
+    @property
+    def empty(self) -> bool:
+        self.watermark.examine(self._offset)
+        return super().empty
+
+    @property
+    def tail(self) -> lexer.TokenStream:
+        if self.empty:
+            raise errors.Error(msg='empty stream')
+        return _WatchedTokenStream(self._items, self._offset+1, self.watermark)
+
+    def seek(self, offset: int) -> '_WatchedTokenStream':
+        if offset < 0 or offset > len(self._items):
+            raise errors.Error(msg=f'invalid offset {offset}')
+        return _WatchedTokenStream(self._items, offset, self.watermark)
+
+
+@dataclass(frozen=True)
+class Edit:
+    offset: int
+    deleted: int
+    inserted: str
+
+
+@dataclass(frozen=True)
+class Parse(Generic[_Result]):
+    tokens: lexer.ColumnarTokens
+    result: _Result
+    memo: processor.Memo[lexer.TokenStream, _Result] = field(
+        compare=False, repr=False)
+
+    @property
+    def text(self) -> str:
+        return self.tokens.source.text
 
 
 @dataclass(frozen=True)
@@ -35,25 +84,261 @@ class Parser(processor.Processor[lexer.TokenStream, _Result]):
     def __call__(self, scope: Scope[_Result], state: str) -> StateAndResult[_Result]:
         ...
 
-    def __call__(self, scope: Scope[_Result], state: lexer.TokenStream | str) -> StateAndResult[_Result]:
-        if isinstance(state, str):
+    @overload
+    def __call__(self, scope: Scope[_Result], state: os.PathLike[str]) -> StateAndResult[_Result]:
+        ...
+
+    def __call__(self, scope: Scope[_Result], state: lexer.TokenStream | str | os.PathLike[str]) -> StateAndResult[_Result]:
+        if isinstance(state, (str, os.PathLike)):
             _, state = self.lexer_(lexer.Scope({}), state)
         return super().__call__(scope, state)
 
+    def _parse(self, tokens: lexer.ColumnarTokens, memo: processor.Memo[lexer.TokenStream, _Result]) -> Parse[_Result]:
+        assert memo.watermark is not None
+        state = _WatchedTokenStream(tokens, 0, memo.watermark)
+        scope = self._scope(Scope[_Result]({}), memo)
+        state_and_result = self._apply(scope, state)
+        if state_and_result is None:
+            assert scope.failures is not None
+            raise scope.failures.error(state)
+        _, result = state_and_result
+        return Parse[_Result](tokens, result, memo)
 
-def get_token_value(state: lexer.TokenStream, rule_name: str) -> Tuple[lexer.TokenStream, str]:
-    if state.empty:
-        raise StateError(msg='empty stream', state=state)
-    if state.head.rule_name != rule_name:
-        raise StateError(state=state,
-                         msg=f'expected token {rule_name} got {state.head.rule_name}')
-    return state.tail, state.head.value
+    def parse(self, text: str) -> Parse[_Result]:
+        _, state = self.lexer_(lexer.Scope({}), text)
+        assert isinstance(state.buffer, lexer.ColumnarTokens)
+        return self._parse(state.buffer, processor.Memo[lexer.TokenStream, _Result](
+            self.memo_size, processor.Watermark()))
 
+    def reparse(self, previous: Parse[_Result], edit: Edit) -> Parse[_Result]:
+        '''parse previous's text with edit applied, reusing memoized results outside the edit
+        previous is left unchanged and can be reparsed again. Per-edit Python work is proportional
+        to the distance from the previous edit plus the number of top-level items: the root rule is
+        re-applied from the start and hits the memo once per item, since its reducer's combined
+        result can't be split without knowing the grammar. The first edit of a parse also indexes
+        its memo, and every edit copies the source text, token columns and memo tables in C.
+        '''
+        tokens, start, end = self.lexer_.relex(
+            previous.tokens, edit.offset, edit.deleted, edit.inserted)
+        assert previous.memo.watermark is not None
+        state = _WatchedTokenStream(tokens, 0, previous.memo.watermark)
+        return self._parse(tokens, previous.memo.edit(
+            start, end, len(tokens)-len(previous.tokens), state.seek))
 
-def consume_token(state: lexer.TokenStream, rule_name: str) -> lexer.TokenStream:
+
+def _check_token(state: lexer.TokenStream, kind: int, rule_name: str) -> None:
     if state.empty:
         raise StateError(state=state, msg='empty stream')
-    if state.head.rule_name != rule_name:
+    if kind == lexer.UNKNOWN_KIND:
+        matched = state.head.rule_name == rule_name
+    else:
+        matched = state.head_kind == kind
+    if not matched:
         raise StateError(state=state,
                          msg=f'expected token {rule_name} got {state.head.rule_name}')
+
+
+def get_token_value(state: lexer.TokenStream, rule_name: str) -> Tuple[lexer.TokenStream, str]:
+    _check_token(state, lexer.find_kind(rule_name), rule_name)
+    return state.tail, state.head_value
+
+
+def consume_token(state: lexer.TokenStream, rule_name: str) -> lexer.TokenStream:
+    _check_token(state, lexer.find_kind(rule_name), rule_name)
     return state.tail
+
+
+_FIRST = '_parser_first'
+
+
+@dataclass(frozen=True)
+class Terminal(processor.AbstractRule[lexer.TokenStream, str]):
+    rule_name: str
+    _kind: int = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, '_kind', lexer.kind(self.rule_name))
+
+    def __repr__(self) -> str:
+        return self.rule_name
+
+    def __call__(self, scope: processor.Scope[lexer.TokenStream, str], state: lexer.TokenStream) -> processor.StateAndResult[lexer.TokenStream, str]:
+        _check_token(state, self._kind, self.rule_name)
+        return state.tail, state.head_value
+
+
+def first(*rule_names: str) -> Callable[[_Callable], _Callable]:
+    def decorator(rule: _Callable) -> _Callable:
+        setattr(rule, _FIRST, frozenset(rule_names))
+        return rule
+    return decorator
+
+
+def first_set(rule: Callable[..., Any]) -> Optional[frozenset[str]]:
+    rule_names: Optional[frozenset[str]] = getattr(rule, _FIRST, None)
+    if rule_names is not None:
+        return rule_names
+    if isinstance(rule, Terminal):
+        return frozenset({rule.rule_name})
+    if isinstance(rule, processor.Or):
+        alt_rule_names = [first_set(alt) for alt in rule]
+        if any(rule_names is None for rule_names in alt_rule_names):
+            return None
+        return frozenset[str]().union(*(rule_names for rule_names in alt_rule_names if rule_names is not None))
+    if isinstance(rule, processor.And):
+        return first_set(rule.rules[0]) if rule.rules else None
+    if isinstance(rule, Pratt):
+        operand_rule_names = first_set(rule.rule)
+        if operand_rule_names is None:
+            return None
+        return operand_rule_names | frozenset(rule.prefix)
+    if isinstance(rule, (processor.OneOrMore, processor.Cut, processor.MultipleResultCombiner, processor.OptionalResultCombiner)):
+        return first_set(rule.rule)
+    return None
+
+
+def _enter(rule_name: Optional[str], scope: Scope[Any]) -> None:
+    if rule_name is not None and scope.profiler is not None:
+        scope.profiler.enter(rule_name)
+
+
+def _exit(rule_name: Optional[str], scope: Scope[Any], state: lexer.TokenStream, success: bool) -> None:
+    if rule_name is None:
+        return
+    if not success and scope.failures is not None:
+        scope.failures.record(rule_name, state)
+    if scope.profiler is not None:
+        scope.profiler.exit(rule_name, success)
+
+
+@dataclass(frozen=True, repr=False)
+class PredictiveOr(processor.Or[lexer.TokenStream, _Result]):
+    rule_name: Optional[str] = field(default=None, kw_only=True)
+    _table: Mapping[int, Sequence[Rule[_Result]]] = field(
+        init=False, compare=False)
+    _fallback: Sequence[Rule[_Result]] = field(init=False, compare=False)
+    _expected: Sequence[str] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        alt_rule_names = [first_set(rule) for rule in self.rules]
+        expected = frozenset[str]().union(
+            *(rule_names for rule_names in alt_rule_names if rule_names is not None))
+        table: MutableMapping[int, Sequence[Rule[_Result]]] = {}
+        for rule_name in expected:
+            table[lexer.kind(rule_name)] = [
+                rule
+                for rule, rule_names in zip(self.rules, alt_rule_names)
+                if rule_names is None or rule_name in rule_names
+            ]
+        object.__setattr__(self, '_table', table)
+        object.__setattr__(self, '_fallback', [
+            rule
+            for rule, rule_names in zip(self.rules, alt_rule_names)
+            if rule_names is None
+        ])
+        object.__setattr__(self, '_expected', sorted(expected))
+
+    def candidates(self, state: lexer.TokenStream) -> Sequence[Rule[_Result]]:
+        if state.empty:
+            return self._fallback
+        return self._table.get(state.head_kind, self._fallback)
+
+    def error(self, state: lexer.TokenStream, children: Sequence[errors.Error]) -> errors.Error:
+        return RuleError[_Result](
+            rule=self,
+            state=state,
+            msg=f'expected one of {self._expected}' if self._expected and not self._fallback else 'no alternative applied',
+        )
+
+    def steps(self, scope: Scope[_Result], state: lexer.TokenStream) -> processor.Steps[lexer.TokenStream, _Result, _Result]:
+        _enter(self.rule_name, scope)
+        result = yield from super().steps(scope, state)
+        _exit(self.rule_name, scope, state, result is not None)
+        return result
+
+
+@dataclass(frozen=True)
+class Infix(Generic[_Result]):
+    class Associativity(Enum):
+        LEFT = 'left'
+        RIGHT = 'right'
+
+    precedence: int
+    combine: Callable[[str, _Result, _Result], _Result]
+    associativity: Associativity = Associativity.LEFT
+
+
+@dataclass(frozen=True)
+class Prefix(Generic[_Result]):
+    precedence: int
+    combine: Callable[[str, _Result], _Result]
+
+
+@dataclass(frozen=True, repr=False)
+class Pratt(processor.Stepped[lexer.TokenStream, _Result, _Result], processor.UnaryRule[lexer.TokenStream, _Result]):
+    infix: Mapping[str, Infix[_Result]] = field(default_factory=dict)
+    prefix: Mapping[str, Prefix[_Result]] = field(default_factory=dict)
+    rule_name: Optional[str] = field(default=None, kw_only=True)
+    _infix: Mapping[int, Infix[_Result]] = field(init=False, compare=False)
+    _prefix: Mapping[int, Prefix[_Result]] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        for rule_name, operator in list[Tuple[str, Infix[_Result] | Prefix[_Result]]]([
+            *self.infix.items(),
+            *self.prefix.items(),
+        ]):
+            if operator.precedence < 0:
+                raise errors.Error(
+                    msg=f'negative precedence for operator {rule_name}')
+        object.__setattr__(self, '_infix', {
+            lexer.kind(rule_name): operator for rule_name, operator in self.infix.items()})
+        object.__setattr__(self, '_prefix', {
+            lexer.kind(rule_name): operator for rule_name, operator in self.prefix.items()})
+
+    def __repr__(self) -> str:
+        return f'{self.rule}[{" ".join([*self.prefix, *self.infix])}]'
+
+    def steps(self, scope: Scope[_Result], state: lexer.TokenStream) -> processor.Steps[lexer.TokenStream, _Result, _Result]:
+        _enter(self.rule_name, scope)
+        result = yield from self._climb(scope, state, 0)
+        _exit(self.rule_name, scope, state, result is not None)
+        return result
+
+    def _climb(self, scope: Scope[_Result], state: lexer.TokenStream, min_precedence: int) -> processor.Steps[lexer.TokenStream, _Result, _Result]:
+        prefix = None if state.empty else self._prefix.get(state.head_kind)
+        if prefix is None:
+            state_and_lhs = yield self.rule, scope, state
+            if state_and_lhs is None:
+                return None
+            state, lhs = state_and_lhs
+        else:
+            operator = state.head_value
+            state_and_operand = yield _Climb(self, prefix.precedence), scope, state.tail
+            if state_and_operand is None:
+                return None
+            state, operand = state_and_operand
+            lhs = prefix.combine(operator, operand)
+        while not state.empty:
+            infix = self._infix.get(state.head_kind)
+            if infix is None or infix.precedence < min_precedence:
+                break
+            operator = state.head_value
+            state_and_rhs = yield _Climb(
+                self,
+                infix.precedence +
+                (1 if infix.associativity is Infix.Associativity.LEFT else 0),
+            ), scope, state.tail
+            if state_and_rhs is None:
+                return None
+            state, rhs = state_and_rhs
+            lhs = infix.combine(operator, lhs, rhs)
+        return state, lhs
+
+
+@dataclass(frozen=True)
+class _Climb(processor.Stepped[lexer.TokenStream, _Result, _Result]):
+    pratt: Pratt[_Result]
+    min_precedence: int
+
+    def steps(self, scope: Scope[_Result], state: lexer.TokenStream) -> processor.Steps[lexer.TokenStream, _Result, _Result]:
+        return self.pratt._climb(scope, state, self.min_precedence)
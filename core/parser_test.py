@@ -1,11 +1,11 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
 import string
 import operator
-from typing import Callable, Iterator, Mapping, Tuple
+from typing import Callable, Iterator, Mapping, MutableSequence, Optional, Sequence, Tuple
 import unittest
-from . import errors, lexer, parser
+from . import errors, lexer, parser, processor, testing
 
 
 @dataclass(frozen=True, repr=False)
@@ -82,7 +82,7 @@ class _Operation(_Expr):
         return _Int(funcs[self.operator](self.lhs.eval(scope).value, self.rhs.eval(scope).value))
 
 
-def _load_expr(input: str) -> _Expr:
+def _expr_parser() -> parser.Parser[_Expr]:
     def load_int(scope: parser.Scope[_Expr], state: lexer.TokenStream) -> parser.StateAndResult[_Expr]:
         state, value = parser.get_token_value(state, 'int')
         return state, _Literal(_Int(int(value)))
@@ -97,7 +97,7 @@ def _load_expr(input: str) -> _Expr:
         state, rhs = parser.Ref[_Expr]('operand')(scope, state)
         return state, _Operation(_Operation.Operator(operator), lhs, rhs)
 
-    parser_state, parser_result = parser.Parser[_Expr](
+    return parser.Parser[_Expr](
         {
             'expr': parser.Or[_Expr]([
                 parser.Ref[_Expr]('operation'),
@@ -129,8 +129,11 @@ def _load_expr(input: str) -> _Expr:
             ]),
         )
 
-    )(parser.Scope[_Expr]({}), input)
+    )
+
 
+def _load_expr(input: str) -> _Expr:
+    parser_state, parser_result = _expr_parser()(parser.Scope[_Expr]({}), input)
     if not parser_state.empty:
         raise errors.Error(msg=f'leftover state {parser_state}')
     return parser_result
@@ -166,3 +169,270 @@ class LoadTest(unittest.TestCase):
                     })),
                     val
                 )
+
+
+def _token_rule(rule_name: str) -> parser.Rule[str]:
+    @parser.first(rule_name)
+    def inner(scope: parser.Scope[str], state: lexer.TokenStream) -> parser.StateAndResult[str]:
+        return parser.get_token_value(state, rule_name)
+    return inner
+
+
+def _unknown_rule(scope: parser.Scope[str], state: lexer.TokenStream) -> parser.StateAndResult[str]:
+    if state.empty:
+        return state, ''
+    return parser.get_token_value(state, 'b')
+
+
+def _pratt() -> parser.Pratt[str]:
+    def infix(precedence: int, associativity: parser.Infix.Associativity = parser.Infix.Associativity.LEFT) -> parser.Infix[str]:
+        return parser.Infix[str](precedence, lambda operator, lhs, rhs: f'({lhs}{operator}{rhs})', associativity)
+
+    return parser.Pratt[str](
+        _token_rule('int'),
+        infix={
+            '+': infix(1),
+            '-': infix(1),
+            '*': infix(2),
+            '^': infix(3, parser.Infix.Associativity.RIGHT),
+        },
+        prefix={
+            '-': parser.Prefix[str](4, lambda operator, operand: f'({operator}{operand})'),
+        },
+    )
+
+
+class FirstSetTest(unittest.TestCase):
+    def test_first_set(self):
+        for rule, expected in list[Tuple[parser.Rule[str], Optional[frozenset[str]]]]([
+            (_token_rule('a'), frozenset({'a'})),
+            (_unknown_rule, None),
+            (parser.Or[str]([_token_rule('a'), _token_rule('b')]),
+             frozenset({'a', 'b'})),
+            (parser.Or[str]([_token_rule('a'), _unknown_rule]), None),
+            (parser.Or[str]([]), frozenset()),
+            (parser.And[str]([_token_rule('a'), _token_rule('b')]),
+             frozenset({'a'})),
+            (parser.OneOrMore[str](_token_rule('a')), frozenset({'a'})),
+            (parser.ZeroOrMore[str](_token_rule('a')), None),
+            (parser.ZeroOrOne[str](_token_rule('a')), None),
+            (parser.Ref[str]('a'), None),
+            (_pratt(), frozenset({'int', '-'})),
+            (parser.Pratt[str](_unknown_rule), None),
+        ]):
+            with self.subTest(rule=rule, expected=expected):
+                self.assertEqual(parser.first_set(rule), expected)
+
+
+class PredictiveOrTest(unittest.TestCase):
+    def test_apply(self):
+        rules = list[parser.Rule[str]]([
+            _token_rule('a'),
+            _unknown_rule,
+            _token_rule('b'),
+            _token_rule('c'),
+        ])
+        for state in list[lexer.TokenStream]([
+            lexer.TokenStream(),
+            lexer.TokenStream([lexer.Token('1', 'a', lexer.Position(0, 0))]),
+            lexer.TokenStream([lexer.Token('2', 'b', lexer.Position(0, 0))]),
+            lexer.TokenStream([lexer.Token('3', 'c', lexer.Position(0, 0))]),
+            lexer.TokenStream([lexer.Token('4', 'd', lexer.Position(0, 0))]),
+        ]):
+            with self.subTest(state=state):
+                or_ = parser.Or[str](rules)
+                predictive_or = parser.PredictiveOr[str](rules)
+                self.assertEqual(
+                    predictive_or.apply(parser.Scope[str]({}), state),
+                    or_.apply(parser.Scope[str]({}), state),
+                )
+                try:
+                    expected = or_(parser.Scope[str]({}), state)
+                except errors.Error:
+                    with self.assertRaises(errors.Error):
+                        predictive_or(parser.Scope[str]({}), state)
+                else:
+                    self.assertEqual(predictive_or(
+                        parser.Scope[str]({}), state), expected)
+
+    def test_profile(self):
+        predictive_or = parser.PredictiveOr[str](
+            [_token_rule('a'), _token_rule('b')], rule_name='ab')
+        profiler = processor.Profiler()
+        scope = parser.Scope[str]({}, profiler=profiler)
+        a = lexer.TokenStream([lexer.Token('1', 'a', lexer.Position(0, 0))])
+        c = lexer.TokenStream([lexer.Token('3', 'c', lexer.Position(0, 0))])
+        predictive_or(scope, a)
+        with self.assertRaises(errors.Error):
+            predictive_or(scope, c)
+        self.assertIsNotNone(predictive_or.apply(scope, a))
+        self.assertIsNone(processor.run(predictive_or, scope, c))
+        profile = profiler.rules['ab']
+        self.assertEqual((profile.calls, profile.successes,
+                         profile.failures), (4, 2, 2))
+
+    def test_call_fail(self):
+        predictive_or = parser.PredictiveOr[str](
+            [_token_rule('a'), _token_rule('b')], rule_name='ab')
+        failures = processor.Failures[lexer.TokenStream]()
+        c = lexer.TokenStream([lexer.Token('3', 'c', lexer.Position(0, 0))])
+        with self.assertRaises(processor.RuleError) as context:
+            predictive_or(parser.Scope[str]({}, failures=failures), c)
+        self.assertEqual(context.exception.children, [])
+        self.assertEqual(context.exception.msg, "expected one of ['a', 'b']")
+        self.assertEqual(failures.expected, {'ab'})
+
+    def test_candidates(self):
+        a, b = _token_rule('a'), _token_rule('b')
+        predictive_or = parser.PredictiveOr[str]([a, _unknown_rule, b])
+        for state, expected in list[Tuple[lexer.TokenStream, list[parser.Rule[str]]]]([
+            (lexer.TokenStream(), [_unknown_rule]),
+            (lexer.TokenStream([lexer.Token('1', 'a', lexer.Position(0, 0))]),
+             [a, _unknown_rule]),
+            (lexer.TokenStream([lexer.Token('2', 'b', lexer.Position(0, 0))]),
+             [_unknown_rule, b]),
+            (lexer.TokenStream([lexer.Token('3', 'c', lexer.Position(0, 0))]),
+             [_unknown_rule]),
+        ]):
+            with self.subTest(state=state):
+                self.assertEqual(
+                    list(predictive_or.candidates(state)), expected)
+
+
+class _Sum(parser.ResultReducer[int]):
+    def reduce(self, results: Sequence[int]) -> int:
+        return sum(results)
+
+
+class ReparseTest(unittest.TestCase):
+    def test_reparse(self):
+        expr_parser = _expr_parser()
+        for text, edit in list[Tuple[str, parser.Edit]]([
+            ('1 + 2', parser.Edit(0, 1, '3')),
+            ('1 + 2', parser.Edit(4, 1, 'a')),
+            ('1 + 2', parser.Edit(1, 0, '0')),
+            ('1 + 2', parser.Edit(1, 4, '')),
+            ('a', parser.Edit(1, 0, ' + b')),
+            ('a + b', parser.Edit(0, 0, '  ')),
+        ]):
+            with self.subTest(text=text, edit=edit):
+                previous = expr_parser.parse(text)
+                actual = expr_parser.reparse(previous, edit)
+                expected_text = text[:edit.offset] + \
+                    edit.inserted+text[edit.offset+edit.deleted:]
+                self.assertEqual(actual.text, expected_text)
+                self.assertEqual(actual, expr_parser.parse(expected_text))
+
+    def test_reuse(self):
+        calls: MutableSequence[int] = []
+
+        def load_int(scope: parser.Scope[int], state: lexer.TokenStream) -> parser.StateAndResult[int]:
+            calls.append(state.offset)
+            state, value = parser.get_token_value(state, 'int')
+            return state, int(value)
+
+        sum_parser = parser.Parser[int](
+            {
+                'sum': _Sum(parser.UntilEmpty[int](parser.Ref[int]('int'))),
+                'int': load_int,
+            },
+            'sum',
+            lexer.Lexer(
+                _ws=lexer.ReClass(string.whitespace),
+                int=lexer.ReOneOrMore(lexer.ReClass(string.digits)),
+            ),
+        )
+        text = ' '.join(map(str, range(100)))
+        previous = sum_parser.parse(text)
+        self.assertEqual(previous.result, sum(range(100)))
+        calls.clear()
+        actual = sum_parser.reparse(previous, parser.Edit(text.index(' 50 ')+1, 2, '1000'))
+        self.assertEqual(actual.result, sum(range(100))-50+1000)
+        self.assertLess(len(calls), 3)
+        self.assertEqual(actual, sum_parser.parse(actual.text))
+        memo_size = len(previous.memo)
+        for edit in [
+            parser.Edit(text.index(' 20 ')+1, 2, '7'),
+            parser.Edit(text.index(' 80 ')+1, 2, '8 9'),
+        ]:
+            with self.subTest(edit=edit):
+                calls.clear()
+                actual = sum_parser.reparse(previous, edit)
+                self.assertLess(len(calls), 4)
+                self.assertEqual(actual, sum_parser.parse(actual.text))
+                self.assertEqual(len(previous.memo), memo_size)
+
+    def test_reparse_repeated(self):
+        calls: MutableSequence[int] = []
+
+        def load_int(scope: parser.Scope[int], state: lexer.TokenStream) -> parser.StateAndResult[int]:
+            calls.append(state.offset)
+            state, value = parser.get_token_value(state, 'int')
+            return state, int(value)
+
+        sum_parser = parser.Parser[int](
+            {
+                'sum': _Sum(parser.UntilEmpty[int](parser.Ref[int]('int'))),
+                'int': load_int,
+            },
+            'sum',
+            lexer.Lexer(
+                _ws=lexer.ReClass(string.whitespace),
+                int=lexer.ReOneOrMore(lexer.ReClass(string.digits)),
+            ),
+        )
+        actual = sum_parser.parse(' '.join(map(str, range(100))))
+        for edit in [
+            parser.Edit(100, 2, '1000 1'),
+            parser.Edit(10, 1, ''),
+            parser.Edit(250, 0, ' 7\n8'),
+            parser.Edit(0, 2, ''),
+            parser.Edit(104, 4, '5'),
+        ]:
+            with self.subTest(edit=edit):
+                calls.clear()
+                actual = sum_parser.reparse(actual, edit)
+                self.assertLess(len(calls), 6)
+                self.assertEqual(actual, sum_parser.parse(actual.text))
+
+
+class PrattTest(unittest.TestCase):
+    def test_apply(self):
+        for input, expected in list[Tuple[str, str]]([
+            ('1', '1'),
+            ('1 + 2', '(1+2)'),
+            ('1 + 2 * 3', '(1+(2*3))'),
+            ('1 * 2 + 3', '((1*2)+3)'),
+            ('1 - 2 - 3', '((1-2)-3)'),
+            ('1 ^ 2 ^ 3', '(1^(2^3))'),
+            ('1 * 2 ^ 3 * 4', '((1*(2^3))*4)'),
+            ('- 1 + 2', '((-1)+2)'),
+            ('1 - - 2', '(1-(-2))'),
+            ('1 + 2 )', '(1+2)'),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                state, actual = _pratt()(
+                    parser.Scope[str]({}), testing.tokens(input))
+                self.assertEqual(actual, expected)
+                self.assertEqual(len(state), 1 if input.endswith(')') else 0)
+
+    def test_apply_fail(self):
+        for input in ['', '+', '1 +', '1 * -', '- -']:
+            with self.subTest(input=input):
+                self.assertIsNone(_pratt().apply(
+                    parser.Scope[str]({}), testing.tokens(input)))
+
+    def test_profile(self):
+        pratt = replace(_pratt(), rule_name='expr')
+        profiler = processor.Profiler()
+        scope = parser.Scope[str]({}, profiler=profiler)
+        pratt(scope, testing.tokens('1 + 2'))
+        self.assertIsNone(pratt.apply(scope, testing.tokens('1 +')))
+        profile = profiler.rules['expr']
+        self.assertEqual((profile.calls, profile.successes,
+                         profile.failures), (2, 1, 1))
+
+    def test_negative_precedence(self):
+        with self.assertRaises(errors.Error):
+            parser.Pratt[str](_token_rule('int'), prefix={
+                '-': parser.Prefix[str](-1, lambda operator, operand: operand)})
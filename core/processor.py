@@ -1,11 +1,19 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Callable, Generic, Iterable, Iterator, Mapping, MutableSequence, Optional, Sequence, Sized, TypeVar
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from copy import copy
+from dataclasses import dataclass, field, fields, replace
+from functools import wraps
+import sys
+import time
+from types import MethodType
+from typing import Any, Callable, Generator, Generic, Iterable, Iterator, Mapping, MutableMapping, MutableSequence, Optional, ParamSpec, Sequence, Sized, TypeVar
 from . import errors
 
 
 _State = TypeVar('_State')
 _Result = TypeVar('_Result')
+_Output = TypeVar('_Output')
 
 
 StateAndResult = tuple[_State, _Result]
@@ -49,6 +57,17 @@ class RuleError(StateError[_State], Generic[_State, _Result]):
         return self._repr(0)
 
 
+@dataclass(frozen=True, kw_only=True, repr=False)
+class FarthestFailureError(StateError[_State]):
+    expected: Sequence[str]
+
+    def _repr_line(self) -> str:
+        return f'{super()._repr_line()} expected={self.expected}'
+
+    def __repr__(self) -> str:
+        return self._repr(0)
+
+
 @dataclass(frozen=True, kw_only=True, repr=False)
 class RuleNameError(errors.UnaryError):
     rule_name: str
@@ -60,9 +79,375 @@ class RuleNameError(errors.UnaryError):
         return self._repr(0)
 
 
+class Positioned(ABC):
+    @property
+    @abstractmethod
+    def offset(self) -> int:
+        ...
+
+
+MemoEntry = StateAndResult[_State, _Result] | errors.Error
+
+
+@dataclass
+class Watermark:
+    high: int = -1
+
+    def examine(self, offset: int) -> None:
+        if offset > self.high:
+            self.high = offset
+
+    def mark(self) -> int:
+        mark = self.high
+        self.high = -1
+        return mark
+
+    def extent(self, mark: int) -> int:
+        extent = self.high
+        self.high = max(mark, extent)
+        return extent
+
+
+_BASE = 1 << 62
+
+
+@dataclass
+class _MemoLayout:
+    gap: int = sys.maxsize
+    base: int = 0
+    generation: int = 0
+    seek: Optional[Callable[[int], Any]] = None
+    front: MutableSequence[tuple[int, int, str]] = field(default_factory=list)
+    back: MutableSequence[tuple[int, str]] = field(default_factory=list)
+    stamps: MutableMapping[tuple[str, int], tuple[int, int]] = field(
+        default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Memo(Generic[_State, _Result]):
+    max_size: Optional[int] = None
+    watermark: Optional[Watermark] = field(default=None, compare=False)
+    _entries: OrderedDict[tuple[str, int], MemoEntry[_State, _Result]] = field(
+        default_factory=OrderedDict, compare=False)
+    _cuts: set[tuple[str, int]] = field(default_factory=set, compare=False)
+    _extents: MutableMapping[tuple[str, int], int] = field(
+        default_factory=dict, compare=False)
+    _layout: _MemoLayout = field(default_factory=_MemoLayout, compare=False)
+
+    def __post_init__(self):
+        if self.max_size is not None and self.max_size < 1:
+            raise errors.Error(msg=f'invalid memo max_size {self.max_size}')
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _key(self, rule_name: str, offset: int) -> tuple[str, int]:
+        if offset < self._layout.gap:
+            return rule_name, offset
+        return rule_name, offset-self._layout.base
+
+    def _offset(self, stored: int) -> int:
+        return stored if stored >= 0 else stored+self._layout.base
+
+    def _extent(self, key: tuple[str, int]) -> int:
+        extent = self._extents[key]
+        return extent if key[1] >= 0 else extent+self._layout.base
+
+    def get(self, rule_name: str, offset: int) -> Optional[MemoEntry[_State, _Result]]:
+        key = self._key(rule_name, offset)
+        if key not in self._entries:
+            return None
+        entry = self._entries[key]
+        if self._layout.seek is not None:
+            entry = self._rebind(key, offset, entry)
+            if entry is None:
+                return None
+        self._entries.move_to_end(key)
+        if self.watermark is not None and key in self._extents:
+            self.watermark.examine(self._extent(key))
+        return entry
+
+    def _rebind(self, key: tuple[str, int], offset: int, entry: MemoEntry[_State, _Result]) -> Optional[MemoEntry[_State, _Result]]:
+        layout = self._layout
+        generation, bound = layout.stamps.get(key, (0, offset))
+        if generation == layout.generation:
+            return entry
+        shift = offset-bound
+        if isinstance(entry, errors.Error):
+            if shift:
+                self._drop(key)
+                return None
+        else:
+            state, result = entry
+            if not isinstance(state, Positioned):
+                self._drop(key)
+                return None
+            entry = layout.seek(state.offset+shift), result
+            self._entries[key] = entry
+        layout.stamps[key] = layout.generation, offset
+        return entry
+
+    def set(self, rule_name: str, offset: int, entry: MemoEntry[_State, _Result], cut: bool = False, extent: Optional[int] = None) -> None:
+        key = self._key(rule_name, offset)
+        layout = self._layout
+        if layout.seek is not None and key in self._entries:
+            self._unindex(key)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if cut:
+            self._cuts.add(key)
+        if extent is not None:
+            self._extents[key] = extent if key[1] >= 0 else extent-layout.base
+        if layout.seek is not None:
+            self._index(key)
+            layout.stamps[key] = layout.generation, offset
+        if self.max_size is not None and len(self._entries) > self.max_size:
+            self._forget(self._entries.popitem(last=False)[0])
+
+    def _front(self, key: tuple[str, int]) -> tuple[int, int, str]:
+        rule_name, offset = key
+        return max(offset, self._extents.get(key, sys.maxsize)), offset, rule_name
+
+    def _index(self, key: tuple[str, int]) -> None:
+        if key[1] >= 0:
+            insort(self._layout.front, self._front(key))
+        else:
+            insort(self._layout.back, (key[1], key[0]))
+
+    def _unindex(self, key: tuple[str, int]) -> None:
+        if key[1] >= 0:
+            index, item = self._layout.front, self._front(key)
+        else:
+            index, item = self._layout.back, (key[1], key[0])
+        position = bisect_left(index, item)
+        if position < len(index) and index[position] == item:
+            del index[position]
+
+    def _drop(self, key: tuple[str, int]) -> None:
+        del self._entries[key]
+        self._forget(key)
+
+    def _forget(self, key: tuple[str, int]) -> None:
+        if self._layout.seek is not None:
+            self._unindex(key)
+        self._release(key)
+
+    def _release(self, key: tuple[str, int]) -> None:
+        self._cuts.discard(key)
+        self._extents.pop(key, None)
+        self._layout.stamps.pop(key, None)
+
+    def cut(self, rule_name: str, offset: int) -> bool:
+        return self._key(rule_name, offset) in self._cuts
+
+    def discard(self, offset: int) -> None:
+        for key in [key for key in self._entries if self._offset(key[1]) < offset]:
+            self._drop(key)
+
+    def edit(self, start: int, end: int, delta: int, seek: Callable[[int], _State]) -> 'Memo[_State, _Result]':
+        layout = self._layout
+        memo = Memo[_State, _Result](
+            self.max_size,
+            self.watermark,
+            OrderedDict(self._entries),
+            set(self._cuts),
+            dict(self._extents),
+            replace(layout, front=list(layout.front), back=list(
+                layout.back), stamps=dict(layout.stamps)),
+        )
+        memo._shift(start, end, delta, seek)
+        return memo
+
+    def _shift(self, start: int, end: int, delta: int, seek: Callable[[int], _State]) -> None:
+        layout = self._layout
+        if layout.seek is None:
+            layout.base = _BASE
+            layout.front = sorted(self._front(key) for key in self._entries)
+        position = bisect_left(layout.front, (start,))
+        spanning = layout.front[position:]
+        del layout.front[position:]
+        position = bisect_left(layout.back, (end-layout.base,))
+        following = layout.back[:position]
+        del layout.back[:position]
+        moved: MutableSequence[tuple[str, int]] = []
+        for _, offset, rule_name in spanning:
+            key = rule_name, offset
+            if offset >= end:
+                moved.append(self._rekey(key, offset-layout.base, -layout.base))
+            else:
+                del self._entries[key]
+                self._release(key)
+        for stored, rule_name in following:
+            key = rule_name, stored
+            if key in self._extents and max(stored, self._extents[key])+layout.base < start:
+                moved.append(self._rekey(key, stored+layout.base, layout.base))
+            else:
+                del self._entries[key]
+                self._release(key)
+        for key in moved:
+            self._index(key)
+        layout.base += delta
+        layout.gap = end+delta
+        layout.generation += 1
+        layout.seek = seek
+
+    def _rekey(self, key: tuple[str, int], stored: int, shift: int) -> tuple[str, int]:
+        moved = key[0], stored
+        self._entries[moved] = self._entries.pop(key)
+        if key in self._cuts:
+            self._cuts.remove(key)
+            self._cuts.add(moved)
+        if key in self._extents:
+            self._extents[moved] = self._extents.pop(key)+shift
+        self._layout.stamps[moved] = self._layout.stamps.pop(
+            key, (0, self._offset(key[1])))
+        return moved
+
+
+@dataclass
+class Failures(Generic[_State]):
+    state: Optional[_State] = None
+    offset: int = -1
+    expected: set[str] = field(default_factory=set)
+
+    def record(self, rule_name: str, state: _State) -> None:
+        if not isinstance(state, Positioned) or state.offset < self.offset:
+            return
+        if state.offset > self.offset:
+            self.state = state
+            self.offset = state.offset
+            self.expected = set()
+        if not rule_name.startswith('_'):
+            self.expected.add(rule_name)
+
+    def error(self, state: _State) -> FarthestFailureError[_State]:
+        if self.state is None:
+            return FarthestFailureError[_State](state=state, expected=[], msg='failed to apply rule')
+        expected = sorted(self.expected)
+        return FarthestFailureError[_State](
+            state=self.state,
+            expected=expected,
+            msg=f'expected one of {expected}' if expected else 'unexpected input',
+        )
+
+
+@dataclass
+class Cuts:
+    _frames: MutableSequence[bool] = field(default_factory=list)
+    _open: int = 0
+    _low: int = sys.maxsize
+
+    def enter(self) -> None:
+        self._frames.append(False)
+        self._open += 1
+
+    def exit(self) -> bool:
+        cut = self._frames.pop()
+        if not cut:
+            self._open -= 1
+        return cut
+
+    def cut(self) -> None:
+        self._low = min(self._low, len(self._frames))
+        if self._frames and not self._frames[-1]:
+            self._frames[-1] = True
+            self._open -= 1
+
+    def mark(self) -> tuple[int, int]:
+        mark = len(self._frames), self._low
+        self._low = sys.maxsize
+        return mark
+
+    def escaped(self, mark: tuple[int, int]) -> bool:
+        depth, low = mark
+        escaped = self._low <= depth
+        self._low = min(low, self._low)
+        return escaped
+
+    @property
+    def committed(self) -> bool:
+        return self._open == 0
+
+
+@dataclass
+class RuleProfile:
+    calls: int = 0
+    successes: int = 0
+    failures: int = 0
+    cumulative_time: float = 0
+    self_time: float = 0
+    backtracks: int = 0
+
+
+@dataclass
+class _Frame:
+    profile: RuleProfile
+    start: float
+    child_time: float = 0
+
+
+@dataclass
+class Profiler:
+    rules: MutableMapping[str, RuleProfile] = field(default_factory=dict)
+    _frames: MutableSequence[_Frame] = field(default_factory=list)
+    _active: MutableMapping[str, int] = field(default_factory=dict)
+
+    def enter(self, rule_name: str) -> None:
+        if rule_name not in self.rules:
+            self.rules[rule_name] = RuleProfile()
+        profile = self.rules[rule_name]
+        profile.calls += 1
+        self._active[rule_name] = self._active.get(rule_name, 0) + 1
+        self._frames.append(_Frame(profile, time.perf_counter()))
+
+    def exit(self, rule_name: str, success: bool) -> None:
+        frame = self._frames.pop()
+        elapsed = time.perf_counter() - frame.start
+        if success:
+            frame.profile.successes += 1
+        else:
+            frame.profile.failures += 1
+        frame.profile.self_time += elapsed - frame.child_time
+        self._active[rule_name] -= 1
+        if not self._active[rule_name]:
+            frame.profile.cumulative_time += elapsed
+        if self._frames:
+            self._frames[-1].child_time += elapsed
+
+    def backtrack(self) -> None:
+        if self._frames:
+            self._frames[-1].profile.backtracks += 1
+
+    def table(self, key: str = 'cumulative_time') -> str:
+        columns = [column.name for column in fields(RuleProfile)]
+        if key not in columns:
+            raise errors.Error(msg=f'unknown profile key {key}')
+        rows = [['rule'] + columns] + [
+            [rule_name] + [
+                f'{value:.6f}' if isinstance(value, float) else str(value)
+                for value in (getattr(profile, column) for column in columns)
+            ]
+            for rule_name, profile in sorted(self.rules.items(), key=lambda item: getattr(item[1], key), reverse=True)
+        ]
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(rows[0]))]
+        return '\n'.join(
+            ' '.join([row[0].ljust(widths[0])] + [cell.rjust(width)
+                     for cell, width in zip(row[1:], widths[1:])])
+            for row in rows
+        )
+
+
 @dataclass(frozen=True)
 class Scope(Generic[_State, _Result], Mapping[str, Rule[_State, _Result]]):
     _rules: Mapping[str, Rule[_State, _Result]]
+    memo: Optional[Memo[_State, _Result]] = field(
+        default=None, kw_only=True, compare=False)
+    failures: Optional[Failures[_State]] = field(
+        default=None, kw_only=True, compare=False)
+    profiler: Optional[Profiler] = field(
+        default=None, kw_only=True, compare=False)
+    cuts: Optional[Cuts] = field(default=None, kw_only=True, compare=False)
 
     def __repr__(self) -> str:
         return repr(self._rules)
@@ -72,6 +457,9 @@ class Scope(Generic[_State, _Result], Mapping[str, Rule[_State, _Result]]):
             raise errors.Error(msg=f'unknown rule {name}')
         return self._rules[name]
 
+    def __contains__(self, name: object) -> bool:
+        return name in self._rules
+
     def __len__(self) -> int:
         return len(self._rules)
 
@@ -81,53 +469,430 @@ class Scope(Generic[_State, _Result], Mapping[str, Rule[_State, _Result]]):
     def __or__(self, rhs: 'Scope[_State,_Result]') -> 'Scope[_State,_Result]':
         return Scope[_State, _Result](dict(self._rules) | dict(rhs._rules))
 
+    def nested(self, scope: 'Scope[_State, _Output]') -> 'Scope[_State, _Output]':
+        if self.failures is None and self.profiler is None:
+            return scope
+        return Scope[_State, _Output](scope._rules, failures=self.failures, profiler=self.profiler)
 
-class AbstractRule(Generic[_State, _Result], ABC):
-    @abstractmethod
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndResult[_State, _Result]:
-        ...
+
+Step = tuple[Callable[[Scope[_State, _Result], _State],
+                      tuple[_State, Any]], Scope[_State, _Result], _State]
+Steps = Generator[Step[_State, _Result],
+                  Optional[tuple[_State, Any]], Optional[tuple[_State, _Output]]]
 
 
-class AbstractMultipleResultRule(Generic[_State, _Result], ABC):
+class _Applicable(Generic[_State, _Result, _Output], ABC):
     @abstractmethod
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndMultipleResult[_State, _Result]:
+    def __call__(self, scope: Scope[_State, _Result], state: _State) -> tuple[_State, _Output]:
         ...
 
+    def apply(self, scope: Scope[_State, _Result], state: _State) -> Optional[tuple[_State, _Output]]:
+        try:
+            return self(scope, state)
+        except errors.Error:
+            return None
+
+
+class AbstractRule(_Applicable[_State, _Result, _Result]):
+    ...
+
+
+class AbstractMultipleResultRule(_Applicable[_State, _Result, Sequence[_Result]]):
+    ...
+
+
+class AbstractOptionalResultRule(_Applicable[_State, _Result, Optional[_Result]]):
+    ...
+
+
+class Stepped(_Applicable[_State, _Result, _Output]):
+    '''a rule whose steps yield (rule, scope, state) per child and are sent its result, or None on failure'''
 
-class AbstractOptionalResultRule(Generic[_State, _Result], ABC):
     @abstractmethod
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndOptionalResult[_State, _Result]:
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, _Output]:
         ...
 
+    def error(self, state: _State, children: Sequence[errors.Error]) -> errors.Error:
+        if children:
+            return children[-1]
+        return RuleError[_State, Any](rule=self, state=state, msg='rule failed')
+
+    def __call__(self, scope: Scope[_State, _Result], state: _State) -> tuple[_State, _Output]:
+        return _call_steps(self, state, self.steps(scope, state))
+
+    def apply(self, scope: Scope[_State, _Result], state: _State) -> Optional[tuple[_State, _Output]]:
+        return _apply_steps(self.steps(scope, state))
+
+
+_GENERATOR = '_processor_generator'
+
+_Params = ParamSpec('_Params')
+_Return = TypeVar('_Return')
+
+
+def stepped(func: Callable[_Params, Generator[Any, Any, _Return]]) -> Callable[_Params, _Return]:
+    '''make a rule from a generator function like Stepped.steps, which sees failed children as errors.Error'''
+    @wraps(func)
+    def rule(*args: _Params.args, **kwargs: _Params.kwargs) -> _Return:
+        return _call_steps(rule, args[-1], _generated(func(*args, **kwargs)))
+    setattr(rule, _GENERATOR, func)
+    return rule
+
+
+def _generated(steps: Generator[Step[Any, Any], Any, _Return]) -> Generator[Step[Any, Any], Optional[tuple[Any, Any]], Optional[_Return]]:
+    try:
+        step = next(steps)
+        while True:
+            result = yield step
+            if result is None:
+                step = steps.throw(_FAILURE.with_traceback(None))
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def _steps(rule: Callable[[Scope[_State, _Result], _State], tuple[_State, _Output]], scope: Scope[_State, _Result], state: _State) -> Optional[Steps[_State, _Result, _Output]]:
+    if isinstance(rule, Stepped):
+        return rule.steps(scope, state)
+    func = getattr(rule, _GENERATOR, None)
+    if func is None:
+        return None
+    if isinstance(rule, MethodType):
+        return _generated(func(rule.__self__, scope, state))
+    return _generated(func(scope, state))
+
+
+def _apply_steps(steps: Generator[Step[_State, _Result], Optional[tuple[_State, Any]], Optional[_Return]]) -> Optional[_Return]:
+    result: Optional[tuple[_State, Any]] = None
+    try:
+        while True:
+            rule, scope, state = steps.send(result)
+            result = apply(rule, scope, state)
+    except StopIteration as stop:
+        return stop.value
+    except errors.Error:
+        return None
+
+
+def _call_steps(rule: Callable[..., Any], state: _State, steps: Generator[Step[_State, _Result], Optional[tuple[_State, Any]], Optional[_Return]]) -> _Return:
+    children: MutableSequence[errors.Error] = []
+    result: Optional[tuple[_State, Any]] = None
+    while True:
+        try:
+            child, child_scope, child_state = steps.send(result)
+        except StopIteration as stop:
+            if stop.value is None:
+                raise _step_error(rule, state, children)
+            return stop.value
+        except errors.Error as error:
+            if error is _FAILURE:
+                raise _step_error(rule, state, children) from None
+            raise
+        try:
+            result = child(child_scope, child_state)
+        except errors.Error as error:
+            children.append(error)
+            result = None
+
+
+def apply(rule: Callable[[Scope[_State, _Result], _State], tuple[_State, _Output]], scope: Scope[_State, _Result], state: _State) -> Optional[tuple[_State, _Output]]:
+    if isinstance(rule, _Applicable):
+        return rule.apply(scope, state)
+    steps = _steps(rule, scope, state)
+    if steps is not None:
+        return _apply_steps(steps)
+    try:
+        return rule(scope, state)
+    except errors.Error:
+        return None
+
+
+def run(rule: Callable[[Scope[_State, _Result], _State], tuple[_State, _Output]], scope: Scope[_State, _Result], state: _State) -> Optional[tuple[_State, _Output]]:
+    stack: MutableSequence[Steps[_State, _Result, Any]] = []
+    result: Optional[tuple[_State, Any]] = None
+    child: Callable[[Scope[_State, _Result], _State],
+                    tuple[_State, Any]] = rule
+    while True:
+        steps = _steps(child, scope, state)
+        if steps is None:
+            result = apply(child, scope, state)
+        else:
+            stack.append(steps)
+            result = None
+        while stack:
+            try:
+                child, scope, state = stack[-1].send(result)
+                break
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+            except errors.Error:
+                stack.pop()
+                result = None
+        else:
+            return result
+
+
+def _step_error(rule: Callable[..., Any], state: _State, children: Sequence[errors.Error]) -> errors.Error:
+    if isinstance(rule, Stepped):
+        return rule.error(state, children)
+    if children:
+        return children[-1]
+    return RuleError[_State, Any](rule=rule, state=state, msg='rule failed')
+
+
+def trace(rule: Callable[[Scope[_State, _Result], _State], tuple[_State, _Output]], scope: Scope[_State, _Result], state: _State) -> tuple[_State, _Output]:
+    stack: MutableSequence[tuple[Steps[_State, _Result, Any],
+                                 Callable[..., Any], _State, MutableSequence[errors.Error]]] = []
+    result: Optional[tuple[_State, Any]] = None
+    error: Optional[errors.Error] = None
+    child: Callable[[Scope[_State, _Result], _State],
+                    tuple[_State, Any]] = rule
+    while True:
+        steps = _steps(child, scope, state)
+        if steps is None:
+            try:
+                result, error = child(scope, state), None
+            except errors.Error as child_error:
+                result, error = None, child_error
+        else:
+            stack.append((steps, child, state, []))
+            result, error = None, None
+        while stack:
+            steps, frame_rule, frame_state, frame_errors = stack[-1]
+            if error is not None:
+                frame_errors.append(error)
+                error = None
+            try:
+                child, scope, state = steps.send(result)
+                break
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                if result is None:
+                    error = _step_error(frame_rule, frame_state, frame_errors)
+            except errors.Error as step_error:
+                stack.pop()
+                result = None
+                error = _step_error(frame_rule, frame_state, frame_errors) if step_error is _FAILURE else step_error
+        else:
+            if result is None:
+                assert error is not None
+                raise error
+            return result
+
+
+_FAILURE = errors.Error(msg='rule failed')
+
+
+@dataclass
+class _MergedRules(Generic[_State, _Result]):
+    rules: Optional[Mapping[str, Rule[_State, _Result]]] = None
+    merged: Optional[Mapping[str, Rule[_State, _Result]]] = None
+
 
 @dataclass(frozen=True)
-class Processor(Scope[_State, _Result], AbstractRule[_State, _Result]):
+class Processor(Stepped[_State, _Result, _Result], Scope[_State, _Result]):
     root_rule_name: str
+    packrat: bool = field(default=False, kw_only=True)
+    memo_size: Optional[int] = field(default=None, kw_only=True)
+    debug: bool = field(default=False, kw_only=True)
+    profile: bool = field(default=False, kw_only=True)
+    iterative: bool = field(default=False, kw_only=True)
+    strict: bool = field(default=False, kw_only=True)
+    unresolved: frozenset[str] = field(
+        default=frozenset(), init=False, compare=False)
+    _merged: _MergedRules[_State, _Result] = field(
+        default_factory=_MergedRules, init=False, compare=False, repr=False)
 
     def __post_init__(self):
         if self.root_rule_name not in self:
             raise errors.Error(
                 msg=f'root_rule_name {self.root_rule_name} not found')
+        self._link()
+        if self.strict and self.unresolved:
+            raise errors.Error(
+                msg=f'unknown rules {sorted(self.unresolved)}')
+        if self.profile and self.profiler is None:
+            object.__setattr__(self, 'profiler', Profiler())
+
+    def _link(self) -> None:
+        linked: MutableMapping[int, Callable[..., object]] = {}
+        refs: MutableSequence[Ref[_State, _Result]] = []
+        rules = {
+            name: self._linked(rule, linked, refs)
+            for name, rule in self._rules.items()
+        }
+        unresolved: set[str] = set()
+        for ref in refs:
+            if ref.rule_name in rules:
+                object.__setattr__(ref, '_rule', rules[ref.rule_name])
+            else:
+                unresolved.add(ref.rule_name)
+        object.__setattr__(self, '_rules', rules)
+        object.__setattr__(self, 'unresolved', frozenset(unresolved))
+
+    @staticmethod
+    def _linked(rule: Any, linked: MutableMapping[int, Callable[..., object]], refs: MutableSequence['Ref[_State, _Result]']) -> Any:
+        if id(rule) in linked:
+            return linked[id(rule)]
+        if isinstance(rule, Ref):
+            result = replace(rule)
+            refs.append(result)
+        else:
+            rules = children(rule)
+            linked_rules = [Processor._linked(
+                child, linked, refs) for child in rules]
+            if all(a is b for a, b in zip(rules, linked_rules)):
+                result = rule
+            else:
+                result = with_children(rule, linked_rules)
+        linked[id(rule)] = result
+        return result
+
+    def _merged_rules(self, rules: Mapping[str, Rule[_State, _Result]]) -> Mapping[str, Rule[_State, _Result]]:
+        if not rules or rules is self._rules:
+            return self._rules
+        if self._merged.rules is not rules or self._merged.merged is None:
+            self._merged.rules = rules
+            self._merged.merged = dict(rules) | dict(self._rules)
+        return self._merged.merged
+
+    def _scope(self, scope: Scope[_State, _Result], memo: Optional[Memo[_State, _Result]] = None) -> Scope[_State, _Result]:
+        if memo is None and self.packrat:
+            memo = Memo[_State, _Result](self.memo_size)
+        return Scope[_State, _Result](
+            self._merged_rules(scope._rules),
+            memo=memo,
+            failures=Failures[_State](),
+            profiler=scope.profiler if self.profiler is None else self.profiler,
+            cuts=Cuts(),
+        )
+
+    def _apply(self, scope: Scope[_State, _Result], state: _State) -> Optional[StateAndResult[_State, _Result]]:
+        root = self[self.root_rule_name]
+        apply_ = run if self.iterative else apply
+        if scope.profiler is None:
+            return apply_(root, scope, state)
+        scope.profiler.enter(self.root_rule_name)
+        result = apply_(root, scope, state)
+        scope.profiler.exit(self.root_rule_name, result is not None)
+        return result
+
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, _Result]:
+        scope = self._scope(scope)
+        if scope.profiler is not None:
+            scope.profiler.enter(self.root_rule_name)
+        result = yield self[self.root_rule_name], scope, state
+        if scope.profiler is not None:
+            scope.profiler.exit(self.root_rule_name, result is not None)
+        return result
 
     def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndResult[_State, _Result]:
-        return self[self.root_rule_name](scope | self, state)
+        scope = self._scope(scope)
+        result = self._apply(scope, state)
+        if result is not None:
+            return result
+        if self.debug:
+            if self.iterative:
+                return trace(self[self.root_rule_name], self._scope(scope), state)
+            return self[self.root_rule_name](self._scope(scope), state)
+        assert scope.failures is not None
+        raise scope.failures.error(state)
+
+    def apply(self, scope: Scope[_State, _Result], state: _State) -> Optional[StateAndResult[_State, _Result]]:
+        return self._apply(self._scope(scope), state)
 
 
 @dataclass(frozen=True)
-class Ref(Generic[_State, _Result], AbstractRule[_State, _Result]):
+class Ref(Stepped[_State, _Result, _Result]):
     rule_name: str
-
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndResult[_State, _Result]:
-        if self.rule_name not in scope:
+    _rule: Optional[Rule[_State, _Result]] = field(
+        default=None, init=False, compare=False, repr=False)
+
+    def _resolve(self, scope: Scope[_State, _Result]) -> Optional[Rule[_State, _Result]]:
+        if self._rule is not None:
+            return self._rule
+        return scope._rules.get(self.rule_name)
+
+    def _memo_get(self, memo: Memo[_State, _Result], scope: Scope[_State, _Result], offset: int) -> Optional[MemoEntry[_State, _Result]]:
+        entry = memo.get(self.rule_name, offset)
+        if entry is not None and scope.cuts is not None and memo.cut(self.rule_name, offset):
+            scope.cuts.cut()
+        return entry
+
+    @staticmethod
+    def _memo_mark(memo: Memo[_State, _Result], scope: Scope[_State, _Result]) -> tuple[Optional[tuple[int, int]], int]:
+        return (
+            None if scope.cuts is None else scope.cuts.mark(),
+            -1 if memo.watermark is None else memo.watermark.mark(),
+        )
+
+    def _memo_set(self, memo: Memo[_State, _Result], scope: Scope[_State, _Result], offset: int, entry: MemoEntry[_State, _Result], mark: tuple[Optional[tuple[int, int]], int]) -> None:
+        cuts_mark, watermark_mark = mark
+        memo.set(
+            self.rule_name,
+            offset,
+            entry,
+            scope.cuts is not None and cuts_mark is not None and scope.cuts.escaped(
+                cuts_mark),
+            None if memo.watermark is None else memo.watermark.extent(
+                watermark_mark),
+        )
+
+    def error(self, state: _State, children: Sequence[errors.Error]) -> errors.Error:
+        if not children or self.rule_name.startswith('_'):
+            return super().error(state, children)
+        return RuleNameError(rule_name=self.rule_name, child=children[-1])
+
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, _Result]:
+        rule = self._resolve(scope)
+        if rule is None:
             raise errors.Error(msg=f'unknown rule {self.rule_name}')
-        try:
-            return scope[self.rule_name](scope, state)
-        except errors.Error as error:
-            if self.rule_name.startswith('_'):
-                raise error from error
+        if scope.profiler is not None:
+            scope.profiler.enter(self.rule_name)
+        result: Optional[StateAndResult[_State, _Result]]
+        if scope.memo is None or not isinstance(state, Positioned):
+            result = yield rule, scope, state
+        else:
+            entry = self._memo_get(scope.memo, scope, state.offset)
+            if entry is None:
+                mark = self._memo_mark(scope.memo, scope)
+                result = yield rule, scope, state
+                self._memo_set(scope.memo, scope, state.offset,
+                               _FAILURE if result is None else result, mark)
+            elif isinstance(entry, errors.Error):
+                result = None
             else:
-                raise RuleNameError(rule_name=self.rule_name,
-                                    child=error) from error
+                result = entry
+        if result is None and scope.failures is not None:
+            scope.failures.record(self.rule_name, state)
+        if scope.profiler is not None:
+            scope.profiler.exit(self.rule_name, result is not None)
+        return result
+
+
+def children(rule: Callable[..., object]) -> Sequence[Callable[..., object]]:
+    if isinstance(rule, (NaryRule, NaryMultipleResultRule, NaryOptionalResultRule)):
+        return rule.rules
+    if isinstance(rule, (UnaryRule, UnaryMultipleResultRule, UnaryOptionalResultRule, MultipleResultCombiner, OptionalResultCombiner)):
+        return [rule.rule]
+    return []
+
+
+def with_children(rule: Any, rules: Sequence[Callable[..., object]]) -> Any:
+    result = copy(rule)
+    if isinstance(rule, (NaryRule, NaryMultipleResultRule, NaryOptionalResultRule)):
+        object.__setattr__(result, 'rules', list(rules))
+    elif isinstance(rule, (UnaryRule, UnaryMultipleResultRule, UnaryOptionalResultRule, MultipleResultCombiner, OptionalResultCombiner)):
+        [child] = rules
+        object.__setattr__(result, 'rule', child)
+    else:
+        return rule
+    if hasattr(result, '__post_init__'):
+        result.__post_init__()
+    return result
 
 
 @dataclass(frozen=True)
@@ -203,68 +968,136 @@ class OptionalResultCombiner(AbstractRule[_State, _Result], ABC):
 
 
 @dataclass(frozen=True, repr=False)
-class Or(NaryRule[_State, _Result]):
+class MultipleResultReducer(Stepped[_State, _Result, _Result], MultipleResultCombiner[_State, _Result], ABC):
+    @abstractmethod
+    def reduce(self, results: Sequence[_Result]) -> _Result:
+        ...
+
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, _Result]:
+        state_and_results = yield self.rule, scope, state
+        if state_and_results is None:
+            return None
+        state, results = state_and_results
+        return state, self.reduce(results)
+
+
+@dataclass(frozen=True, repr=False)
+class OptionalResultReducer(Stepped[_State, _Result, _Result], OptionalResultCombiner[_State, _Result], ABC):
+    @abstractmethod
+    def reduce(self, result: Optional[_Result]) -> _Result:
+        ...
+
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, _Result]:
+        state_and_result = yield self.rule, scope, state
+        if state_and_result is None:
+            return None
+        state, result = state_and_result
+        return state, self.reduce(result)
+
+
+@dataclass(frozen=True, repr=False)
+class Or(Stepped[_State, _Result, _Result], NaryRule[_State, _Result]):
     def __repr__(self):
         return f'({"|".join(repr(rule) for rule in self.rules)})'
 
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndResult[_State, _Result]:
-        rule_errors: MutableSequence[errors.Error] = []
-        for rule in self.rules:
-            try:
-                return rule(scope, state)
-            except errors.Error as error:
-                rule_errors.append(error)
-        raise RuleError(rule=self, state=state, children=rule_errors)
+    def candidates(self, state: _State) -> Sequence[Rule[_State, _Result]]:
+        return self.rules
 
+    def error(self, state: _State, children: Sequence[errors.Error]) -> errors.Error:
+        return RuleError[_State, _Result](rule=self, state=state, children=list(children), msg=None if children else 'rule failed')
 
-class And(NaryMultipleResultRule[_State, _Result]):
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, _Result]:
+        for rule in self.candidates(state):
+            if scope.cuts is not None:
+                scope.cuts.enter()
+            result = yield rule, scope, state
+            cut = scope.cuts is not None and scope.cuts.exit()
+            if result is not None:
+                return result
+            if cut:
+                return None
+            if scope.profiler is not None:
+                scope.profiler.backtrack()
+        return None
+
+
+@dataclass(frozen=True, repr=False)
+class Cut(Stepped[_State, _Result, _Result], UnaryRule[_State, _Result]):
+    def __repr__(self) -> str:
+        return f'{self.rule}~'
+
+    def _cut(self, scope: Scope[_State, _Result], state: _State) -> None:
+        if scope.cuts is None:
+            return
+        scope.cuts.cut()
+        if scope.cuts.committed and scope.memo is not None and isinstance(state, Positioned):
+            scope.memo.discard(state.offset)
+
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, _Result]:
+        state_and_result = yield self.rule, scope, state
+        if state_and_result is not None:
+            self._cut(scope, state_and_result[0])
+        return state_and_result
+
+
+class And(Stepped[_State, _Result, Sequence[_Result]], NaryMultipleResultRule[_State, _Result]):
     def __repr__(self) -> str:
         return f'({" ".join(repr(rule) for rule in self.rules)})'
 
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndMultipleResult[_State, _Result]:
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, Sequence[_Result]]:
         results: MutableSequence[_Result] = []
         for rule in self.rules:
-            state, result = rule(scope, state)
+            state_and_result = yield rule, scope, state
+            if state_and_result is None:
+                return None
+            state, result = state_and_result
             results.append(result)
         return state, results
 
 
-class ZeroOrMore(UnaryMultipleResultRule[_State, _Result]):
+class ZeroOrMore(Stepped[_State, _Result, Sequence[_Result]], UnaryMultipleResultRule[_State, _Result]):
     def __repr__(self) -> str:
         return f'{self.rule}*'
 
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndMultipleResult[_State, _Result]:
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, Sequence[_Result]]:
         results: MutableSequence[_Result] = []
         while True:
-            try:
-                state, result = self.rule(scope, state)
-                results.append(result)
-            except errors.Error:
-                return state, results
+            if scope.cuts is not None:
+                scope.cuts.enter()
+            state_and_result = yield self.rule, scope, state
+            cut = scope.cuts is not None and scope.cuts.exit()
+            if state_and_result is None:
+                return None if cut else (state, results)
+            state, result = state_and_result
+            results.append(result)
 
 
-class OneOrMore(UnaryMultipleResultRule[_State, _Result]):
+class OneOrMore(Stepped[_State, _Result, Sequence[_Result]], UnaryMultipleResultRule[_State, _Result]):
     def __repr__(self) -> str:
         return f'{self.rule}+'
 
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndMultipleResult[_State, _Result]:
-        state, result = self.rule(scope, state)
-        results: MutableSequence[_Result] = [result]
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, Sequence[_Result]]:
+        results: MutableSequence[_Result] = []
         while True:
-            try:
-                state, result = self.rule(scope, state)
-                results.append(result)
-            except errors.Error:
-                return state, results
+            if scope.cuts is not None:
+                scope.cuts.enter()
+            state_and_result = yield self.rule, scope, state
+            cut = scope.cuts is not None and scope.cuts.exit()
+            if state_and_result is None:
+                return None if cut or not results else (state, results)
+            state, result = state_and_result
+            results.append(result)
 
 
-class ZeroOrOne(UnaryOptionalResultRule[_State, _Result]):
+class ZeroOrOne(Stepped[_State, _Result, Optional[_Result]], UnaryOptionalResultRule[_State, _Result]):
     def __repr__(self) -> str:
         return f'{self.rule}?'
 
-    def __call__(self, scope: Scope[_State, _Result], state: _State) -> StateAndOptionalResult[_State, _Result]:
-        try:
-            state, result = self.rule(scope, state)
-            return state, result
-        except errors.Error:
-            return state, None
+    def steps(self, scope: Scope[_State, _Result], state: _State) -> Steps[_State, _Result, Optional[_Result]]:
+        if scope.cuts is not None:
+            scope.cuts.enter()
+        state_and_result = yield self.rule, scope, state
+        cut = scope.cuts is not None and scope.cuts.exit()
+        if state_and_result is None:
+            return None if cut else (state, None)
+        return state_and_result
@@ -1,7 +1,7 @@
-from dataclasses import dataclass
-from typing import Sequence, Tuple
+from dataclasses import dataclass, replace
+from typing import Any, Optional, Sequence, Tuple
 import unittest
-from . import errors, processor
+from . import errors, processor, stream
 
 _State = Sequence[int]
 _Result = int
@@ -224,3 +224,635 @@ class ZeroOrOneTest(unittest.TestCase):
                         Eq(1))(_Scope({}), state),
                     output
                 )
+
+
+@dataclass
+class _StreamEq:
+    value: int
+    calls: int = 0
+
+    def __call__(self, scope: processor.Scope[stream.Stream[int], int], state: stream.Stream[int]) -> processor.StateAndResult[stream.Stream[int], int]:
+        self.calls += 1
+        if state.empty or state.head != self.value:
+            raise errors.Error(msg=f'expected {self.value}')
+        return state.tail, state.head
+
+
+@dataclass(frozen=True)
+class _StreamResultCombiner(processor.MultipleResultCombiner[stream.Stream[int], int]):
+    def __call__(self, scope: processor.Scope[stream.Stream[int], int], state: stream.Stream[int]) -> processor.StateAndResult[stream.Stream[int], int]:
+        state, results = self.rule(scope, state)
+        return state, sum(results)
+
+
+class MemoTest(unittest.TestCase):
+    def test_get_set(self):
+        memo = processor.Memo[_State, _Result]()
+        self.assertIsNone(memo.get('a', 0))
+        memo.set('a', 0, ([], 1))
+        self.assertEqual(memo.get('a', 0), ([], 1))
+        self.assertIsNone(memo.get('a', 1))
+        self.assertIsNone(memo.get('b', 0))
+
+    def test_evict(self):
+        memo = processor.Memo[_State, _Result](2)
+        memo.set('a', 0, ([], 1))
+        memo.set('b', 0, ([], 2))
+        memo.get('a', 0)
+        memo.set('c', 0, ([], 3))
+        self.assertEqual(len(memo), 2)
+        self.assertEqual(memo.get('a', 0), ([], 1))
+        self.assertIsNone(memo.get('b', 0))
+        self.assertEqual(memo.get('c', 0), ([], 3))
+
+    def test_ctor_fail(self):
+        with self.assertRaises(errors.Error):
+            processor.Memo[_State, _Result](0)
+
+    def _assert_entry(self, memo: processor.Memo[stream.Stream[int], _Result], rule_name: str, offset: int, buffer: stream.Stream[int], expected: Optional[tuple[int, _Result]]) -> None:
+        entry = memo.get(rule_name, offset)
+        if expected is None:
+            self.assertIsNone(entry)
+            return
+        assert isinstance(entry, tuple)
+        state, result = entry
+        self.assertIs(state.buffer, buffer.buffer)
+        self.assertEqual((state.offset, result), expected)
+
+    def test_edit(self):
+        items = stream.Stream[int](list(range(10)))
+        memo = processor.Memo[stream.Stream[int], _Result]()
+        memo.set('unbounded', 0, (items.seek(1), 0))
+        memo.set('before', 1, (items.seek(2), 1), extent=2)
+        memo.set('spanning', 3, (items.seek(5), 2), extent=5)
+        memo.set('inside', 5, (items.seek(6), 3), extent=6)
+        memo.set('after', 7, (items.seek(8), 4), True, 8)
+        memo.set('error', 8, errors.Error(msg='error'), extent=8)
+        edited = stream.Stream[int](list(range(12)))
+        actual = memo.edit(4, 7, 2, edited.seek)
+        self.assertEqual(len(memo), 6)
+        self._assert_entry(memo, 'after', 7, items, (8, 4))
+        self._assert_entry(memo, 'inside', 5, items, (6, 3))
+        self.assertEqual(len(actual), 3)
+        self._assert_entry(actual, 'before', 1, edited, (2, 1))
+        self._assert_entry(actual, 'after', 9, edited, (10, 4))
+        self.assertTrue(actual.cut('after', 9))
+        self.assertFalse(actual.cut('after', 7))
+        self.assertIsNone(actual.get('error', 10))
+        self.assertEqual(len(actual), 2)
+        actual.set('inserted', 5, (edited.seek(6), 5), extent=6)
+        actual.set('error', 2, errors.Error(msg='error'), extent=2)
+        reedited = stream.Stream[int](list(range(11)))
+        reactual = actual.edit(0, 1, -1, reedited.seek)
+        self.assertEqual(len(reactual), 4)
+        self._assert_entry(reactual, 'before', 0, reedited, (1, 1))
+        self._assert_entry(reactual, 'inserted', 4, reedited, (5, 5))
+        self._assert_entry(reactual, 'after', 8, reedited, (9, 4))
+        self.assertTrue(reactual.cut('after', 8))
+        self.assertIsNone(reactual.get('error', 1))
+        self.assertEqual(len(reactual), 3)
+
+    def test_edit_repeated(self):
+        items = stream.Stream[int](list(range(24)))
+        memo = processor.Memo[stream.Stream[int], _Result]()
+        for offset in range(20):
+            memo.set('a', offset, (items.seek(offset), offset), extent=offset)
+        for start, delta in [(10, 0), (15, 1), (2, -1), (18, 2), (5, 0)]:
+            memo = memo.edit(start, start+1, delta, items.seek)
+        expected = {0: 0, 1: 1, 16: 16, 17: 17, 19: 21} | {
+            offset: offset-1 for offset in range(3, 15) if offset not in (6, 10)}
+        self.assertEqual(len(memo), len(expected))
+        for offset, shifted in expected.items():
+            with self.subTest(offset=offset):
+                self._assert_entry(memo, 'a', shifted,
+                                   items, (shifted, offset))
+
+
+class PackratTest(unittest.TestCase):
+    def _processor(self, eq: _StreamEq, packrat: bool) -> processor.Processor[stream.Stream[int], int]:
+        _Stream = stream.Stream[int]
+        return processor.Processor[_Stream, int](
+            {
+                'root': processor.Or[_Stream, int]([
+                    _StreamResultCombiner(processor.And[_Stream, int]([
+                        processor.Ref[_Stream, int]('a'),
+                        _StreamEq(2),
+                    ])),
+                    _StreamResultCombiner(processor.And[_Stream, int]([
+                        processor.Ref[_Stream, int]('a'),
+                        _StreamEq(3),
+                    ])),
+                    processor.Ref[_Stream, int]('a'),
+                ]),
+                'a': eq,
+            },
+            'root',
+            packrat=packrat,
+        )
+
+    def test_apply(self):
+        for packrat, calls in list[Tuple[bool, int]]([
+            (False, 3),
+            (True, 1),
+        ]):
+            with self.subTest(packrat=packrat, calls=calls):
+                eq = _StreamEq(1)
+                state, result = self._processor(eq, packrat)(
+                    processor.Scope[stream.Stream[int], int]({}), stream.Stream[int]([1, 4]))
+                self.assertEqual((state, result), (stream.Stream[int]([4]), 1))
+                self.assertEqual(eq.calls, calls)
+
+    def test_apply_fail(self):
+        for packrat, calls in list[Tuple[bool, int]]([
+            (False, 3),
+            (True, 1),
+        ]):
+            with self.subTest(packrat=packrat, calls=calls):
+                eq = _StreamEq(1)
+                with self.assertRaises(errors.Error):
+                    self._processor(eq, packrat)(
+                        processor.Scope[stream.Stream[int], int]({}), stream.Stream[int]([2]))
+                self.assertEqual(eq.calls, calls)
+
+
+class ApplyTest(unittest.TestCase):
+    def test_apply(self):
+        for rule, state, output in list[Tuple[processor.Rule[_State, Any], _State, Optional[Tuple[_State, Any]]]]([
+            (Eq(1), [1, 2], ([2], 1)),
+            (Eq(1), [2], None),
+            (_Ref('a'), [1], ([], 1)),
+            (_Ref('a'), [2], None),
+            (_Ref('b'), [1], None),
+            (_Or([Eq(1), Eq(2)]), [2], ([], 2)),
+            (_Or([Eq(1), Eq(2)]), [3], None),
+            (processor.And[_State, _Result]([Eq(1), Eq(2)]), [1, 2], ([], [1, 2])),
+            (processor.And[_State, _Result]([Eq(1), Eq(2)]), [1, 3], None),
+            (processor.ZeroOrMore[_State, _Result](Eq(1)), [1, 1, 2], ([2], [1, 1])),
+            (processor.ZeroOrMore[_State, _Result](Eq(1)), [2], ([2], [])),
+            (processor.OneOrMore[_State, _Result](Eq(1)), [1, 2], ([2], [1])),
+            (processor.OneOrMore[_State, _Result](Eq(1)), [2], None),
+            (processor.ZeroOrOne[_State, _Result](Eq(1)), [1], ([], 1)),
+            (processor.ZeroOrOne[_State, _Result](Eq(1)), [2], ([2], None)),
+            (_ResultCombiner(processor.And[_State, _Result]([Eq(1), Eq(2)])), [1, 2], ([], 3)),
+            (_ResultCombiner(processor.And[_State, _Result]([Eq(1), Eq(2)])), [1], None),
+        ]):
+            with self.subTest(rule=rule, state=state, output=output):
+                self.assertEqual(
+                    processor.apply(rule, _Scope({'a': Eq(1)}), state),
+                    output
+                )
+
+
+class FailuresTest(unittest.TestCase):
+    def test_record(self):
+        _Stream = stream.Stream[int]
+        state = _Stream([1, 2, 3])
+        failures = processor.Failures[_Stream]()
+        failures.record('a', state.tail)
+        failures.record('b', state)
+        failures.record('_c', state.tail)
+        failures.record('d', state.tail)
+        self.assertEqual(failures.offset, 1)
+        self.assertEqual(failures.expected, {'a', 'd'})
+        failures.record('e', state.tail.tail)
+        self.assertEqual(failures.offset, 2)
+        self.assertEqual(failures.expected, {'e'})
+        self.assertEqual(failures.state, state.tail.tail)
+
+    def test_apply_fail(self):
+        _Stream = stream.Stream[int]
+        processor_ = processor.Processor[_Stream, int](
+            {
+                'root': processor.Or[_Stream, int]([
+                    _StreamResultCombiner(processor.And[_Stream, int]([
+                        processor.Ref[_Stream, int]('a'),
+                        processor.Ref[_Stream, int]('b'),
+                    ])),
+                    _StreamResultCombiner(processor.And[_Stream, int]([
+                        processor.Ref[_Stream, int]('a'),
+                        processor.Ref[_Stream, int]('c'),
+                    ])),
+                ]),
+                'a': _StreamEq(1),
+                'b': _StreamEq(2),
+                'c': _StreamEq(3),
+            },
+            'root',
+        )
+        state = _Stream([1, 4])
+        with self.assertRaises(processor.FarthestFailureError) as context:
+            processor_(processor.Scope[_Stream, int]({}), state)
+        self.assertEqual(context.exception.state, state.tail)
+        self.assertEqual(context.exception.expected, ['b', 'c'])
+
+    def test_apply_fail_debug(self):
+        _Stream = stream.Stream[int]
+        with self.assertRaises(processor.RuleNameError):
+            processor.Processor[_Stream, int](
+                {'root': processor.Ref[_Stream, int]('a'), 'a': _StreamEq(1)},
+                'root',
+                debug=True,
+            )(processor.Scope[_Stream, int]({}), _Stream([2]))
+
+
+class LinkTest(unittest.TestCase):
+    def test_link(self):
+        a = _Ref('a')
+        processor_ = processor.Processor[_State, _Result](
+            {'root': _Or([a, Eq(2)]), 'a': Eq(1)},
+            'root',
+        )
+        root = processor_['root']
+        assert isinstance(root, processor.Or)
+        linked = root.rules[0]
+        assert isinstance(linked, processor.Ref)
+        self.assertIsNot(linked, a)
+        self.assertIs(linked._rule, processor_['a'])
+        self.assertIsNone(a._rule)
+        self.assertEqual(processor_(_Scope({}), [1]), ([], 1))
+
+    def test_link_shared(self):
+        a = _Ref('a')
+        processor_1 = processor.Processor[_State, _Result](
+            {'root': a, 'a': Eq(1)}, 'root')
+        processor_2 = processor.Processor[_State, _Result](
+            {'root': a, 'a': Eq(2)}, 'root')
+        self.assertIsNone(a._rule)
+        self.assertEqual(processor_1(_Scope({}), [1]), ([], 1))
+        self.assertEqual(processor_2(_Scope({}), [2]), ([], 2))
+
+    def test_link_deferred(self):
+        processor_ = processor.Processor[_State, _Result](
+            {'root': _Or([_Ref('a'), Eq(2)])},
+            'root',
+        )
+        self.assertEqual(processor_(_Scope({'a': Eq(1)}), [1]), ([], 1))
+        with self.assertRaises(errors.Error):
+            processor_(_Scope({}), [1])
+
+    def test_unresolved(self):
+        processor_ = processor.Processor[_State, _Result](
+            {'root': _Or([_Ref('a'), _Ref('b'), _Ref('root')])},
+            'root',
+        )
+        self.assertEqual(processor_.unresolved, {'a', 'b'})
+        with self.assertRaisesRegex(errors.Error, r"\['a', 'b'\]"):
+            processor.Processor[_State, _Result](
+                {'root': _Or([_Ref('a'), _Ref('b'), _Ref('root')])},
+                'root',
+                strict=True,
+            )
+        self.assertEqual(processor.Processor[_State, _Result](
+            {'root': _Ref('a'), 'a': Eq(1)},
+            'root',
+            strict=True,
+        ).unresolved, frozenset())
+
+    def test_link_nested(self):
+        inner = processor.Processor[_State, _Result](
+            {'inner_root': _Or([_Ref('a'), Eq(2)])},
+            'inner_root',
+        )
+        outer = processor.Processor[_State, _Result](
+            {'root': inner, 'a': Eq(1)},
+            'root',
+        )
+        self.assertEqual(outer(_Scope({}), [1]), ([], 1))
+        self.assertEqual(outer(_Scope({}), [2]), ([], 2))
+
+    def test_merged_scope(self):
+        processor_ = processor.Processor[_State, _Result](
+            {'root': Eq(1)}, 'root')
+        scope = _Scope({'a': Eq(2)})
+        self.assertIs(processor_._scope(_Scope({}))._rules, processor_._rules)
+        self.assertIs(processor_._scope(scope)._rules,
+                      processor_._scope(scope)._rules)
+        self.assertEqual(
+            set(processor_._scope(scope)), {'root', 'a'})
+
+
+class ProfilerTest(unittest.TestCase):
+    def _processor(self) -> processor.Processor[stream.Stream[int], int]:
+        _Stream = stream.Stream[int]
+        return processor.Processor[_Stream, int](
+            {
+                'root': processor.Or[_Stream, int]([
+                    _StreamResultCombiner(processor.And[_Stream, int]([
+                        processor.Ref[_Stream, int]('a'),
+                        processor.Ref[_Stream, int]('b'),
+                    ])),
+                    processor.Ref[_Stream, int]('a'),
+                ]),
+                'a': _StreamEq(1),
+                'b': _StreamEq(2),
+            },
+            'root',
+            profile=True,
+        )
+
+    def test_profile(self):
+        processor_ = self._processor()
+        processor_(processor.Scope[stream.Stream[int], int]({}),
+                   stream.Stream[int]([1, 3]))
+        profiler = processor_.profiler
+        assert profiler is not None
+        self.assertEqual(
+            {
+                rule_name: (profile.calls, profile.successes,
+                            profile.failures, profile.backtracks)
+                for rule_name, profile in profiler.rules.items()
+            },
+            {
+                'root': (1, 1, 0, 1),
+                'a': (2, 2, 0, 0),
+                'b': (1, 0, 1, 0),
+            }
+        )
+        root = profiler.rules['root']
+        self.assertGreaterEqual(root.cumulative_time, root.self_time)
+        self.assertGreaterEqual(
+            root.cumulative_time,
+            profiler.rules['a'].cumulative_time +
+            profiler.rules['b'].cumulative_time,
+        )
+
+    def test_table(self):
+        processor_ = self._processor()
+        processor_(processor.Scope[stream.Stream[int], int]({}),
+                   stream.Stream[int]([1, 3]))
+        assert processor_.profiler is not None
+        lines = processor_.profiler.table('calls').splitlines()
+        self.assertEqual(lines[0].split()[:2], ['rule', 'calls'])
+        self.assertEqual(lines[1].split()[:2], ['a', '2'])
+        self.assertEqual(len(lines), 4)
+        with self.assertRaises(errors.Error):
+            processor_.profiler.table('size')
+
+    def test_disabled(self):
+        processor_ = processor.Processor[_State, _Result](
+            {'root': Eq(1)}, 'root')
+        self.assertIsNone(processor_.profiler)
+        self.assertIsNone(processor_._scope(_Scope({})).profiler)
+
+
+@dataclass(frozen=True, repr=False)
+class _StreamSum(processor.MultipleResultReducer[stream.Stream[int], int]):
+    def reduce(self, results: Sequence[int]) -> int:
+        return sum(results)
+
+
+class _StreamDefault(processor.OptionalResultReducer[stream.Stream[int], int]):
+    def reduce(self, result: Optional[int]) -> int:
+        return 0 if result is None else result
+
+
+class RunTest(unittest.TestCase):
+    def _processor(self, iterative: bool, packrat: bool = False) -> processor.Processor[stream.Stream[int], int]:
+        _Stream = stream.Stream[int]
+        return processor.Processor[_Stream, int](
+            {
+                'root': _StreamSum(stream.UntilEmpty[_Stream, int](
+                    processor.Ref[_Stream, int]('a'))),
+                'a': processor.Or[_Stream, int]([
+                    _StreamSum(processor.And[_Stream, int]([
+                        _StreamEq(1),
+                        processor.Ref[_Stream, int]('a'),
+                        _StreamEq(2),
+                    ])),
+                    _StreamSum(processor.OneOrMore[_Stream, int](
+                        _StreamEq(3))),
+                ]),
+            },
+            'root',
+            iterative=iterative,
+            packrat=packrat,
+        )
+
+    def test_apply(self):
+        for input, output in list[Tuple[Sequence[int], Optional[int]]]([
+            ([3], 3),
+            ([3, 3, 1, 3, 2], 12),
+            ([1, 1, 3, 3, 2, 2], 12),
+            ([1, 3], None),
+            ([2], None),
+        ]):
+            for packrat in (False, True):
+                with self.subTest(input=input, output=output, packrat=packrat):
+                    state = stream.Stream[int](input)
+                    result = self._processor(True, packrat).apply(
+                        processor.Scope[stream.Stream[int], int]({}), state)
+                    self.assertEqual(result, self._processor(False, packrat).apply(
+                        processor.Scope[stream.Stream[int], int]({}), state))
+                    self.assertEqual(
+                        None if result is None else result[1], output)
+
+    def test_apply_deep(self):
+        depth = 10000
+        state = stream.Stream[int]([1]*depth + [3] + [2]*depth)
+        with self.assertRaises(RecursionError):
+            self._processor(False).apply(
+                processor.Scope[stream.Stream[int], int]({}), state)
+        self.assertEqual(
+            self._processor(True)(
+                processor.Scope[stream.Stream[int], int]({}), state),
+            (stream.Stream[int]([1]*depth + [3] + [2]*depth).seek(2*depth+1), 3*depth+3),
+        )
+
+    def test_apply_fail(self):
+        state = stream.Stream[int]([3, 1, 3, 4])
+        with self.assertRaises(processor.FarthestFailureError) as context:
+            self._processor(False)(
+                processor.Scope[stream.Stream[int], int]({}), state)
+        with self.assertRaises(processor.FarthestFailureError) as iterative_context:
+            self._processor(True)(
+                processor.Scope[stream.Stream[int], int]({}), state)
+        self.assertEqual(iterative_context.exception.state,
+                         context.exception.state)
+        self.assertEqual(iterative_context.exception.expected,
+                         context.exception.expected)
+
+    def test_apply_fail_debug(self):
+        state = stream.Stream[int]([3, 1, 3, 4])
+        for iterative in (False, True):
+            with self.subTest(iterative=iterative):
+                with self.assertRaises(processor.RuleNameError) as context:
+                    replace(self._processor(iterative), debug=True)(
+                        processor.Scope[stream.Stream[int], int]({}), state)
+                self.assertEqual(context.exception.rule_name, 'a')
+                child = context.exception.child
+                assert isinstance(child, processor.RuleError)
+                self.assertIsInstance(child.rule, processor.Or)
+                self.assertEqual(len(child.children), 2)
+
+    def test_apply_fail_debug_deep(self):
+        depth = 10000
+        state = stream.Stream[int]([1]*depth + [4])
+        with self.assertRaises(processor.RuleNameError) as context:
+            replace(self._processor(True), debug=True)(
+                processor.Scope[stream.Stream[int], int]({}), state)
+        errors_: list[errors.Error] = [context.exception]
+        refs = 0
+        while errors_:
+            error = errors_.pop()
+            if isinstance(error, processor.RuleNameError):
+                refs += 1
+            if isinstance(error, errors.UnaryError):
+                errors_.append(error.child)
+            if isinstance(error, errors.NaryError):
+                errors_.extend(error.children)
+        self.assertGreater(refs, depth)
+
+
+class CutTest(unittest.TestCase):
+    def _apply(self, rules: dict[str, processor.Rule[stream.Stream[int], int]], input: Sequence[int], packrat: bool, iterative: bool) -> Optional[processor.StateAndResult[stream.Stream[int], int]]:
+        return processor.Processor[stream.Stream[int], int](
+            rules, 'root', packrat=packrat, iterative=iterative,
+        ).apply(processor.Scope[stream.Stream[int], int]({}), stream.Stream[int](input))
+
+    def test_apply(self):
+        _Stream = stream.Stream[int]
+        for cut, output in list[Tuple[bool, Optional[int]]]([
+            (False, 1),
+            (True, None),
+        ]):
+            first = _StreamEq(1)
+            rules: dict[str, processor.Rule[_Stream, int]] = {
+                'root': processor.Or[_Stream, int]([
+                    _StreamSum(processor.And[_Stream, int]([
+                        processor.Cut[_Stream, int](
+                            first) if cut else first,
+                        _StreamEq(2),
+                    ])),
+                    _StreamEq(1),
+                ]),
+            }
+            for packrat in (False, True):
+                for iterative in (False, True):
+                    with self.subTest(cut=cut, packrat=packrat, iterative=iterative):
+                        result = self._apply(rules, [1, 3], packrat, iterative)
+                        self.assertEqual(
+                            None if result is None else result[1], output)
+
+    def test_apply_ref(self):
+        _Stream = stream.Stream[int]
+        _RefA = processor.Ref[_Stream, int]
+        rules: dict[str, processor.Rule[_Stream, int]] = {
+            'root': processor.Or[_Stream, int]([
+                _StreamSum(processor.And[_Stream, int]([
+                    processor.Or[_Stream, int]([_RefA('a'), _StreamEq(1)]),
+                    _StreamEq(3),
+                ])),
+                _RefA('a'),
+                _StreamEq(1),
+            ]),
+            'a': _StreamSum(processor.And[_Stream, int]([
+                processor.Cut[_Stream, int](_StreamEq(1)),
+                _StreamEq(2),
+            ])),
+        }
+        for packrat in (False, True):
+            for iterative in (False, True):
+                with self.subTest(packrat=packrat, iterative=iterative):
+                    self.assertIsNone(
+                        self._apply(rules, [1, 3], packrat, iterative))
+
+    def test_apply_repeat(self):
+        _Stream = stream.Stream[int]
+
+        def body(cut: bool) -> processor.Rule[_Stream, int]:
+            first = _StreamEq(1)
+            return _StreamSum(processor.And[_Stream, int]([
+                processor.Cut[_Stream, int](first) if cut else first,
+                _StreamEq(2),
+            ]))
+
+        for name, rule, input, output in list[Tuple[str, Any, Sequence[int], Optional[int]]]([
+            ('zero_or_more', lambda body: _StreamSum(
+                processor.ZeroOrMore[_Stream, int](body)), [], 0),
+            ('zero_or_more', lambda body: _StreamSum(
+                processor.ZeroOrMore[_Stream, int](body)), [1, 2, 1, 2], 6),
+            ('zero_or_more', lambda body: _StreamSum(
+                processor.ZeroOrMore[_Stream, int](body)), [1], None),
+            ('zero_or_more', lambda body: _StreamSum(
+                processor.ZeroOrMore[_Stream, int](body)), [1, 2, 1], None),
+            ('one_or_more', lambda body: _StreamSum(
+                processor.OneOrMore[_Stream, int](body)), [1, 2, 1], None),
+            ('zero_or_one', lambda body: _StreamDefault(
+                processor.ZeroOrOne[_Stream, int](body)), [], 0),
+            ('zero_or_one', lambda body: _StreamDefault(
+                processor.ZeroOrOne[_Stream, int](body)), [1, 2], 3),
+            ('zero_or_one', lambda body: _StreamDefault(
+                processor.ZeroOrOne[_Stream, int](body)), [1], None),
+        ]):
+            for packrat in (False, True):
+                for iterative in (False, True):
+                    with self.subTest(name=name, input=input, packrat=packrat, iterative=iterative):
+                        result = self._apply(
+                            {'root': rule(body(True))}, input, packrat, iterative)
+                        self.assertEqual(
+                            None if result is None else result[1], output)
+                        if output is None:
+                            self.assertIsNotNone(self._apply(
+                                {'root': rule(body(False))}, input, packrat, iterative))
+
+    def test_call_repeat(self):
+        _Stream = stream.Stream[int]
+        processor_ = processor.Processor[_Stream, int](
+            {
+                'root': _StreamSum(processor.ZeroOrMore[_Stream, int](
+                    _StreamSum(processor.And[_Stream, int]([
+                        processor.Cut[_Stream, int](_StreamEq(1)),
+                        _StreamEq(2),
+                    ])),
+                )),
+            },
+            'root',
+            debug=True,
+        )
+        with self.assertRaises(errors.Error):
+            processor_(processor.Scope[_Stream, int]({}), _Stream([1]))
+
+    def test_call_fail(self):
+        _Stream = stream.Stream[int]
+        processor_ = processor.Processor[_Stream, int](
+            {
+                'root': processor.Or[_Stream, int]([
+                    _StreamSum(processor.And[_Stream, int]([
+                        processor.Cut[_Stream, int](_StreamEq(1)),
+                        _StreamEq(2),
+                    ])),
+                    _StreamEq(1),
+                ]),
+            },
+            'root',
+            debug=True,
+        )
+        with self.assertRaises(processor.RuleError) as context:
+            processor_(processor.Scope[_Stream, int]
+                       ({}), _Stream([1, 3]))
+        self.assertEqual(len(context.exception.children), 1)
+
+    def test_cuts(self):
+        cuts = processor.Cuts()
+        cuts.enter()
+        self.assertFalse(cuts.committed)
+        mark = cuts.mark()
+        cuts.enter()
+        cuts.cut()
+        self.assertTrue(cuts.exit())
+        self.assertFalse(cuts.escaped(mark))
+        mark = cuts.mark()
+        cuts.cut()
+        self.assertTrue(cuts.escaped(mark))
+        self.assertTrue(cuts.committed)
+        self.assertTrue(cuts.exit())
+
+    def test_memo_discard(self):
+        memo = processor.Memo[_State, _Result]()
+        memo.set('a', 0, ([], 1), True)
+        memo.set('a', 1, ([], 1))
+        memo.set('b', 2, ([], 2), True)
+        memo.discard(2)
+        self.assertEqual(len(memo), 1)
+        self.assertFalse(memo.cut('a', 0))
+        self.assertTrue(memo.cut('b', 2))
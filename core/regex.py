@@ -1,9 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cache
 import string
-from typing import Mapping, Sequence, TypeVar
+from typing import TYPE_CHECKING, Mapping, MutableMapping, MutableSequence, Optional, Sequence, TypeVar
 
 from . import errors, processor, stream
 
+if TYPE_CHECKING:
+    from . import parser
+
 
 @dataclass(frozen=True)
 class Char:
@@ -31,7 +35,7 @@ class Token:
 
     @staticmethod
     def concat(tokens: Sequence['Token']) -> 'Token':
-        return sum(tokens, Token(''))
+        return Token(''.join(token.value for token in tokens))
 
 
 RuleError = processor.RuleError[CharStream[_Char], Token]
@@ -46,17 +50,15 @@ Or = processor.Or[CharStream[_Char], Token]
 
 
 @dataclass(frozen=True, repr=False)
-class _MultipleResultCombiner(processor.MultipleResultCombiner[CharStream[_Char], Token]):
-    def __call__(self, scope: Scope[_Char], state: CharStream[_Char]) -> StateAndResult[_Char]:
-        state, results = self.rule(scope, state)
-        return state, Token.concat(results)
+class _MultipleResultCombiner(processor.MultipleResultReducer[CharStream[_Char], Token]):
+    def reduce(self, results: Sequence[Token]) -> Token:
+        return Token.concat(results)
 
 
 @dataclass(frozen=True, repr=False)
-class _OptionalResultCombiner(processor.OptionalResultCombiner[CharStream[_Char], Token]):
-    def __call__(self, scope: Scope[_Char], state: CharStream[_Char]) -> StateAndResult[_Char]:
-        state, result = self.rule(scope, state)
-        return state, result or Token('')
+class _OptionalResultCombiner(processor.OptionalResultReducer[CharStream[_Char], Token]):
+    def reduce(self, result: Optional[Token]) -> Token:
+        return result or Token('')
 
 
 class And(_MultipleResultCombiner[_Char]):
@@ -94,6 +96,11 @@ class Any(AbstractRule[_Char]):
             raise RuleError[_Char](rule=self, state=state, msg='empty stream')
         return state.tail, Token(state.head.value)
 
+    def apply(self, scope: Scope[_Char], state: CharStream[_Char]) -> Optional[StateAndResult[_Char]]:
+        if state.empty:
+            return None
+        return state.tail, Token(state.head.value)
+
 
 @dataclass(frozen=True, repr=False)
 class Literal(AbstractRule[_Char]):
@@ -114,6 +121,11 @@ class Literal(AbstractRule[_Char]):
                 rule=self, state=state, msg=f'expected {repr(self.value)} but got {state.head}')
         return state.tail, Token(state.head.value)
 
+    def apply(self, scope: Scope[_Char], state: CharStream[_Char]) -> Optional[StateAndResult[_Char]]:
+        if state.empty or state.head.value != self.value:
+            return None
+        return state.tail, Token(self.value)
+
 
 def literal(value: str) -> Rule[_Char]:
     if len(value) == 1:
@@ -121,6 +133,69 @@ def literal(value: str) -> Rule[_Char]:
     return And[_Char]([Literal[_Char](char) for char in value])
 
 
+@dataclass(frozen=True, repr=False)
+class Literals(AbstractRule[_Char]):
+    values: Sequence[str]
+    _children: Sequence[Mapping[str, int]] = field(init=False, compare=False)
+    _indices: Sequence[int] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        children: MutableSequence[MutableMapping[str, int]] = [{}]
+        indices: MutableSequence[int] = [-1]
+        for index, value in enumerate(self.values):
+            if not value:
+                raise errors.Error(msg='empty literal')
+            node = 0
+            for char in value:
+                if char not in children[node]:
+                    children[node][char] = len(children)
+                    children.append({})
+                    indices.append(-1)
+                node = children[node][char]
+            if indices[node] < 0:
+                indices[node] = index
+        object.__setattr__(self, '_children', children)
+        object.__setattr__(self, '_indices', indices)
+
+    def __repr__(self) -> str:
+        return f'({"|".join(repr(value) for value in self.values)})'
+
+    def match(self, text: Sequence[str], n: int, p: int) -> tuple[int, int]:
+        children, indices = self._children, self._indices
+        node = 0
+        end, index = -1, -1
+        while p < n:
+            child = children[node].get(text[p])
+            if child is None:
+                break
+            node = child
+            p += 1
+            if indices[node] >= 0:
+                end, index = p, indices[node]
+        return end, index
+
+    def __call__(self, scope: Scope[_Char], state: CharStream[_Char]) -> StateAndResult[_Char]:
+        result = self.apply(scope, state)
+        if result is None:
+            raise RuleError[_Char](
+                rule=self, state=state, msg=f'expected one of {self}')
+        return result
+
+    def apply(self, scope: Scope[_Char], state: CharStream[_Char]) -> Optional[StateAndResult[_Char]]:
+        children, indices = self._children, self._indices
+        node = 0
+        result: Optional[StateAndResult[_Char]] = None
+        while not state.empty:
+            child = children[node].get(state.head.value)
+            if child is None:
+                break
+            node = child
+            state = state.tail
+            if indices[node] >= 0:
+                result = state, Token(self.values[indices[node]])
+        return result
+
+
 @dataclass(frozen=True, repr=False)
 class Not(processor.UnaryRule[CharStream[_Char], Token]):
     def __repr__(self) -> str:
@@ -134,6 +209,11 @@ class Not(processor.UnaryRule[CharStream[_Char], Token]):
         raise RuleError[_Char](rule=self, state=state,
                                msg=f'successfully applied not rule')
 
+    def apply(self, scope: Scope[_Char], state: CharStream[_Char]) -> Optional[StateAndResult[_Char]]:
+        if state.empty or processor.apply(self.rule, scope, state) is not None:
+            return None
+        return state.tail, Token(state.head.value)
+
 
 @dataclass(frozen=True, repr=False)
 class Class(AbstractRule[_Char]):
@@ -155,6 +235,14 @@ class Class(AbstractRule[_Char]):
                 rule=self, state=state, msg=f'expected {repr(self.values)} but got {state.head}')
         return state.tail, Token(state.head.value)
 
+    def apply(self, scope: Scope[_Char], state: CharStream[_Char]) -> Optional[StateAndResult[_Char]]:
+        if state.empty:
+            return None
+        value = state.head.value
+        if value not in self.values:
+            return None
+        return state.tail, Token(value)
+
     @staticmethod
     def whitespace() -> 'Class[_Char]':
         return Class[_Char](string.whitespace)
@@ -180,108 +268,120 @@ class Range(AbstractRule[_Char]):
                 rule=self, state=state, msg=f'expected in {self} but got {state.head}')
         return state.tail, Token(state.head.value)
 
+    def apply(self, scope: Scope[_Char], state: CharStream[_Char]) -> Optional[StateAndResult[_Char]]:
+        if state.empty:
+            return None
+        value = state.head.value
+        if value < self.min or value > self.max:
+            return None
+        return state.tail, Token(value)
 
-def load(input: str) -> Rule[_Char]:
+
+@cache
+def _loader() -> 'parser.Parser[Rule[Char]]':
     from . import lexer, parser
 
     operators = '.[-]\\()|*+?!^'
-
-    def load_root(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
-        state, results = parser.UntilEmpty[Rule[_Char]](
-            parser.Ref[Rule[_Char]]('rule'))(scope, state)
-        if len(results) == 1:
-            return state, results[0]
-        return state, And(results)
-
-    def load_literal(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
+    rule = parser.Ref[Rule[Char]]('rule')
+    operation = parser.Ref[Rule[Char]]('operation')
+    operand = parser.Ref[Rule[Char]]('operand')
+
+    @dataclass(frozen=True, repr=False)
+    class LoadRoot(parser.ResultReducer[Rule[Char]]):
+        def reduce(self, results: Sequence[Rule[Char]]) -> Rule[Char]:
+            if len(results) == 1:
+                return results[0]
+            return And(results)
+
+    def load_literal(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
         state, value = parser.get_token_value(state, 'char')
-        return state, Literal[_Char](value)
+        return state, Literal[Char](value)
 
-    def load_any(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
+    def load_any(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
         state = parser.consume_token(state, '.')
-        return state, Any[_Char]()
+        return state, Any[Char]()
 
-    def load_range(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
+    def load_range(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
         state = parser.consume_token(state, '[')
         state, min = parser.get_token_value(state, 'char')
         state = parser.consume_token(state, '-')
         state, max = parser.get_token_value(state, 'char')
         state = parser.consume_token(state, ']')
-        return state, Range[_Char](min, max)
+        return state, Range[Char](min, max)
 
-    def load_special(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
+    def load_special(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
         state = parser.consume_token(state, '\\')
         if state.empty:
             raise errors.Error(msg=f'empty stream')
         value = state.head.value
         state = state.tail
-        classes: Mapping[str, Class[_Char]] = {
-            'w': Class[_Char].whitespace(),
+        classes: Mapping[str, Class[Char]] = {
+            'w': Class[Char].whitespace(),
         }
         if value in classes:
             return state, classes[value]
         if value in operators:
-            return state, Literal[_Char](value)
+            return state, Literal[Char](value)
         raise errors.Error(msg=f'unknown special char {value}')
 
-    def load_and(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
+    def load_and(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
         state = parser.consume_token(state, '(')
-        state, results = parser.OneOrMore[Rule[_Char]](
-            parser.Ref[Rule[_Char]]('rule'))(scope, state)
+        state, results = parser.OneOrMore[Rule[Char]](
+            rule)(scope, state)
         state = parser.consume_token(state, ')')
-        return state, And[_Char](results)
+        return state, And[Char](results)
 
-    def load_or(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
-        def load_part(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
+    def load_or(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
+        def load_part(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
             state = parser.consume_token(state, '|')
-            return parser.Ref[Rule[_Char]]('rule')(scope, state)
+            return rule(scope, state)
 
         state = parser.consume_token(state, '(')
-        state, head = parser.Ref[Rule[_Char]]('rule')(scope, state)
-        state, tail = parser.OneOrMore[Rule[_Char]](load_part)(scope, state)
+        state, head = rule(scope, state)
+        state, tail = parser.OneOrMore[Rule[Char]](load_part)(scope, state)
         state = parser.consume_token(state, ')')
-        return state, Or[_Char]([head] + list(tail))
+        return state, Or[Char]([head] + list(tail))
 
-    def load_zero_or_more(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
-        state, value = parser.Ref[Rule[_Char]]('operand')(scope, state)
+    def load_zero_or_more(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
+        state, value = operand(scope, state)
         state = parser.consume_token(state, '*')
-        return state, ZeroOrMore[_Char](value)
+        return state, ZeroOrMore[Char](value)
 
-    def load_one_or_more(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
-        state, value = parser.Ref[Rule[_Char]]('operand')(scope, state)
+    def load_one_or_more(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
+        state, value = operand(scope, state)
         state = parser.consume_token(state, '+')
-        return state, OneOrMore[_Char](value)
+        return state, OneOrMore[Char](value)
 
-    def load_zero_or_one(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
-        state, value = parser.Ref[Rule[_Char]]('operand')(scope, state)
+    def load_zero_or_one(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
+        state, value = operand(scope, state)
         state = parser.consume_token(state, '?')
-        return state, ZeroOrOne[_Char](value)
+        return state, ZeroOrOne[Char](value)
 
-    def load_until_empty(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
-        state, value = parser.Ref[Rule[_Char]]('operand')(scope, state)
+    def load_until_empty(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
+        state, value = operand(scope, state)
         state = parser.consume_token(state, '!')
-        return state, UntilEmpty[_Char](value)
+        return state, UntilEmpty[Char](value)
 
-    def load_not(scope: parser.Scope[Rule[_Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[_Char]]:
+    def load_not(scope: parser.Scope[Rule[Char]], state: lexer.TokenStream) -> parser.StateAndResult[Rule[Char]]:
         state = parser.consume_token(state, '^')
-        state, value = parser.Ref[Rule[_Char]]('operand')(scope, state)
-        return state, Not[_Char](value)
+        state, value = operand(scope, state)
+        return state, Not[Char](value)
 
-    _, result = parser.Parser[Rule[_Char]](
+    return parser.Parser[Rule[Char]](
         {
-            'root': load_root,
-            'rule': parser.Or[Rule[_Char]]([
-                parser.Ref[Rule[_Char]]('operation'),
-                parser.Ref[Rule[_Char]]('operand'),
+            'root': LoadRoot(parser.UntilEmpty[Rule[Char]](rule)),
+            'rule': parser.Or[Rule[Char]]([
+                operation,
+                operand,
             ]),
-            'operation': parser.Or[Rule[_Char]]([
+            'operation': parser.Or[Rule[Char]]([
                 load_zero_or_more,
                 load_one_or_more,
                 load_zero_or_one,
                 load_until_empty,
                 load_not,
             ]),
-            'operand': parser.Or[Rule[_Char]]([
+            'operand': parser.Or[Rule[Char]]([
                 load_literal,
                 load_any,
                 load_range,
@@ -297,7 +397,13 @@ def load(input: str) -> Rule[_Char]:
                 operator: lexer.ReLiteral(operator)
                 for operator in operators
             }
-        )
-    )(parser.Scope[Rule[_Char]]({}), input)
+        ),
+        packrat=True,
+    )
+
+
+def load(input: str) -> Rule[Char]:
+    from . import parser
 
+    _, result = _loader()(parser.Scope[Rule[Char]]({}), input)
     return result
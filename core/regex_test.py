@@ -1,6 +1,6 @@
 from typing import Sequence, Tuple
 import unittest
-from . import errors, regex
+from . import errors, processor, regex
 
 _Char = regex.Char
 _CharStream = regex.CharStream[_Char]
@@ -18,6 +18,7 @@ _ZeroOrMore = regex.ZeroOrMore[_Char]
 _OneOrMore = regex.OneOrMore[_Char]
 _ZeroOrOne = regex.ZeroOrOne[_Char]
 _UntilEmpty = regex.UntilEmpty[_Char]
+_Literals = regex.Literals[_Char]
 
 
 class CharTest(unittest.TestCase):
@@ -42,6 +43,15 @@ class TokenTest(unittest.TestCase):
             with self.subTest(lhs=lhs, rhs=rhs, result=result):
                 self.assertEqual(lhs + rhs, result)
 
+    def test_concat(self):
+        for tokens, result in list[Tuple[Sequence[regex.Token], regex.Token]]([
+            ([], regex.Token('')),
+            ([regex.Token('a')], regex.Token('a')),
+            ([regex.Token('a'), regex.Token(''), regex.Token('bc')], regex.Token('abc')),
+        ]):
+            with self.subTest(tokens=tokens, result=result):
+                self.assertEqual(regex.Token.concat(tokens), result)
+
 
 class LiteralTest(unittest.TestCase):
     def test_ctor_fail(self):
@@ -452,6 +462,41 @@ class AnyTest(unittest.TestCase):
                     _Any()(_Scope({}), state)
 
 
+class LiteralsTest(unittest.TestCase):
+    def test_ctor_fail(self):
+        with self.assertRaises(errors.Error):
+            _Literals(['a', ''])
+
+    def test_apply(self):
+        rule = _Literals(['+', '++', '+=', 'def', 'define'])
+        for input, expected in list[Tuple[str, str]]([
+            ('+', '+'),
+            ('+++', '++'),
+            ('+=1', '+='),
+            ('+-', '+'),
+            ('defin', 'def'),
+            ('define', 'define'),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                state = _CharStream([_Char(c) for c in input])
+                self.assertEqual(
+                    rule(_Scope({}), state),
+                    (_CharStream([_Char(c) for c in input[len(expected):]]),
+                     regex.Token(expected)),
+                )
+                end, index = rule.match(input, len(input), 0)
+                self.assertEqual(end, len(expected))
+                self.assertEqual(rule.values[index], expected)
+
+    def test_apply_fail(self):
+        rule = _Literals(['ab', 'cd'])
+        for input in ['', 'a', 'ac', 'b']:
+            with self.subTest(input=input):
+                with self.assertRaises(errors.Error):
+                    rule(_Scope({}), _CharStream([_Char(c) for c in input]))
+                self.assertEqual(rule.match(input, len(input), 0), (-1, -1))
+
+
 class LoadTest(unittest.TestCase):
     def test_load(self):
         for input, result in list[Tuple[str, _Rule]]([
@@ -490,3 +535,40 @@ class LoadTest(unittest.TestCase):
             with self.subTest(input=input):
                 with self.assertRaises(errors.Error):
                     regex.load(input)
+
+
+class ApplyTest(unittest.TestCase):
+    def test_apply(self):
+        rules = list[_Rule]([
+            _Literal('a'),
+            _Class('ab'),
+            _Range('a', 'b'),
+            _Any(),
+            _Not(_Literal('a')),
+            _And([_Literal('a'), _Literal('b')]),
+            _Or([_Literal('a'), _Literal('b')]),
+            _ZeroOrMore(_Literal('a')),
+            _OneOrMore(_Literal('a')),
+            _ZeroOrOne(_Literal('a')),
+            _UntilEmpty(_Literal('a')),
+            _Literals(['a', 'ab']),
+        ])
+        states = list[_CharStream]([
+            _CharStream(),
+            _CharStream([_Char('a')]),
+            _CharStream([_Char('b')]),
+            _CharStream([_Char('c')]),
+            _CharStream([_Char('a'), _Char('a')]),
+            _CharStream([_Char('a'), _Char('b'), _Char('c')]),
+        ])
+        for rule in rules:
+            for state in states:
+                with self.subTest(rule=rule, state=state):
+                    try:
+                        expected = rule(_Scope({}), state)
+                    except errors.Error:
+                        expected = None
+                    self.assertEqual(
+                        processor.apply(rule, _Scope({}), state),
+                        expected
+                    )
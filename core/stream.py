@@ -1,11 +1,13 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Generic, Iterable, Iterator, MutableSequence, Sequence, Sized, TypeVar
+from typing import Generic, Iterable, Iterator, MutableSequence, Optional, Sequence, Sized, TypeVar, overload
 
 from . import errors, processor
 
 _Item = TypeVar('_Item', covariant=True)
 
+_REPR_ITEMS = 16
+
 
 class Emptyable(ABC):
     @property
@@ -14,54 +16,126 @@ class Emptyable(ABC):
         ...
 
 
-@dataclass(frozen=True, repr=False)
-class Stream(Generic[_Item], Iterable[_Item], Sized, Emptyable):
+class _Rope(Sequence[_Item]):
+    '''Items of two streams joined without copying, flattened on first read.'''
+
+    def __init__(self, lhs: 'Stream[_Item]', rhs: 'Stream[_Item]'):
+        self._parts: Optional[Sequence[Stream[_Item]]] = (lhs, rhs)
+        self._len = len(lhs) + len(rhs)
+        self._items: Sequence[_Item] = []
+
+    def __len__(self) -> int:
+        return self._len
+
+    @overload
+    def __getitem__(self, index: int) -> _Item:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[_Item]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> _Item | Sequence[_Item]:
+        return self._flatten()[index]
+
+    def _flatten(self) -> Sequence[_Item]:
+        if self._parts is not None:
+            items: MutableSequence[_Item] = []
+            parts: MutableSequence[Stream[_Item]] = list(reversed(self._parts))
+            while parts:
+                part = parts.pop()
+                if isinstance(part._items, _Rope) and part._items._parts is not None and part._offset == 0:
+                    parts.extend(reversed(part._items._parts))
+                else:
+                    items.extend(part)
+            self._items, self._parts = items, None
+        return self._items
+
+
+@dataclass(frozen=True, repr=False, eq=False)
+class Stream(Generic[_Item], Iterable[_Item], Sized, Emptyable, processor.Positioned):
     _items: Sequence[_Item] = field(default_factory=list[_Item])
+    _offset: int = 0
 
     def __repr__(self) -> str:
-        return repr(self._items)
+        if len(self) > _REPR_ITEMS:
+            return f'{repr(list(self.prefix(_REPR_ITEMS)))[:-1]}, ...]'
+        return repr(list(self))
+
+    def prefix(self, length: int) -> Iterator[_Item]:
+        return map(self._items.__getitem__, range(self._offset, min(self._offset+length, len(self._items))))
+
+    def __eq__(self, rhs: object) -> bool:
+        if not isinstance(rhs, Stream) or rhs.__class__ is not self.__class__:
+            return NotImplemented
+        if self._items is rhs._items and self._offset == rhs._offset:
+            return True
+        return len(self) == len(rhs) and all(lhs_item == rhs_item for lhs_item, rhs_item in zip(self, rhs))
 
     def __len__(self) -> int:
-        return len(self._items)
+        return len(self._items) - self._offset
 
     def __iter__(self) -> Iterator[_Item]:
-        return iter(self._items)
+        return map(self._items.__getitem__, range(self._offset, len(self._items)))
 
     def __add__(self, rhs: 'Stream[_Item]') -> 'Stream[_Item]':
-        return self.__class__(list(self._items)+list(rhs._items))
+        if rhs.empty:
+            return self
+        if self.empty:
+            return self.__class__(rhs._items, rhs._offset)
+        return self.__class__(_Rope(self, rhs))
+
+    @property
+    def offset(self) -> int:
+        return self._offset
+
+    @property
+    def buffer(self) -> Sequence[_Item]:
+        return self._items
+
+    def seek(self, offset: int) -> 'Stream[_Item]':
+        if offset < 0 or offset > len(self._items):
+            raise errors.Error(msg=f'invalid offset {offset}')
+        return self.__class__(self._items, offset)
 
     @property
     def empty(self) -> bool:
-        return len(self) == 0
+        return self._offset >= len(self._items)
 
     @property
     def head(self) -> _Item:
         if self.empty:
             raise errors.Error(msg='empty stream')
-        return self._items[0]
+        return self._items[self._offset]
 
     @property
     def tail(self) -> 'Stream[_Item]':
         if self.empty:
             raise errors.Error(msg='empty stream')
-        return self.__class__(self._items[1:])
+        return self.__class__(self._items, self._offset+1)
 
     @classmethod
     def concat(cls, streams: Sequence['Stream[_Item]']) -> 'Stream[_Item]':
-        return sum(streams, cls())
+        items: MutableSequence[_Item] = []
+        for stream in streams:
+            items.extend(stream)
+        return cls(items)
 
 
 _State = TypeVar('_State', bound=Emptyable)
 _Result = TypeVar('_Result')
 
 
-class UntilEmpty(processor.UnaryMultipleResultRule[_State, _Result]):
+class UntilEmpty(processor.Stepped[_State, _Result, Sequence[_Result]], processor.UnaryMultipleResultRule[_State, _Result]):
     def __repr__(self) -> str:
         return f'{self.rule}!'
 
-    def __call__(self, scope: processor.Scope[_State, _Result], state: _State) -> processor.StateAndMultipleResult[_State, _Result]:
+    def steps(self, scope: processor.Scope[_State, _Result], state: _State) -> processor.Steps[_State, _Result, Sequence[_Result]]:
         results: MutableSequence[_Result] = []
         while not state.empty:
-            state, result = self.rule(scope, state)
+            state_and_result = yield self.rule, scope, state
+            if state_and_result is None:
+                return None
+            state, result = state_and_result
             results.append(result)
         return state, results
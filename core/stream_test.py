@@ -37,6 +37,13 @@ class StreamTest(unittest.TestCase):
                     output
                 )
 
+    def test_add_fold(self):
+        output = _Stream()
+        for item in range(10000):
+            output = output + _Stream([item])
+        self.assertEqual(len(output), 10000)
+        self.assertEqual(list(output.tail.tail), list(range(2, 10000)))
+
     def test_len(self):
         for stream, output in list[Tuple[_Stream, int]]([
             (_Stream(), 0),
@@ -78,6 +85,41 @@ class StreamTest(unittest.TestCase):
         with self.assertRaises(errors.Error):
             _ = _Stream([]).tail
 
+    def test_tail_shares_items(self):
+        stream = _Stream([1, 2, 3])
+        tail = stream.tail.tail
+        self.assertIs(tail._items, stream._items)
+        self.assertEqual(tail.offset, 2)
+        self.assertEqual(len(tail), 1)
+        self.assertEqual(tail.head, 3)
+        self.assertTrue(tail.tail.empty)
+
+    def test_eq_offset(self):
+        for lhs, rhs, output in list[Tuple[_Stream, _Stream, bool]]([
+            (_Stream([1, 2]).tail, _Stream([2]), True),
+            (_Stream([1, 2]).tail, _Stream([3, 2]).tail, True),
+            (_Stream([1, 2]).tail, _Stream([1, 2]), False),
+            (_Stream([1]).tail, _Stream(), True),
+        ]):
+            with self.subTest(lhs=lhs, rhs=rhs, output=output):
+                self.assertEqual(lhs == rhs, output)
+
+    def test_seek(self):
+        stream = _Stream([1, 2, 3])
+        for offset, output in list[Tuple[int, _Stream]]([
+            (0, _Stream([1, 2, 3])),
+            (2, _Stream([3])),
+            (3, _Stream()),
+        ]):
+            with self.subTest(offset=offset, output=output):
+                self.assertEqual(stream.tail.seek(offset), output)
+
+    def test_seek_fail(self):
+        for offset in [-1, 4]:
+            with self.subTest(offset=offset):
+                with self.assertRaises(errors.Error):
+                    _Stream([1, 2, 3]).seek(offset)
+
     def test_concat(self):
         for streams, output in list[Tuple[Sequence[_Stream], _Stream]]([
             ([], _Stream()),
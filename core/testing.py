@@ -0,0 +1,9 @@
+from . import lexer
+
+
+def tokens(input: str) -> lexer.TokenStream:
+    return lexer.TokenStream([
+        lexer.Token(value, 'int' if value.isdigit() else value,
+                    lexer.Position(0, i))
+        for i, value in enumerate(input.split())
+    ])
@@ -1,10 +1,22 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Callable, Iterable, Iterator, Mapping, Sequence, Sized
+from functools import cache
+from typing import Any, Callable, Iterable, Iterator, Mapping, Optional, Sequence, Sized
 from . import errors, vals, builtins_
 from core import lexer, parser
 
+LITERAL_VALUES: Mapping[str, Callable[[str], vals.Val]] = {
+    'int': lambda value: builtins_.int_(int(value)),
+    'float': lambda value: builtins_.float_(float(value)),
+    'str': lambda value: builtins_.str_(value[1:-1]),
+}
+
+REF_FIRST = ['id', *LITERAL_VALUES]
+INC_FIRST = ['++', '--'] + REF_FIRST
+OPERAND_FIRST = INC_FIRST + ['(']
+FIRST = OPERAND_FIRST + ['!']
+
 
 class Expr(ABC):
     @abstractmethod
@@ -13,15 +25,13 @@ class Expr(ABC):
 
     @classmethod
     @abstractmethod
-    def load(cls, scope: parser.Scope['Expr'], state: lexer.TokenStream) -> parser.StateAndResult['Expr']:
-        return parser.Or[Expr]([
-            BinaryOperation.load,
-            UnaryOperation.load,
-            Assignment.load,
-            Expr.load_operand,
-        ])(scope, state)
+    @parser.first(*FIRST)
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Expr'], state: lexer.TokenStream) -> parser.Steps['Expr']:
+        return (yield _expr_rule(), scope, state)
 
     @staticmethod
+    @cache
     def default_scope() -> parser.Scope['Expr']:
         return parser.Scope[Expr]({
             'expr': Expr.load,
@@ -29,16 +39,20 @@ class Expr(ABC):
         })
 
     @staticmethod
-    def load_operand(scope: parser.Scope['Expr'], state: lexer.TokenStream) -> parser.StateAndResult['Expr']:
-        return parser.Or[Expr]([
-            Inc.load,
-            Ref.load,
-            ParenExpr.load,
-        ])(scope, state)
+    @parser.first(*OPERAND_FIRST)
+    @parser.stepped
+    def load_operand(scope: parser.Scope['Expr'], state: lexer.TokenStream) -> parser.Steps['Expr']:
+        return (yield _operand_rule(), scope, state)
+
+    @staticmethod
+    def nested_scope(scope: Optional[parser.Scope[Any]] = None) -> parser.Scope['Expr']:
+        if scope is None:
+            return Expr.default_scope()
+        return scope.nested(Expr.default_scope())
 
     @staticmethod
-    def load_state(state: lexer.TokenStream) -> parser.StateAndResult['Expr']:
-        return Expr.load(Expr.default_scope(), state)
+    def load_state(state: lexer.TokenStream, scope: Optional[parser.Scope[Any]] = None) -> parser.StateAndResult['Expr']:
+        return Expr.load(Expr.nested_scope(scope), state)
 
 
 @dataclass(frozen=True, repr=False)
@@ -53,8 +67,9 @@ class Arg:
 
     @staticmethod
     def loader(scope: parser.Scope[Expr]) -> parser.Rule['Arg']:
-        def inner(_: parser.Scope[Arg], state: lexer.TokenStream) -> parser.StateAndResult[Arg]:
-            state, value = parser.Ref[Expr]('expr')(scope, state)
+        @parser.stepped
+        def inner(_: parser.Scope[Arg], state: lexer.TokenStream) -> parser.Steps[Arg]:
+            state, value = yield _scoped(scope, 'expr', Expr.load), scope, state
             return state, Arg(value)
         return inner
 
@@ -76,23 +91,25 @@ class Args(Iterable[Arg], Sized):
         return vals.Args([arg.eval(scope) for arg in self._args])
 
     @staticmethod
-    def load(scope: parser.Scope[Expr], state: lexer.TokenStream) -> tuple[lexer.TokenStream, 'Args']:
+    @parser.stepped
+    def load(scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps['Args']:
         load_arg = Arg.loader(scope)
 
-        def load_tail_arg(arg_scope: parser.Scope[Arg], state: lexer.TokenStream) -> parser.StateAndResult[Arg]:
+        @parser.stepped
+        def load_tail_arg(arg_scope: parser.Scope[Arg], state: lexer.TokenStream) -> parser.Steps[Arg]:
             state = parser.consume_token(state, ',')
-            return load_arg(arg_scope, state)
+            return (yield load_arg, arg_scope, state)
 
-        def load_args(arg_scope: parser.Scope[Arg], state: lexer.TokenStream) -> parser.StateAndMultipleResult[Arg]:
-            state, head = load_arg(arg_scope, state)
-            state, tail = parser.ZeroOrMore[Arg](
-                load_tail_arg)(arg_scope, state)
+        @parser.stepped
+        def load_args(arg_scope: parser.Scope[Arg], state: lexer.TokenStream) -> parser.Steps[Sequence[Arg]]:
+            state, head = yield load_arg, arg_scope, state
+            state, tail = yield parser.ZeroOrMore[Arg](load_tail_arg), arg_scope, state
             return state, [head] + list(tail)
 
         state = parser.consume_token(state, '(')
         args: Sequence[Arg] = []
         try:
-            state, args = load_args(parser.Scope[Arg]({}), state)
+            state, args = yield load_args, parser.Scope[Arg]({}), state
         except errors.Error:
             pass
         state = parser.consume_token(state, ')')
@@ -119,8 +136,9 @@ class Ref(Expr):
             ])
 
         @staticmethod
-        def load(scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndMultipleResult['Ref.Tail']:
-            return parser.ZeroOrMore[Ref.Tail](Ref.Tail.loader(scope))(parser.Scope[Ref.Tail]({}), state)
+        @parser.stepped
+        def load(scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Sequence['Ref.Tail']]:
+            return (yield parser.ZeroOrMore[Ref.Tail](Ref.Tail.loader(scope)), parser.Scope[Ref.Tail]({}), state)
 
     @dataclass(frozen=True)
     class Member(Tail):
@@ -161,8 +179,9 @@ class Ref(Expr):
 
         @classmethod
         def loader(cls, scope: parser.Scope[Expr]) -> parser.Rule['Ref.Tail']:
-            def inner(_: parser.Scope[Ref.Tail], state: lexer.TokenStream) -> parser.StateAndResult[Ref.Tail]:
-                state, args = Args.load(scope, state)
+            @parser.stepped
+            def inner(_: parser.Scope[Ref.Tail], state: lexer.TokenStream) -> parser.Steps[Ref.Tail]:
+                state, args = yield Args.load, scope, state
                 return state, Ref.Call(args)
             return inner
 
@@ -177,11 +196,10 @@ class Ref(Expr):
 
         @classmethod
         @abstractmethod
-        def load(cls, scope: parser.Scope['Ref.Head'], state: lexer.TokenStream) -> parser.StateAndResult['Ref.Head']:
-            return parser.Or[Ref.Head]([
-                Ref.Name.load,
-                Ref.Literal.load,
-            ])(scope, state)
+        @parser.first(*REF_FIRST)
+        @parser.stepped
+        def load(cls, scope: parser.Scope['Ref.Head'], state: lexer.TokenStream) -> parser.Steps['Ref.Head']:
+            return (yield _ref_head_rule(), scope, state)
 
     @dataclass(frozen=True, repr=False)
     class Name(Head):
@@ -199,6 +217,7 @@ class Ref(Expr):
             scope[self.name] = value
 
         @classmethod
+        @parser.first('id')
         def load(cls, scope: parser.Scope['Ref.Head'], state: lexer.TokenStream) -> parser.StateAndResult['Ref.Head']:
             state, value = parser.get_token_value(state, 'id')
             return state, Ref.Name(value)
@@ -218,19 +237,14 @@ class Ref(Expr):
 
         @staticmethod
         def load_value(state: lexer.TokenStream) -> parser.StateAndResult[vals.Val]:
-            from . import builtins_
             token = state.head
-            funcs: Mapping[str, Callable[[str], vals.Val]] = {
-                'int': lambda value: builtins_.int_(int(value)),
-                'float': lambda value: builtins_.float_(float(value)),
-                'str': lambda value: builtins_.str_(value[1:-1]),
-            }
-            if token.rule_name not in funcs:
+            if token.rule_name not in LITERAL_VALUES:
                 raise errors.Error(
                     msg=f'unknown literal type {token.rule_name}')
-            return state.tail, funcs[token.rule_name](token.value)
+            return state.tail, LITERAL_VALUES[token.rule_name](token.value)
 
         @classmethod
+        @parser.first(*LITERAL_VALUES)
         def load(cls,  scope: parser.Scope['Ref.Head'], state: lexer.TokenStream) -> parser.StateAndResult['Ref.Head']:
             state, value = cls.load_value(state)
             return state, Ref.Literal(value)
@@ -257,9 +271,11 @@ class Ref(Expr):
             self.tail[-1].assign(scope, object_, value)
 
     @classmethod
-    def load(cls, scope: parser.Scope['Expr'], state: lexer.TokenStream) -> parser.StateAndResult['Ref']:
-        state, head = Ref.Head.load(parser.Scope[Ref.Head]({}), state)
-        state, tail = Ref.Tail.load(scope, state)
+    @parser.first(*REF_FIRST)
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Expr'], state: lexer.TokenStream) -> parser.Steps['Ref']:
+        state, head = yield Ref.Head.load, scope.nested(parser.Scope[Ref.Head]({})), state
+        state, tail = yield Ref.Tail.load, scope, state
         return state, Ref(head, tail)
 
 
@@ -285,10 +301,12 @@ class Assignment(Expr):
         return value
 
     @classmethod
-    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
-        state, ref = Ref.load(Expr.default_scope(), state)
+    @parser.first(*REF_FIRST)
+    @parser.stepped
+    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
+        state, ref = yield Ref.load, Expr.nested_scope(scope), state
         state = parser.consume_token(state, '=')
-        state, value = Expr.load_state(state)
+        state, value = yield Expr.load, Expr.nested_scope(scope), state
         return state, Assignment(ref, value)
 
 
@@ -310,16 +328,21 @@ class UnaryOperation(Expr):
     def eval(self, scope: vals.Scope) -> vals.Val:
         return self.operand.eval(scope)[self._func_for_operator(self.operator)](scope, vals.Args([]))
 
+    @staticmethod
+    def combine(operator: str, operand: Expr) -> Expr:
+        return UnaryOperation(UnaryOperation.Operator(operator), operand)
+
     @classmethod
-    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
-        operator_value = state.head.value
-        if not any(operator.value == operator_value for operator in UnaryOperation.Operator):
+    @parser.first(*(operator.value for operator in Operator))
+    @parser.stepped
+    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
+        if state.empty or not any(operator.value == state.head_value for operator in UnaryOperation.Operator):
+            raise parser.StateError(msg='expected unary operator', state=state)
+        state, value = yield _operation_rule(), scope, state
+        if not isinstance(value, UnaryOperation):
             raise parser.StateError(
-                msg=f'unknown operator {operator_value}', state=state)
-        state = state.tail
-        operator = UnaryOperation.Operator(operator_value)
-        state, operand = parser.Ref[Expr]('operand')(scope, state)
-        return state, UnaryOperation(operator, operand)
+                msg='expected unary operation', state=state)
+        return state, value
 
 
 @dataclass(frozen=True, repr=False)
@@ -354,17 +377,19 @@ class BinaryOperation(Expr):
         rhs = self.rhs.eval(scope)
         return lhs[self._func_for_operator(self.operator)](scope, vals.Args([vals.Arg(rhs)]))
 
+    @staticmethod
+    def combine(operator: str, lhs: Expr, rhs: Expr) -> Expr:
+        return BinaryOperation(BinaryOperation.Operator(operator), lhs, rhs)
+
     @classmethod
-    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
-        state, lhs = parser.Ref[Expr]('operand')(scope, state)
-        operator_value = state.head.value
-        if not any(operator.value == operator_value for operator in BinaryOperation.Operator):
+    @parser.first(*FIRST)
+    @parser.stepped
+    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
+        state, value = yield _operation_rule(), scope, state
+        if not isinstance(value, BinaryOperation):
             raise parser.StateError(
-                msg=f'unknown operator {operator_value}', state=state)
-        state = state.tail
-        operator = BinaryOperation.Operator(operator_value)
-        state, rhs = parser.Ref[Expr]('operand')(scope, state)
-        return state, BinaryOperation(operator, lhs, rhs)
+                msg='expected binary operation', state=state)
+        return state, value
 
 
 @dataclass(frozen=True, repr=False)
@@ -378,9 +403,11 @@ class ParenExpr(Expr):
         return self.value.eval(scope)
 
     @classmethod
-    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
+    @parser.first('(')
+    @parser.stepped
+    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
         state = parser.consume_token(state, '(')
-        state, value = Expr.load(scope, state)
+        state, value = yield Expr.load, scope, state
         state = parser.consume_token(state, ')')
         return state, ParenExpr(value)
 
@@ -412,9 +439,11 @@ class Inc(Expr):
             return ref.eval(scope)
 
         @classmethod
-        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
+        @parser.first('++')
+        @parser.stepped
+        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
             state = parser.consume_token(state, '++')
-            state, ref = Ref.load(scope, state)
+            state, ref = yield Ref.load, scope, state
             return state, Inc(cls(), ref)
 
     @dataclass(frozen=True)
@@ -429,8 +458,10 @@ class Inc(Expr):
             return val
 
         @classmethod
-        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
-            state, ref = Ref.load(scope, state)
+        @parser.first(*REF_FIRST)
+        @parser.stepped
+        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
+            state, ref = yield Ref.load, scope, state
             state = parser.consume_token(state, '++')
             return state, Inc(cls(), ref)
 
@@ -445,9 +476,11 @@ class Inc(Expr):
             return ref.eval(scope)
 
         @classmethod
-        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
+        @parser.first('--')
+        @parser.stepped
+        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
             state = parser.consume_token(state, '--')
-            state, ref = Ref.load(scope, state)
+            state, ref = yield Ref.load, scope, state
             return state, Inc(cls(), ref)
 
     @dataclass(frozen=True)
@@ -462,8 +495,10 @@ class Inc(Expr):
             return val
 
         @classmethod
-        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
-            state, ref = Ref.load(scope, state)
+        @parser.first(*REF_FIRST)
+        @parser.stepped
+        def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
+            state, ref = yield Ref.load, scope, state
             state = parser.consume_token(state, '--')
             return state, Inc(cls(), ref)
 
@@ -477,10 +512,94 @@ class Inc(Expr):
         return self._impl.eval(scope, self.ref)
 
     @classmethod
-    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.StateAndResult[Expr]:
-        return parser.Or[Expr]([
-            Inc.PreIncrement.load,
-            Inc.PostIncrement.load,
-            Inc.PreDecrement.load,
-            Inc.PostDecrement.load,
-        ])(scope, state)
+    @parser.first(*INC_FIRST)
+    @parser.stepped
+    def load(cls, scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
+        return (yield _inc_rule(), scope, state)
+
+
+def grammar() -> parser.Scope[Expr]:
+    return parser.Scope[Expr]({
+        'expr': _expr_rule(),
+        'operand': _operand_rule(),
+        'inc': _inc_rule(),
+    })
+
+
+def _scoped(scope: parser.Scope[Expr], rule_name: str, default: parser.Rule[Expr]) -> parser.Rule[Expr]:
+    return scope[rule_name] if rule_name in scope else default
+
+
+@parser.first(*OPERAND_FIRST)
+@parser.stepped
+def _load_operand(scope: parser.Scope[Expr], state: lexer.TokenStream) -> parser.Steps[Expr]:
+    return (yield _scoped(scope, 'operand', Expr.load_operand), scope, state)
+
+
+@cache
+def _expr_rule() -> parser.Rule[Expr]:
+    return parser.PredictiveOr[Expr]([
+        Assignment.load,
+        _operation_rule(),
+    ], rule_name='expr')
+
+
+_PRECEDENCES: Mapping[BinaryOperation.Operator, int] = {
+    BinaryOperation.Operator.OR: 1,
+    BinaryOperation.Operator.AND: 2,
+    BinaryOperation.Operator.EQ: 3,
+    BinaryOperation.Operator.LE: 3,
+    BinaryOperation.Operator.LT: 3,
+    BinaryOperation.Operator.GE: 3,
+    BinaryOperation.Operator.GT: 3,
+    BinaryOperation.Operator.ADD: 4,
+    BinaryOperation.Operator.SUB: 4,
+    BinaryOperation.Operator.MUL: 5,
+    BinaryOperation.Operator.DIV: 5,
+}
+_UNARY_PRECEDENCE = 6
+
+
+@cache
+def _operation_rule() -> parser.Pratt[Expr]:
+    return parser.Pratt[Expr](
+        _load_operand,
+        infix={
+            operator.value: parser.Infix[Expr](
+                _PRECEDENCES[operator], BinaryOperation.combine)
+            for operator in BinaryOperation.Operator
+        },
+        prefix={
+            operator.value: parser.Prefix[Expr](
+                _UNARY_PRECEDENCE, UnaryOperation.combine)
+            for operator in UnaryOperation.Operator
+        },
+        rule_name='operation',
+    )
+
+
+@cache
+def _operand_rule() -> parser.Rule[Expr]:
+    return parser.PredictiveOr[Expr]([
+        Inc.load,
+        Ref.load,
+        ParenExpr.load,
+    ], rule_name='operand')
+
+
+@cache
+def _ref_head_rule() -> parser.Rule[Ref.Head]:
+    return parser.PredictiveOr[Ref.Head]([
+        Ref.Name.load,
+        Ref.Literal.load,
+    ], rule_name='ref_head')
+
+
+@cache
+def _inc_rule() -> parser.Rule[Expr]:
+    return parser.PredictiveOr[Expr]([
+        Inc.PreIncrement.load,
+        Inc.PostIncrement.load,
+        Inc.PreDecrement.load,
+        Inc.PostDecrement.load,
+    ], rule_name='inc')
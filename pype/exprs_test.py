@@ -1,7 +1,7 @@
 from typing import Optional, Tuple
 import unittest
 from . import builtins_, errors, vals, exprs
-from core import lexer, parser
+from core import analyzer, lexer, parser
 
 
 def _tok(value: str, rule_name: Optional[str] = None) -> lexer.Token:
@@ -639,6 +639,58 @@ class BinaryOperationTest(unittest.TestCase):
                     )
                 )
             ),
+            (
+                lexer.TokenStream([
+                    _tok('a', 'id'),
+                    _tok('+'),
+                    _tok('b', 'id'),
+                    _tok('*'),
+                    _tok('c', 'id'),
+                    _tok('-'),
+                    _tok('d', 'id'),
+                ]),
+                (
+                    lexer.TokenStream(),
+                    exprs.BinaryOperation(
+                        exprs.BinaryOperation.Operator.SUB,
+                        exprs.BinaryOperation(
+                            exprs.BinaryOperation.Operator.ADD,
+                            exprs.ref('a'),
+                            exprs.BinaryOperation(
+                                exprs.BinaryOperation.Operator.MUL,
+                                exprs.ref('b'),
+                                exprs.ref('c'),
+                            ),
+                        ),
+                        exprs.ref('d'),
+                    )
+                )
+            ),
+            (
+                lexer.TokenStream([
+                    _tok('!'),
+                    _tok('a', 'id'),
+                    _tok('or'),
+                    _tok('b', 'id'),
+                    _tok('and'),
+                    _tok('c', 'id'),
+                ]),
+                (
+                    lexer.TokenStream(),
+                    exprs.BinaryOperation(
+                        exprs.BinaryOperation.Operator.OR,
+                        exprs.UnaryOperation(
+                            exprs.UnaryOperation.Operator.NOT,
+                            exprs.ref('a'),
+                        ),
+                        exprs.BinaryOperation(
+                            exprs.BinaryOperation.Operator.AND,
+                            exprs.ref('b'),
+                            exprs.ref('c'),
+                        ),
+                    )
+                )
+            ),
         ]):
             with self.subTest(state=state, result=result):
                 self.assertEqual(
@@ -650,6 +702,17 @@ class BinaryOperationTest(unittest.TestCase):
                 )
 
 
+    def test_first(self):
+        self.assertEqual(parser.first_set(exprs.BinaryOperation.load),
+                         frozenset(exprs.FIRST))
+        tokens = lexer.TokenStream(
+            [_tok('!'), _tok('x', 'id'), _tok('+'), _tok('1', 'int')])
+        self.assertIsInstance(
+            parser.PredictiveOr[exprs.Expr]([exprs.BinaryOperation.load])(
+                exprs.Expr.default_scope(), tokens)[1],
+            exprs.BinaryOperation)
+
+
 class UnaryOperationTest(unittest.TestCase):
     def test_eval(self):
         for op, result in list[Tuple[exprs.UnaryOperation, vals.Val]]([
@@ -692,6 +755,18 @@ class UnaryOperationTest(unittest.TestCase):
                     result
                 )
 
+    def test_load_fail(self):
+        with self.assertRaises(errors.Error):
+            exprs.UnaryOperation.load(
+                exprs.Expr.default_scope(),
+                lexer.TokenStream([
+                    _tok('!'),
+                    _tok('a', 'id'),
+                    _tok('+'),
+                    _tok('b', 'id'),
+                ])
+            )
+
 
 class ParenExprTest(unittest.TestCase):
     def test_load(self):
@@ -758,6 +833,30 @@ class ExprTest(unittest.TestCase):
                     exprs.ref('a'),
                 )
             ),
+            (
+                lexer.TokenStream([
+                    _tok('1.5', 'float'),
+                ]),
+                (
+                    lexer.TokenStream(),
+                    exprs.literal(builtins_.float_(1.5)),
+                )
+            ),
+            (
+                lexer.TokenStream([
+                    _tok('"a"', 'str'),
+                    _tok('+'),
+                    _tok('1.5', 'float'),
+                ]),
+                (
+                    lexer.TokenStream(),
+                    exprs.BinaryOperation(
+                        exprs.BinaryOperation.Operator.ADD,
+                        exprs.literal(builtins_.str_('a')),
+                        exprs.literal(builtins_.float_(1.5)),
+                    )
+                )
+            ),
             (
                 lexer.TokenStream([
                     _tok('a', 'id'),
@@ -778,6 +877,51 @@ class ExprTest(unittest.TestCase):
                 self.assertEqual(exprs.Expr.load_state(state), result)
 
 
+    def test_load_scope(self):
+        def load_operand(scope: parser.Scope[exprs.Expr], state: lexer.TokenStream) -> parser.StateAndResult[exprs.Expr]:
+            state, value = parser.get_token_value(state, 'id')
+            return state, exprs.ref(value.upper())
+
+        def load_expr(scope: parser.Scope[exprs.Expr], state: lexer.TokenStream) -> parser.StateAndResult[exprs.Expr]:
+            state, value = parser.get_token_value(state, 'int')
+            return state, exprs.literal(builtins_.int_(-int(value)))
+
+        operand_scope = parser.Scope[exprs.Expr]({
+            'expr': exprs.Expr.load,
+            'operand': load_operand,
+        })
+        expr_scope = parser.Scope[exprs.Expr]({
+            'expr': load_expr,
+        })
+        for scope, state, result in list[Tuple[parser.Scope[exprs.Expr], lexer.TokenStream, exprs.Expr]]([
+            (
+                operand_scope,
+                lexer.TokenStream([_tok('a', 'id'), _tok('+'), _tok('b', 'id')]),
+                exprs.BinaryOperation(
+                    exprs.BinaryOperation.Operator.ADD,
+                    exprs.ref('A'),
+                    exprs.ref('B'),
+                ),
+            ),
+            (
+                operand_scope,
+                lexer.TokenStream([_tok('!'), _tok('a', 'id')]),
+                exprs.UnaryOperation(
+                    exprs.UnaryOperation.Operator.NOT, exprs.ref('A')),
+            ),
+            (
+                expr_scope,
+                lexer.TokenStream(
+                    [_tok('f', 'id'), _tok('('), _tok('1', 'int'), _tok(')')]),
+                exprs.Ref(exprs.Ref.Name('f'), [exprs.Ref.Call(exprs.Args(
+                    [exprs.Arg(exprs.literal(builtins_.int_(-1)))]))]),
+            ),
+        ]):
+            with self.subTest(scope=scope, state=state, result=result):
+                self.assertEqual(exprs.Expr.load(scope, state),
+                                 (lexer.TokenStream(), result))
+
+
 class IncTest(unittest.TestCase):
     def test_eval(self):
         for inc, eval_val, scope_val in list[Tuple[exprs.Inc, vals.Val, vals.Val]]([
@@ -891,3 +1035,22 @@ class AssignmentTest(unittest.TestCase):
             with self.subTest(state=state, result=result):
                 self.assertEqual(exprs.Assignment.load(
                     exprs.Expr.default_scope(), state), result)
+
+
+class GrammarTest(unittest.TestCase):
+    def test_analyze(self):
+        analysis = analyzer.analyze(exprs.grammar())
+        self.assertEqual(
+            [
+                hazard
+                for hazard in analysis.hazards
+                if hazard.kind in (
+                    analyzer.Hazard.Kind.LEFT_RECURSION,
+                    analyzer.Hazard.Kind.NULLABLE_LOOP,
+                    analyzer.Hazard.Kind.EXPONENTIAL_BACKTRACKING,
+                )
+            ],
+            []
+        )
+        self.assertEqual(analysis.kinds('inc'), frozenset(
+            {analyzer.Hazard.Kind.FIRST_CONFLICT}))
@@ -45,9 +45,11 @@ class Decl(statements.Decl):
         return Decl.Value(funcs.BindableFunc(Func(self.name, self.params_, self.body)), statements.Result())
 
     @classmethod
-    def load(cls, scope: parser.Scope[statements.Statement], state: lexer.TokenStream) -> parser.StateAndResult[statements.Statement]:
+    @parser.first('def')
+    @parser.stepped
+    def load(cls, scope: parser.Scope[statements.Statement], state: lexer.TokenStream) -> parser.Steps[statements.Statement]:
         state = parser.consume_token(state, 'def')
         state, name = parser.get_token_value(state, 'id')
         state, params_ = params.Params.load(state)
-        state, body = statements.Block.load(state)
+        state, body = yield statements.Block.nested_loader(scope), parser.Scope[statements.Block]({}), state
         return state, Decl(name, params_, body)
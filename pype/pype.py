@@ -1,12 +1,16 @@
-from typing import Optional, Sequence
-from core import lexer, parser, regex
-from . import builtins_, exprs, statements, vals
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import cache
+from typing import Any, Iterator, MutableSequence, Optional, Sequence
+from core import dfa, lexer, parser, processor, regex
+from . import builtins_, errors, exprs, statements, vals
 
 
-def eval(input: str, scope: Optional[vals.Scope] = None) -> vals.Val:
+@cache
+def _lexer() -> lexer.Lexer:
     operators: Sequence[str] = ['++', '--'] + [
         op.value
         for op in exprs.BinaryOperation.Operator
+        if not op.value.isalpha()
     ] + [
         op.value
         for op in exprs.UnaryOperation.Operator
@@ -19,6 +23,8 @@ def eval(input: str, scope: Optional[vals.Scope] = None) -> vals.Val:
         '.',
         ';',
         '=',
+    ]
+    keywords: Sequence[str] = [
         'def',
         'class',
         'return',
@@ -27,18 +33,125 @@ def eval(input: str, scope: Optional[vals.Scope] = None) -> vals.Val:
         'else',
         'while',
         'for',
+    ] + [
+        op.value
+        for op in exprs.BinaryOperation.Operator
+        if op.value.isalpha()
     ]
-    _, tokens = lexer.Lexer(
-        **({
-            operator: regex.literal(operator)
-            for operator in operators
-        } | dict(_ws=lexer.ReClass.whitespace(),
-                 int=regex.load('[0-9]+'),
-                 id=regex.load('(_|[a-z]|[A-Z])(_|[a-z]|[A-Z]|[0-9])*')))
-    )(lexer.Scope({}), input)
-    _, statements_ = parser.UntilEmpty[statements.Statement](
-        statements.Statement.load,
-    )(statements.Statement.default_scope(), tokens)
+    return dfa.DfaLexer(lexer.Lexer(
+        operators,
+        _ws=lexer.ReClass.whitespace(),
+        int=regex.load('[0-9]+'),
+        id=lexer.Keywords(
+            regex.load('(_|[a-z]|[A-Z])(_|[a-z]|[A-Z]|[0-9])*'), keywords),
+    ))
+
+
+@cache
+def _parser() -> processor.Processor[lexer.TokenStream, statements.Statement]:
+    return processor.Processor[lexer.TokenStream, statements.Statement](
+        {'statement': statements.Statement.load},
+        'statement',
+        iterative=True,
+    )
+
+
+class _Statements(parser.ResultReducer[Any]):
+    def reduce(self, results: Sequence[Any]) -> Sequence[statements.Statement]:
+        return list(results)
+
+
+@cache
+def _incremental_parser() -> parser.Parser[Any]:
+    return parser.Parser[Any](
+        {
+            'statements': _Statements(parser.UntilEmpty[Any](parser.Ref[Any]('statement'))),
+            'statement': statements.Statement.load,
+        },
+        'statements',
+        _lexer(),
+        iterative=True,
+    )
+
+
+def parse(input: str) -> parser.Parse[Sequence[statements.Statement]]:
+    return _incremental_parser().parse(input)
+
+
+def reparse(previous: parser.Parse[Sequence[statements.Statement]], edit: parser.Edit) -> parser.Parse[Sequence[statements.Statement]]:
+    return _incremental_parser().reparse(previous, edit)
+
+
+def _load_tokens(tokens: lexer.TokenStream, end: Optional[int] = None) -> Sequence[statements.Statement]:
+    statements_: MutableSequence[statements.Statement] = []
+    while not tokens.empty and (end is None or tokens.offset < end):
+        tokens, statement = _parser()(
+            statements.Statement.default_scope(), tokens)
+        statements_.append(statement)
+    return statements_
+
+
+def _try_load_tokens(tokens: Sequence[lexer.Token]) -> Optional[Sequence[statements.Statement]]:
+    try:
+        return _load_tokens(lexer.TokenStream(tokens))
+    except errors.Error:
+        return None
+
+
+def _boundaries(tokens: lexer.ColumnarTokens) -> Iterator[int]:
+    opens = {lexer.kind('{'), lexer.kind('(')}
+    closes = {lexer.kind('}'), lexer.kind(')')}
+    semicolon, brace, else_ = lexer.kind(';'), lexer.kind('}'), lexer.kind('else')
+    kinds = tokens.kinds
+    depth = 0
+    for index, kind in enumerate(kinds):
+        if kind in opens:
+            depth += 1
+        elif kind in closes:
+            depth -= 1
+        if depth == 0 and (kind == semicolon or (kind == brace and (index+1 == len(kinds) or kinds[index+1] != else_))):
+            yield index+1
+
+
+def _chunks(tokens: lexer.ColumnarTokens, count: int) -> Sequence[tuple[int, int]]:
+    size = max(len(tokens)//count, 1)
+    chunks: MutableSequence[tuple[int, int]] = []
+    start = 0
+    for boundary in _boundaries(tokens):
+        if boundary-start >= size:
+            chunks.append((start, boundary))
+            start = boundary
+    if start < len(tokens):
+        chunks.append((start, len(tokens)))
+    return chunks
+
+
+def _load_chunks(tokens: lexer.TokenStream, chunks: Sequence[tuple[int, int]], executor: Executor) -> Sequence[statements.Statement]:
+    statements_: MutableSequence[statements.Statement] = []
+    for (start, end), chunk in zip(chunks, executor.map(
+            _try_load_tokens, [tokens.buffer[start:end] for start, end in chunks])):
+        if chunk is None:
+            chunk = _load_tokens(tokens.seek(start), end)
+        statements_.extend(chunk)
+    return statements_
+
+
+def load(input: str, *, workers: Optional[int] = None, executor: Optional[Executor] = None) -> Sequence[statements.Statement]:
+    _, tokens = _lexer()(lexer.Scope({}), input)
+    if workers is None or workers < 2:
+        return _load_tokens(tokens)
+    assert isinstance(tokens.buffer, lexer.ColumnarTokens)
+    chunks = _chunks(tokens.buffer, workers)
+    if len(chunks) < 2:
+        return _load_tokens(tokens)
+    if executor is None:
+        with ProcessPoolExecutor(workers) as executor:
+            return _load_chunks(tokens, chunks, executor)
+    return _load_chunks(tokens, chunks, executor)
+
+
+def eval(input: str, scope: Optional[vals.Scope] = None, *, workers: Optional[int] = None, executor: Optional[Executor] = None) -> vals.Val:
+    statements_ = load(input, workers=workers, executor=executor)
     scope = scope or vals.Scope({
         'true': builtins_.true,
         'false': builtins_.false,
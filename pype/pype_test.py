@@ -1,6 +1,8 @@
-from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Mapping, MutableMapping, Optional, Sequence, Tuple
 import unittest
-from . import pype, vals, builtins_
+from core import compiler, lexer, parser, processor
+from . import exprs, func, params, pype, statements, vals, builtins_
 
 
 class PypeTest(unittest.TestCase):
@@ -10,6 +12,10 @@ class PypeTest(unittest.TestCase):
             ('3 - 2;', builtins_.int_(1)),
             ('a = 1; a;', builtins_.int_(1)),
             ('a = 3 - 2; a;', builtins_.int_(1)),
+            ('1 + 2 * 3 - 4;', builtins_.int_(3)),
+            ('a = 2; a * a - a / 2 == 3;', builtins_.true),
+            ('define = 1; classy = 2; define + classy;', builtins_.int_(3)),
+            ('order = 1; android = 2; order + android;', builtins_.int_(3)),
             (
                 r'''
                 namespace n {
@@ -227,3 +233,262 @@ class PypeTest(unittest.TestCase):
         ]):
             with self.subTest(input=input, result=result):
                 self.assertEqual(pype.eval(input), result)
+                self.assertEqual(pype.eval(input, workers=2), result)
+
+    def test_load_workers(self):
+        input = r'''
+            namespace n {
+                a = 1;
+            }
+            def f(a) {
+                if (a) {
+                    return 1;
+                } else {
+                    return 2;
+                }
+            }
+            for (i = 0; i < 3; i++) {
+                n.a = n.a + f(i);
+            }
+            class c { a = 1; }
+            n.a;
+            ''' * 8
+        for workers in [None, 1, 2, 4]:
+            with self.subTest(workers=workers):
+                self.assertEqual(pype.load(input, workers=workers),
+                                 pype.load(input))
+        with ProcessPoolExecutor(2) as executor:
+            for workers in [2, 4]:
+                with self.subTest(workers=workers, executor=executor):
+                    self.assertEqual(pype.load(input, workers=workers, executor=executor),
+                                     pype.load(input))
+
+    def test_boundaries(self):
+        source = lexer.Source('a = "{";\nif (a) { b; } else { c; }\nd;')
+        tokens = lexer.ColumnarTokens.pack(source, [
+            lexer.Token(value, rule_name, source.position(offset))
+            for offset, value, rule_name in [
+                (0, 'a', 'id'),
+                (2, '=', '='),
+                (4, '"{"', 'str'),
+                (7, ';', ';'),
+                (9, 'if', 'if'),
+                (12, '(', '('),
+                (13, 'a', 'id'),
+                (14, ')', ')'),
+                (16, '{', '{'),
+                (18, 'b', 'id'),
+                (19, ';', ';'),
+                (21, '}', '}'),
+                (23, 'else', 'else'),
+                (28, '{', '{'),
+                (30, 'c', 'id'),
+                (31, ';', ';'),
+                (33, '}', '}'),
+                (35, 'd', 'id'),
+                (36, ';', ';'),
+            ]
+        ])
+        self.assertEqual(list(pype._boundaries(tokens)), [4, 17, 19])
+
+    def test_load_workers_fail(self):
+        input = 'a = 1;\n' * 16 + 'b = = 2;\n' + 'c = 3;\n' * 16
+        with self.assertRaises(processor.StateError) as expected:
+            pype.load(input)
+        for workers in [2, 4]:
+            with self.subTest(workers=workers):
+                with self.assertRaises(processor.StateError) as actual:
+                    pype.load(input, workers=workers)
+                self.assertEqual(actual.exception.state.head.position,
+                                 expected.exception.state.head.position)
+                self.assertEqual(
+                    actual.exception.state.head.position, lexer.Position(16, 4))
+
+    def test_load_fail(self):
+        for input, position, expected in list[Tuple[str, Optional[lexer.Position], Sequence[str]]]([
+            ('a = ;', lexer.Position(0, 4), ['expr']),
+            ('f(1,);', lexer.Position(0, 4), ['expr']),
+            ('if (x) { y; ', None, ['statement']),
+        ]):
+            with self.subTest(input=input):
+                with self.assertRaises(processor.FarthestFailureError) as context:
+                    pype.load(input)
+                state = context.exception.state
+                self.assertEqual(
+                    None if state.empty else state.head.position, position)
+                self.assertEqual(context.exception.expected, expected)
+
+    def test_reparse(self):
+        input = ''.join(
+            f'def f{i}(a) {{ return a + {i}; }}\n' for i in range(20))
+        previous = pype.parse(input)
+        self.assertEqual(previous.result, pype.load(input))
+        for edit in [
+            parser.Edit(input.index('+ 7;')+2, 1, '70'),
+            parser.Edit(input.index('def f3'), 0, 'a = 1;\n'),
+            parser.Edit(input.index('def f19'), len('def f19'), 'def g'),
+        ]:
+            with self.subTest(edit=edit):
+                actual = pype.reparse(previous, edit)
+                self.assertEqual(actual.result, pype.load(actual.text))
+
+    def test_profile(self):
+        _, tokens = pype._lexer()(lexer.Scope({}), r'''
+            a = 1;
+            def f(a) { return a; }
+            f(a);
+            ''')
+        processor_ = processor.Processor[lexer.TokenStream, statements.Statement](
+            {'statement': statements.Statement.load},
+            'statement',
+            profile=True,
+        )
+        while not tokens.empty:
+            tokens, _ = processor_(statements.Statement.default_scope(), tokens)
+        assert processor_.profiler is not None
+        profile = processor_.profiler.rules['statement']
+        self.assertEqual((profile.calls, profile.successes,
+                         profile.failures), (5, 4, 1))
+        self.assertGreater(profile.cumulative_time, 0)
+
+    def test_profile_rules(self):
+        _, tokens = pype._lexer()(lexer.Scope({}), r'''
+            a = 1;
+            def f(b) { return b + 1; }
+            !a;
+            f(a) * 2;
+            ''')
+        processor_ = processor.Processor[lexer.TokenStream, statements.Statement](
+            {'statement': statements.Statement.load},
+            'statement',
+            profile=True,
+        )
+        while not tokens.empty:
+            tokens, _ = processor_(statements.Statement.default_scope(), tokens)
+        assert processor_.profiler is not None
+        self.assertEqual(
+            {
+                rule_name: (profile.calls, profile.successes, profile.failures)
+                for rule_name, profile in processor_.profiler.rules.items()
+                if rule_name in ('statement', 'expr', 'operation', 'operand')
+            },
+            {
+                'statement': (6, 5, 1),
+                'expr': (9, 9, 0),
+                'operation': (8, 8, 0),
+                'operand': (10, 10, 0),
+            },
+        )
+
+
+class LexerTest(unittest.TestCase):
+    def test_apply(self):
+        dfa_lexer = pype._lexer()
+        lexer_ = lexer.Lexer(dfa_lexer.literals, **dfa_lexer.rules)
+        compiled = compiler.compile_processor(lexer_)
+        for input, expected in list[Tuple[str, Sequence[Tuple[str, str]]]]([
+            ('a and b', [('id', 'a'), ('and', 'and'), ('id', 'b')]),
+            ('a or b', [('id', 'a'), ('or', 'or'), ('id', 'b')]),
+            ('order', [('id', 'order')]),
+            ('android', [('id', 'android')]),
+            ('oracle and_ or1', [('id', 'oracle'), ('id', 'and_'), ('id', 'or1')]),
+            ('define <= classy', [('id', 'define'), ('<=', '<='), ('id', 'classy')]),
+        ]):
+            with self.subTest(input=input, expected=expected):
+                _, tokens = dfa_lexer(lexer.Scope({}), input)
+                self.assertEqual([(token.rule_name, token.value)
+                                 for token in tokens], expected)
+                self.assertEqual(lexer_(lexer.Scope({}), input)[1], tokens)
+                self.assertEqual(compiled(lexer.Scope({}), input)[1], tokens)
+
+
+class FirstTest(unittest.TestCase):
+    _KIND_SAMPLES: Mapping[str, str] = {
+        'id': 'x',
+        'int': '1',
+    }
+
+    _RULE_SAMPLES: Mapping[str, Sequence[str]] = {
+        'Expr.load': ['x', '1', '++x', '--x', '(1)', '!x'],
+        'Expr.load_operand': ['x', '1', '++x', '--x', '(1)'],
+        'Ref.Head.load': ['x', '1'],
+        'Ref.Name.load': ['x'],
+        'Ref.Literal.load': ['1'],
+        'Ref.load': ['x', '1'],
+        'Assignment.load': ['x = 1', '1 = 1'],
+        'UnaryOperation.load': ['!x'],
+        'BinaryOperation.load': ['x + 1', '1 + 1', '++x + 1', '--x + 1', '(1) + 1', '!x + 1'],
+        'ParenExpr.load': ['(1)'],
+        'Inc.load': ['++x', '--x', 'x++', '1--'],
+        'Inc.PreIncrement.load': ['++x'],
+        'Inc.PostIncrement.load': ['x++', '1++'],
+        'Inc.PreDecrement.load': ['--x'],
+        'Inc.PostDecrement.load': ['x--', '1--'],
+        'ExprStatement.load': ['x;', '1;', '++x;', '--x;', '(1);', '!x;'],
+        'Return.load': ['return 1;'],
+        'Class.load': ['class c {}'],
+        'Namespace.load': ['namespace n {}'],
+        'If.load': ['if (x) {}'],
+        'While.load': ['while (x) {}'],
+        'For.load': ['for (i = 0; i < 1; ++i) {}'],
+        'Decl.load': ['def f() {}'],
+    }
+
+    @staticmethod
+    def _kind_samples() -> Mapping[str, str]:
+        lexer_ = pype._lexer()
+        samples = dict(FirstTest._KIND_SAMPLES)
+        samples.update({literal: literal for literal in lexer_.literals})
+        for name, rule in lexer_.rules.items():
+            if isinstance(rule, lexer.Keywords):
+                samples.update({keyword: keyword for keyword in rule.keywords})
+            if not name.startswith('_'):
+                assert name in samples, name
+        return samples
+
+    @staticmethod
+    def _rules() -> Mapping[str, Tuple[Callable[..., Any], parser.Scope[Any]]]:
+        rules: MutableMapping[str, Tuple[Callable[..., Any],
+                                         parser.Scope[Any]]] = {}
+
+        def visit(cls: type, scope: parser.Scope[Any]) -> None:
+            for name, value in vars(cls).items():
+                if isinstance(value, type):
+                    visit(value, scope)
+                elif isinstance(value, (staticmethod, classmethod)) and parser.first_set(value.__func__) is not None:
+                    rules[value.__func__.__qualname__] = getattr(
+                        cls, name), scope
+        for module, scope in list[Tuple[Any, parser.Scope[Any]]]([
+            (exprs, exprs.Expr.default_scope()),
+            (statements, statements.Statement.default_scope()),
+            (func, statements.Statement.default_scope()),
+            (params, parser.Scope[Any]({})),
+        ]):
+            for value in vars(module).values():
+                if isinstance(value, type) and value.__module__ == module.__name__:
+                    visit(value, scope)
+        return rules
+
+    def test_first(self):
+        kind_samples = self._kind_samples()
+        rules = self._rules()
+        self.assertEqual(set(rules), set(self._RULE_SAMPLES))
+        for rule_name, (rule, scope) in rules.items():
+            first = parser.first_set(rule)
+            assert first is not None
+            with self.subTest(rule_name=rule_name, first=first):
+                self.assertLessEqual(first, set(kind_samples) |
+                                     set(exprs.LITERAL_VALUES))
+                accepted: set[str] = set()
+                for sample in self._RULE_SAMPLES[rule_name]:
+                    _, tokens = pype._lexer()(lexer.Scope({}), sample)
+                    self.assertIsNotNone(
+                        processor.apply(rule, scope, tokens), sample)
+                    accepted.add(tokens.head.rule_name)
+                self.assertEqual(accepted, first & set(kind_samples))
+                for kind, sample in kind_samples.items():
+                    if kind not in first:
+                        _, tokens = pype._lexer()(
+                            lexer.Scope({}), f'{sample} x 1;')
+                        self.assertIsNone(
+                            processor.apply(rule, scope, tokens), kind)
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Iterable, Iterator, Optional, Sequence, Sized, final
+from functools import cache
+from typing import Any, Iterable, Iterator, Optional, Sequence, Sized, final
 from . import errors, builtins_, exprs, vals
 from core import lexer, parser
 
@@ -21,20 +22,12 @@ class Statement(ABC):
 
     @classmethod
     @abstractmethod
-    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.StateAndResult['Statement']:
-        from . import func
-        return parser.Or[Statement]([
-            Return.load,
-            Class.load,
-            Namespace.load,
-            ExprStatement.load,
-            func.Decl.load,
-            If.load,
-            While.load,
-            For.load,
-        ])(scope, state)
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.Steps['Statement']:
+        return (yield _statement_rule(), scope, state)
 
     @staticmethod
+    @cache
     def default_scope() -> parser.Scope['Statement']:
         return parser.Scope[Statement]({
             'statement': Statement.load,
@@ -67,17 +60,23 @@ class Block(Iterable[Statement], Sized):
 
     @staticmethod
     def loader(scope: parser.Scope[Statement]) -> parser.Rule['Block']:
-        def inner(_: parser.Scope[Block], state: lexer.TokenStream) -> parser.StateAndResult[Block]:
+        @parser.stepped
+        def inner(_: parser.Scope[Block], state: lexer.TokenStream) -> parser.Steps[Block]:
             state = parser.consume_token(state, '{')
-            state, values = parser.ZeroOrMore[Statement](
-                Statement.load)(scope, state)
+            state, values = yield parser.ZeroOrMore[Statement](_STATEMENT_REF), scope, state
             state = parser.consume_token(state, '}')
             return state, Block(values)
         return inner
 
     @staticmethod
-    def load(state: lexer.TokenStream) -> parser.StateAndResult['Block']:
-        return Block.loader(Statement.default_scope())(parser.Scope[Block]({}), state)
+    def nested_loader(scope: Optional[parser.Scope[Any]] = None) -> parser.Rule['Block']:
+        if scope is None:
+            return Block.loader(Statement.default_scope())
+        return Block.loader(scope.nested(Statement.default_scope()))
+
+    @staticmethod
+    def load(state: lexer.TokenStream, scope: Optional[parser.Scope[Any]] = None) -> parser.StateAndResult['Block']:
+        return Block.nested_loader(scope)(parser.Scope[Block]({}), state)
 
 
 @dataclass(frozen=True)
@@ -89,8 +88,10 @@ class ExprStatement(Statement):
         return Result()
 
     @classmethod
-    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.StateAndResult['Statement']:
-        state, value = exprs.Expr.load_state(state)
+    @parser.first(*exprs.FIRST)
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.Steps['Statement']:
+        state, value = yield exprs.Expr.load, exprs.Expr.nested_scope(scope), state
         state = parser.consume_token(state, ';')
         return state, ExprStatement(value)
 
@@ -109,10 +110,11 @@ class Return(Statement):
         return Result(return_=Result.Return())
 
     @classmethod
-    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.StateAndResult['Statement']:
+    @parser.first('return')
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.Steps['Statement']:
         state = parser.consume_token(state, 'return')
-        state, value = parser.ZeroOrOne[exprs.Expr](
-            exprs.Expr.load)(exprs.Expr.default_scope(), state)
+        state, value = yield parser.ZeroOrOne[exprs.Expr](exprs.Expr.load), exprs.Expr.nested_scope(scope), state
         state = parser.consume_token(state, ';')
         return state, Return(value=value)
 
@@ -156,10 +158,12 @@ class Class(Decl):
         return Decl.Value(vals.Class(self.name, members), result)
 
     @classmethod
-    def load(cls, scope: parser.Scope[Statement], state: lexer.TokenStream) -> parser.StateAndResult[Statement]:
+    @parser.first('class')
+    @parser.stepped
+    def load(cls, scope: parser.Scope[Statement], state: lexer.TokenStream) -> parser.Steps[Statement]:
         state = parser.consume_token(state, 'class')
         state, name = parser.get_token_value(state, 'id')
-        state, body = Block.load(state)
+        state, body = yield Block.nested_loader(scope), parser.Scope[Block]({}), state
         return state, Class(name, body)
 
 
@@ -178,14 +182,16 @@ class Namespace(Decl):
         return Decl.Value(vals.Namespace(members, name=self.name), result)
 
     @classmethod
-    def load(cls, scope: parser.Scope[Statement], state: lexer.TokenStream) -> parser.StateAndResult[Statement]:
+    @parser.first('namespace')
+    @parser.stepped
+    def load(cls, scope: parser.Scope[Statement], state: lexer.TokenStream) -> parser.Steps[Statement]:
         state = parser.consume_token(state, 'namespace')
         name: Optional[str] = None
         try:
             state, name = parser.get_token_value(state, 'id')
         except errors.Error:
             pass
-        state, body = Block.load(state)
+        state, body = yield Block.nested_loader(scope), parser.Scope[Block]({}), state
         return state, Namespace(body, _name=name)
 
 
@@ -204,20 +210,21 @@ class If(Statement):
             return Result()
 
     @classmethod
-    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.StateAndResult['Statement']:
+    @parser.first('if')
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.Steps['Statement']:
         state = parser.consume_token(state, 'if')
         state = parser.consume_token(state, '(')
-        state, cond = exprs.Expr.load_state(state)
+        state, cond = yield exprs.Expr.load, exprs.Expr.nested_scope(scope), state
         state = parser.consume_token(state, ')')
-        state, consequent = Block.load(state)
+        state, consequent = yield Block.nested_loader(scope), parser.Scope[Block]({}), state
 
-        def load_alternative(_: parser.Scope[Block], state: lexer.TokenStream) -> parser.StateAndResult[Block]:
+        @parser.stepped
+        def load_alternative(_: parser.Scope[Block], state: lexer.TokenStream) -> parser.Steps[Block]:
             state = parser.consume_token(state, 'else')
-            state, alternative = Block.load(state)
-            return state, alternative
+            return (yield Block.nested_loader(scope), parser.Scope[Block]({}), state)
 
-        state, alternative = parser.ZeroOrOne[Block](load_alternative)(
-            parser.Scope[Block]({}), state)
+        state, alternative = yield parser.ZeroOrOne[Block](load_alternative), parser.Scope[Block]({}), state
         return state, If(cond, consequent, alternative)
 
 
@@ -237,12 +244,14 @@ class While(Statement):
         return Result()
 
     @classmethod
-    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.StateAndResult['Statement']:
+    @parser.first('while')
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.Steps['Statement']:
         state = parser.consume_token(state, 'while')
         state = parser.consume_token(state, '(')
-        state, cond = exprs.Expr.load_state(state)
+        state, cond = yield exprs.Expr.load, exprs.Expr.nested_scope(scope), state
         state = parser.consume_token(state, ')')
-        state, body = Block.load(state)
+        state, body = yield Block.nested_loader(scope), parser.Scope[Block]({}), state
         return state, While(cond, body)
 
 
@@ -266,14 +275,34 @@ class For(Statement):
         return Result()
 
     @classmethod
-    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.StateAndResult['Statement']:
+    @parser.first('for')
+    @parser.stepped
+    def load(cls, scope: parser.Scope['Statement'], state: lexer.TokenStream) -> parser.Steps['Statement']:
         state = parser.consume_token(state, 'for')
         state = parser.consume_token(state, '(')
-        state, init = exprs.Expr.load_state(state)
+        state, init = yield exprs.Expr.load, exprs.Expr.nested_scope(scope), state
         state = parser.consume_token(state, ';')
-        state, cond = exprs.Expr.load_state(state)
+        state, cond = yield exprs.Expr.load, exprs.Expr.nested_scope(scope), state
         state = parser.consume_token(state, ';')
-        state, step = exprs.Expr.load_state(state)
+        state, step = yield exprs.Expr.load, exprs.Expr.nested_scope(scope), state
         state = parser.consume_token(state, ')')
-        state, body = Block.load(state)
+        state, body = yield Block.nested_loader(scope), parser.Scope[Block]({}), state
         return state, For(init, cond, step, body)
+
+
+_STATEMENT_REF = parser.Ref[Statement]('statement')
+
+
+@cache
+def _statement_rule() -> parser.Rule[Statement]:
+    from . import func
+    return parser.PredictiveOr[Statement]([
+        Return.load,
+        Class.load,
+        Namespace.load,
+        ExprStatement.load,
+        func.Decl.load,
+        If.load,
+        While.load,
+        For.load,
+    ])